@@ -1,23 +1,78 @@
-import os
-import tempfile
+from dotenv import load_dotenv
+load_dotenv()
+
+import logging
+import bitacora
+bitacora.configurar_logging()
+
 import funciones
 import herramientas
-from io import BytesIO
-from pathlib import Path
-from fastapi.responses import StreamingResponse, JSONResponse
-from fastapi import FastAPI, File, UploadFile, HTTPException, status
+import cliente_http
+import cache_resultados
+import trabajos
+import limitador
+import resiliencia
+import circuito
+import metricas
+import limite_carga
+import ejecutores
+import huellas
+import procesadores
+import decodificador
+import preprocesamiento
+from contextlib import asynccontextmanager
+from credenciales import proveedor_token
+from fastapi.routing import APIRoute
+from fastapi.responses import StreamingResponse, JSONResponse, Response
+from typing import List, Optional
+from fastapi import Depends, FastAPI, File, Form, Header, Query, Request, UploadFile, HTTPException, status
 
-from dotenv import load_dotenv
-load_dotenv()
+logger = logging.getLogger(__name__)
 
-TEMP_DIR_ROOT = Path("/home/mbriseno/code/document_ai/temp_files")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Crea los recursos compartidos del worker al arrancar y los libera al apagar.
+    """
+    ejecutores.iniciar()
+    cliente_http.iniciar_cliente()
+    proveedor_token.iniciar()
+    await trabajos.iniciar_cola()
+    procesadores.iniciar()
+    yield
+    await procesadores.detener()
+    await trabajos.detener_cola()
+    await proveedor_token.detener()
+    await cliente_http.cerrar_cliente()
+    ejecutores.cerrar()
+    bitacora.detener_logging()
 
 app = FastAPI(
     title="RAD",
     description="Reconocimiento avanzado de documentos via computer vision.",
-    version="0.0.0"
+    version="0.0.0",
+    lifespan=lifespan
 )
 
+# Tamaño máximo del cuerpo por ruta, aplicado mientras se recibe
+app.add_middleware(limite_carga.MiddlewareLimiteCarga)
+# Id de correlación por petición (X-Request-ID) y una línea de log por
+# petición; se agrega al final para que envuelva a los demás
+app.add_middleware(bitacora.MiddlewareCorrelacion)
+
+# Tamaño de bloque al devolver archivos subidos en streaming
+TAMANO_BLOQUE_ECO = 64 * 1024
+
+# Timeout opcional del cliente en segundos; se propaga hasta Document AI
+TimeoutCliente = Header(None, alias="X-Request-Timeout", description="Segundos que el cliente está dispuesto a esperar.")
+
+def opciones_entidades(
+    umbral_confianza: Optional[float] = Query(None, ge=0, le=1, description="Descarta entidades con confianza menor."),
+    detallado: bool = Query(False, description="Incluye confianza y valor normalizado de cada entidad.")
+):
+    """Opciones de formato de las entidades, comunes a todos los endpoints de documentos."""
+    return {"umbral_confianza": umbral_confianza, "detallado": detallado}
+
 # Nuevo endpoint para Health Check
 @app.get("/health",
          tags=["Health Check"],
@@ -27,8 +82,67 @@ app = FastAPI(
 async def health_check():
     """
     Este endpoint devuelve una respuesta 200 OK para indicar que la API está funcionando.
+    Incluye el estado del circuito de cada procesador; si alguno está abierto el
+    estado general es "degradado".
+    """
+    circuitos = circuito.estado_circuitos()
+    degradado = any(c["estado"] != circuito.CERRADO for c in circuitos.values())
+    return JSONResponse(
+        content={"status": "degradado" if degradado else "ok", "circuitos": circuitos},
+        status_code=200
+    )
+
+@app.exception_handler(circuito.CircuitoAbierto)
+async def circuito_abierto_handler(request: Request, exc: circuito.CircuitoAbierto):
+    """
+    Un procesador con el circuito abierto responde 503 de inmediato, con
+    Retry-After para que el cliente sepa cuándo volver a intentar.
+    """
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"error": str(exc), "procesador": exc.nombre, "circuito": circuito.ABIERTO},
+        headers={"Retry-After": str(max(int(exc.reintentar_en), 1))}
+    )
+
+@app.get("/estadisticas",
+         tags=["Health Check"],
+         description="Estado interno del worker: pool de conexiones HTTP, cache de resultados, cola de trabajos, límites hacia Document AI, ocupación de los pools de hilos y procesos y el decodificador JSON en uso.",
+         summary="Estadísticas"
+         )
+async def estadisticas():
+    """
+    Devuelve métricas de saturación de los recursos compartidos del worker.
+    """
+    return {
+        "pool_http": cliente_http.estadisticas_pool(),
+        "cache": cache_resultados.cache.estadisticas() if cache_resultados.cache else None,
+        "trabajos": await trabajos.cola.estadisticas() if trabajos.cola else None,
+        "limitadores": limitador.estado_limitadores(),
+        "latencias": resiliencia.historial.estado(),
+        "ejecutores": ejecutores.estadisticas(),
+        "huellas": huellas.estadisticas(),
+        # msgspec y orjson son opcionales; sin ellos se decodifica con json
+        "decodificador": decodificador.motor(),
+    }
+
+@app.get("/metrics",
+         tags=["Health Check"],
+         description="Métricas en formato Prometheus: latencia por etapa y tipo de documento, tamaños, códigos de Document AI, cache y operaciones en curso.",
+         summary="Métricas",
+         include_in_schema=False
+         )
+async def metrics():
+    """
+    Exposición para Prometheus. Requiere el paquete prometheus_client.
     """
-    return JSONResponse(content={"status": "ok"}, status_code=200)
+    exposicion = metricas.exportar()
+    if exposicion is None:
+        return JSONResponse(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            content={"error": "Métricas no disponibles: falta el paquete prometheus_client."}
+        )
+    contenido, tipo = exposicion
+    return Response(content=contenido, media_type=tipo)
 
 @app.post("/echo-image/",
           tags=["Health Check"],
@@ -38,118 +152,232 @@ async def health_check():
 async def echo_image(image: UploadFile = File(...)):
     if not image.content_type.startswith("image/"):
         return {"error": "El archivo no es una imagen"}
-    contents = await image.read()
-    return StreamingResponse(BytesIO(contents), media_type=image.content_type)
 
-@app.post(
-        "/procesa_pasaporte/", 
-        tags=["Documentos"],       
-        summary="Pasaportes")
-async def procesa_documento(image: UploadFile = File(...)):
-    if not image.content_type.startswith("image/"):
-        return {"error": "El archivo no es una imagen"}
-    return await funciones.procesa_pasaporte(image)
+    # Se devuelve por bloques directo del archivo temporal del upload, sin
+    # copiarlo completo a memoria. FastAPI cierra el archivo hasta que
+    # termina la respuesta.
+    async def bloques():
+        await image.seek(0)
+        while True:
+            bloque = await image.read(TAMANO_BLOQUE_ECO)
+            if not bloque:
+                break
+            yield bloque
 
-@app.post(
-        "/procesa_fm/", 
-        tags=["Documentos"],       
-        summary="Formas Migratorias")
-async def procesa_documento(image: UploadFile = File(...)):
-    if not image.content_type.startswith("image/"):
-        return {"error": "El archivo no es una imagen"}
-    return await funciones.procesa_fm(image)
+    headers = {"Content-Length": str(image.size)} if image.size is not None else None
+    return StreamingResponse(bloques(), media_type=image.content_type, headers=headers)
 
-@app.post(
-    "/procesa_csf/", 
-    tags=["Documentos"],     
-    summary="SAT CSF")
-async def procesa_documento_csf(pdf_file: UploadFile = File(...)): # Renombre para evitar conflicto
-    """
-    Recibe un archivo PDF del SAT (CSF), lo convierte a una imagen unificada 
-    y lo envía a la función de procesamiento.
-    """
-    
-    # --- Validar el tipo MIME de PDF ---
-    if pdf_file.content_type != "application/pdf":
+# Rutas de documentos generadas a partir del registro de procesadores
+# (procesadores.json). Se regeneran cada vez que el registro se recarga.
+_rutas_documentos: List[APIRoute] = []
+
+
+def _validar_tipo_mime(tipo: procesadores.TipoDocumento, mime_type: Optional[str]):
+    """Rechaza con 400 un archivo que no es PDF o imagen, según lo que espera el tipo."""
+    if tipo.es_pdf and mime_type != "application/pdf":
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="El archivo no es un PDF. Por favor, suba un archivo con Content-Type: application/pdf."
         )
-    
-    temp_file_path = None
-    temp_image_path = None
-    
-    try:
-        TEMP_DIR_ROOT.mkdir(parents=True, exist_ok=True)
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", dir=TEMP_DIR_ROOT) as temp_file_obj:
-            pdf_contents = await pdf_file.read()
-            temp_file_obj.write(pdf_contents)
-            temp_file_path = temp_file_obj.name # Ruta única del PDF
-        
-        # Crea el archivo temporal para la imagen de salida (PNG)
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as temp_image_obj:
-            temp_image_path = temp_image_obj.name # Ruta única de la imagen
-
-        # Ya no usamos la ruta estática "docto.png"
-        herramientas.unir_paginas_pdf_a_una_imagen(
-            temp_file_path, 
-            ruta_salida=temp_image_path
+    if not tipo.es_pdf and not (mime_type or "").startswith("image/"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El archivo no es una imagen. Por favor, suba un archivo con Content-Type: image/* (ej: image/jpeg)."
         )
 
-        if not os.path.exists(temp_image_path) or os.path.getsize(temp_image_path) == 0:
-            print("FATAL: La imagen de salida no existe o está vacía después de la unión.")
-            # Lanza una excepción interna, no de HTTP, para un mejor debug
-            raise RuntimeError("Falló al generar la imagen unida del PDF.")
 
-        print(f"PDF unido y guardado temporalmente como {os.path.basename(temp_image_path)}.")
-        
-        return await funciones.procesa_csf(temp_image_path)
-    
-    except Exception as e:
-        print(f"Error procesando el PDF: {e}")
+async def _procesa_tipo(doc_type: str, archivo: UploadFile, x_request_timeout: Optional[float], opciones: dict):
+    """
+    Valida el archivo según el tipo de documento y lo envía a la función de
+    procesamiento. Los PDF se rechazan si exceden las páginas permitidas.
+    """
+    tipo = procesadores.tipo(doc_type)
+    if tipo is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Tipo de documento no soportado: {doc_type}. Opciones: {list(procesadores.tipos())}"
+        )
+
+    _validar_tipo_mime(tipo, archivo.content_type)
+
+    try:
+        deadline = resiliencia.calcular_deadline(doc_type, x_request_timeout)
+        if tipo.es_pdf:
+            await limite_carga.verificar_paginas(archivo.file, doc_type)
+        return await funciones.procesa_tipo(archivo, doc_type, deadline, **opciones)
+
+    except (circuito.CircuitoAbierto, HTTPException):
+        raise
+
+    # PDF que no se puede preparar para Document AI: es un problema del archivo
+    except herramientas.PaginasExcedidas as e:
+        raise HTTPException(status_code=status.HTTP_413_CONTENT_TOO_LARGE, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    except Exception:
+        logger.exception("Error procesando el documento", extra={"doc_type": doc_type})
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Error interno al procesar el PDF."
+            detail="Error interno al procesar el documento."
         )
-        
-    finally:
-        if temp_file_path and os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
-        if temp_image_path and os.path.exists(temp_image_path):
-            os.remove(temp_image_path)
+
+
+def _ruta_documento(tipo: procesadores.TipoDocumento) -> APIRoute:
+    """Ruta propia del tipo (ej. /procesa_ine/) con el campo de archivo que espera."""
+    async def endpoint(archivo: UploadFile = File(..., alias=tipo.campo),
+                       x_request_timeout: Optional[float] = TimeoutCliente,
+                       opciones: dict = Depends(opciones_entidades)):
+        return await _procesa_tipo(tipo.nombre, archivo, x_request_timeout, opciones)
+
+    return APIRoute(
+        tipo.ruta, endpoint, methods=["POST"], tags=["Documentos"],
+        summary=tipo.resumen, name=f"procesa_{tipo.nombre}",
+        description=f"Recibe {'un PDF' if tipo.es_pdf else 'una imagen'} en el campo '{tipo.campo}' y extrae sus entidades.",
+    )
+
+
+def _sincronizar_rutas(tipos):
+    """
+    Reemplaza las rutas de documentos por las del registro vigente y descarta
+    el esquema OpenAPI. La lista siempre queda con las rutas fijas primero y
+    después las de los tipos en el orden del registro, sin importar cuántas
+    recargas hubo antes.
+    """
+    global _rutas_documentos
+    nuevas = [_ruta_documento(tipo) for tipo in tipos.values()]
+    anteriores = set(map(id, _rutas_documentos))
+    # Se asigna una lista nueva: las peticiones en curso siguen con la anterior
+    app.router.routes = [r for r in app.router.routes if id(r) not in anteriores] + nuevas
+    _rutas_documentos = nuevas
+    app.openapi_schema = None
+
+@app.post(
+        "/procesa/{doc_type}/",
+        tags=["Documentos"],
+        summary="Documento por tipo")
+async def procesa_documento(doc_type: str, archivo: UploadFile = File(...),
+                            x_request_timeout: Optional[float] = TimeoutCliente,
+                            opciones: dict = Depends(opciones_entidades)):
+    """
+    Procesa un documento de cualquier tipo del registro de procesadores,
+    incluidos los agregados después de arrancar (GET /procesadores).
+    """
+    return await _procesa_tipo(doc_type.strip().lower(), archivo, x_request_timeout, opciones)
+
+@app.get(
+        "/procesadores",
+        tags=["Documentos"],
+        summary="Registro de procesadores")
+async def consultar_procesadores():
+    """
+    Tipos de documento registrados con su ruta, campo y versiones del
+    procesador con su peso de tráfico.
+    """
+    return procesadores.estado()
 
 @app.post(
-        "/procesa_cedula/", 
+        "/procesadores/recargar",
+        tags=["Documentos"],
+        summary="Recargar registro de procesadores")
+async def recargar_procesadores():
+    """
+    Vuelve a leer el archivo de procesadores en este worker sin esperar la
+    revisión periódica. Una configuración inválida se rechaza y se conserva
+    la vigente.
+    """
+    try:
+        procesadores.recargar(forzar=True)
+    except procesadores.ConfiguracionInvalida as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return procesadores.estado()
+
+@app.post(
+        "/procesa_lote/", 
         tags=["Documentos"],       
-        summary="Cédula Profesional")
-async def procesa_documento(pdf_file: UploadFile = File(...)):
+        summary="Lote de documentos")
+async def procesa_lote(
+    tipos: List[str] = Form(..., description="Tipo de cada documento, en el mismo orden que los archivos."),
+    archivos: List[UploadFile] = File(...),
+    x_request_timeout: Optional[float] = TimeoutCliente,
+    opciones: dict = Depends(opciones_entidades)
+):
     """
-    Recibe un archivo PDF de la Cédula Profesional y lo envía a la función de procesamiento.
+    Recibe varios documentos del mismo solicitante (pasaporte, INE, FM, CSF,
+    cédula) en una sola petición multipart y los procesa en paralelo.
+    Cada documento tiene su propio resultado o error.
     """
     
-    if pdf_file.content_type != "application/pdf":
-        # Uso HTTPException 400 Bad Request para indicar un error del cliente
+    if len(tipos) != len(archivos):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="El archivo no es un PDF. Por favor, suba un archivo con Content-Type: application/pdf."
+            detail=f"Se recibieron {len(tipos)} tipos y {len(archivos)} archivos; deben coincidir."
         )
     
-    return await funciones.procesa_cedula(pdf_file)
+    elementos = [
+        (doc_type.strip().lower(), archivo.filename, await archivo.read())
+        for doc_type, archivo in zip(tipos, archivos)
+    ]
+    return await funciones.procesa_lote(elementos, x_request_timeout, **opciones)
 
 @app.post(
-        "/procesa_ine/", 
-        tags=["Documentos"],       
-        summary="INE")
-async def procesa_documento_ine(image: UploadFile = File(...)):
+        "/jobs/", 
+        tags=["Trabajos"],       
+        summary="Encolar documento",
+        status_code=status.HTTP_202_ACCEPTED)
+async def crear_trabajo(
+    doc_type: str = Form(...),
+    archivo: UploadFile = File(...),
+    callback_url: Optional[str] = Form(None)
+):
     """
-    Recibe una imagen JPG de la INE y la envía a la función de procesamiento.
+    Encola un documento para procesarlo en segundo plano y devuelve de
+    inmediato el id del trabajo. El resultado se consulta en GET /jobs/{id}
+    o se envía por POST a callback_url cuando termina.
     """
     
-    if not image.content_type or not (image.content_type.startswith("image/")):
+    doc_type = doc_type.strip().lower()
+    tipo = procesadores.tipo(doc_type)
+    if tipo is None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="El archivo no es una imagen. Por favor, suba un archivo con Content-Type: image/* (ej: image/jpeg)."
+            detail=f"Tipo de documento no soportado: {doc_type}. Opciones: {list(procesadores.tipos())}"
         )
     
-    return await funciones.procesa_ine(image)
\ No newline at end of file
+    if callback_url:
+        try:
+            trabajos.validar_callback(callback_url)
+        except trabajos.CallbackInvalido as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    # Se valida antes de guardarlo: un archivo equivocado fallaría en la cola
+    # mucho después, sin que el cliente lo note
+    _validar_tipo_mime(tipo, archivo.content_type)
+    contenido = await archivo.read()
+    _validar_tipo_mime(tipo, preprocesamiento.detectar_mime(contenido))
+    if tipo.es_pdf:
+        await limite_carga.verificar_paginas(contenido, doc_type)
+    id_trabajo = await trabajos.cola.encolar(doc_type, contenido, callback_url)
+    return {"id": id_trabajo, "estado": "pendiente"}
+
+@app.get(
+        "/jobs/{id_trabajo}", 
+        tags=["Trabajos"],       
+        summary="Consultar trabajo")
+async def consultar_trabajo(id_trabajo: str):
+    """
+    Devuelve el estado del trabajo y, si ya terminó, las entidades extraídas.
+    """
+    
+    trabajo = await trabajos.cola.obtener(id_trabajo)
+    if trabajo is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Trabajo no encontrado."
+        )
+    return trabajo
+
+
+# Al final del módulo, cuando ya están todas las rutas fijas
+_sincronizar_rutas(procesadores.tipos())
+procesadores.al_recargar(_sincronizar_rutas)
@@ -1,14 +1,26 @@
-from dotenv import load_dotenv
-from google.auth import default
-from google.auth.transport.requests import Request
+import warnings
 
-#load_dotenv()
-#DOCUMENT_AI_SCOPE = scopes.CLOUD_PLATFORM
+import credenciales
+from credenciales import proveedor_token
 
-SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
 
-credentials, _ = default()
-#credentials, _ = default(scopes=[DOCUMENT_AI_SCOPE])
-#credentials, _ = default(scopes=SCOPES)
-credentials.refresh(Request())
-access_token = credentials.token
\ No newline at end of file
+def obtener_access_token() -> str:
+    """Devuelve un access token vigente del proveedor compartido (bloqueante)."""
+    return proveedor_token.obtener_token_sincrono()
+
+
+def __getattr__(nombre: str):
+    """
+    Compatibilidad: antes este módulo pedía un token al importarse y lo
+    exponía como `auty.access_token` (junto con `auty.SCOPES`). Ahora el token
+    se obtiene solo cuando se lee el atributo, y siempre vigente. Se
+    eliminará en una versión próxima; use obtener_access_token() o
+    credenciales.proveedor_token.
+    """
+    if nombre == "access_token":
+        warnings.warn("auty.access_token está obsoleto; use auty.obtener_access_token().",
+                      DeprecationWarning, stacklevel=2)
+        return obtener_access_token()
+    if nombre == "SCOPES":
+        return credenciales.SCOPES
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
@@ -0,0 +1,156 @@
+"""
+Compara las estrategias de envío de la CSF (funciones.estrategia_pdf) de
+punta a punta contra el simulador local de Document AI.
+
+Por cada estrategia levanta la app con ESTRATEGIA_CSF=<estrategia>, envía
+el mismo PDF a /procesa_csf/ y reporta los bytes que llegaron al simulador
+por documento, la latencia p50/p95/p99 y las peticiones por segundo. El
+simulador cobra SIMULADOR_MS_POR_MB, así que el tamaño enviado también se
+refleja en la latencia.
+
+Uso (desde la raíz del repositorio):
+    python benchmarks/bench_csf.py [--estrategias pdf paginas imagen imagen_adaptativa]
+                                   [--paginas 3] [--peticiones 50] [--concurrencia 4]
+                                   [--latencia-ms 300] [--ms-por-mb 40] [--json csf.json]
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from typing import Any, Dict, List
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import datos  # noqa: E402
+
+ESTRATEGIAS = ["pdf", "paginas", "imagen", "imagen_adaptativa"]
+
+
+async def _medir(url: str, documento: bytes, peticiones: int, concurrencia: int) -> Dict[str, Any]:
+    latencias: List[float] = []
+    errores = 0
+    siguiente = iter(range(peticiones))
+
+    async def trabajador(cliente: httpx.AsyncClient):
+        nonlocal errores
+        for indice in siguiente:
+            # Bytes únicos por petición para que no la resuelva la coalescencia
+            contenido = datos.hacer_unico(documento, indice)
+            inicio = time.perf_counter()
+            try:
+                respuesta = await cliente.post(
+                    "/procesa_csf/", files={"pdf_file": (f"csf-{indice}.pdf", contenido, "application/pdf")}
+                )
+                if respuesta.status_code != 200 or "error" in respuesta.json():
+                    errores += 1
+            except (ValueError, httpx.TransportError):
+                errores += 1
+            latencias.append(time.perf_counter() - inicio)
+
+    limites = httpx.Limits(max_connections=concurrencia, max_keepalive_connections=concurrencia)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=120.0) as cliente:
+        inicio = time.perf_counter()
+        await asyncio.gather(*(trabajador(cliente) for _ in range(concurrencia)))
+        duracion = time.perf_counter() - inicio
+
+    resultado = {"req_s": round(peticiones / duracion, 2), "errores": errores}
+    resultado.update({k: round(v * 1000, 1) if v is not None else None for k, v in datos.percentiles(latencias).items()})
+    return resultado
+
+
+def _estadisticas_simulador(url: str) -> Dict[str, Any]:
+    return httpx.get(f"{url}/_estadisticas", timeout=5.0).json()
+
+
+def _medir_estrategia(estrategia: str, url_simulador: str, documento: bytes, args) -> Dict[str, Any]:
+    puerto = datos.puerto_libre()
+    directorio = tempfile.mkdtemp(prefix="bench_csf_")
+    app = datos.lanzar_uvicorn("app:app", puerto, {
+        "DOCUMENT_AI_URL_BASE": url_simulador,
+        "DOCUMENT_AI_TOKEN_ESTATICO": "benchmark",
+        "CACHE_HABILITADO": "0",
+        "ESTRATEGIA_CSF": estrategia,
+        # Se mide el envío a Document AI, no la extracción local de texto_pdf
+        "EXTRACCION_LOCAL": "0",
+        "TRABAJOS_DB": os.path.join(directorio, "trabajos.db"),
+        "LOG_NIVEL": "WARNING",
+    })
+    try:
+        url = f"http://127.0.0.1:{puerto}"
+        datos.esperar_listo(url, app)
+
+        # Calentamiento: pool de conexiones, pool de procesos y token
+        asyncio.run(_medir(url, datos.hacer_unico(documento, -1), args.concurrencia, args.concurrencia))
+
+        antes = _estadisticas_simulador(url_simulador)
+        resultado = asyncio.run(_medir(url, documento, args.peticiones, args.concurrencia))
+        despues = _estadisticas_simulador(url_simulador)
+        resultado["rss_pico_mb"] = datos.rss_pico_mb(app.pid)
+    finally:
+        app.terminate()
+        app.wait(timeout=10)
+
+    # Lo que recibió el simulador durante la medición, por tipo MIME
+    enviados = {
+        mime: despues["bytes_documentos"][mime] - antes["bytes_documentos"].get(mime, 0)
+        for mime in despues["bytes_documentos"]
+    }
+    documentos = sum(despues["documentos"].values()) - sum(antes["documentos"].values())
+    bytes_enviados = sum(enviados.values())
+    return {
+        "estrategia": estrategia,
+        "mime_enviado": max(enviados, key=enviados.get) if bytes_enviados else None,
+        "bytes_por_documento": round(bytes_enviados / documentos) if documentos else None,
+        **resultado,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--estrategias", nargs="+", choices=ESTRATEGIAS, default=ESTRATEGIAS)
+    parser.add_argument("--paginas", type=int, default=3, help="Páginas del PDF sintético")
+    parser.add_argument("--peticiones", type=int, default=50)
+    parser.add_argument("--concurrencia", type=int, default=4)
+    parser.add_argument("--latencia-ms", type=float, default=300)
+    parser.add_argument("--ms-por-mb", type=float, default=40)
+    parser.add_argument("--json", help="Archivo donde guardar los resultados para comparar corridas")
+    args = parser.parse_args()
+
+    documento = datos.pdf_documento(args.paginas, semilla=4)
+    puerto_simulador = datos.puerto_libre()
+    url_simulador = f"http://127.0.0.1:{puerto_simulador}"
+    simulador = datos.lanzar_uvicorn("simulador.servidor:app", puerto_simulador, {
+        "SIMULADOR_LATENCIA_MS": str(args.latencia_ms),
+        "SIMULADOR_MS_POR_MB": str(args.ms_por_mb),
+    })
+    resultados = []
+    try:
+        datos.esperar_listo(url_simulador, simulador)
+        print(f"CSF de {args.paginas} páginas ({len(documento) / 1024:.0f} KB): {args.peticiones} peticiones "
+              f"por estrategia, concurrencia {args.concurrencia}, latencia simulada {args.latencia_ms} ms "
+              f"+ {args.ms_por_mb} ms/MB")
+        for estrategia in args.estrategias:
+            resultado = _medir_estrategia(estrategia, url_simulador, documento, args)
+            resultados.append(resultado)
+            enviados = resultado["bytes_por_documento"]
+            print(
+                f"{estrategia:<18} enviado {enviados / 1024 if enviados else 0:>8.0f} KB ({resultado['mime_enviado']})   "
+                f"p50 {resultado['p50']:>8} ms   p95 {resultado['p95']:>8} ms   p99 {resultado['p99']:>8} ms   "
+                f"{resultado['req_s']:>6.2f} req/s   errores {resultado['errores']:>3}"
+            )
+    finally:
+        simulador.terminate()
+        simulador.wait(timeout=10)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as archivo:
+            json.dump({"parametros": vars(args), "bytes_pdf": len(documento), "resultados": resultados}, archivo, indent=2)
+
+
+if __name__ == "__main__":
+    main()
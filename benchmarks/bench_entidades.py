@@ -0,0 +1,87 @@
+"""
+Micro-benchmark del aplanado de entidades de Document AI.
+
+Compara el extractor iterativo de herramientas (extraer_entidades +
+agrupar_entidades) contra una copia del aplanado recursivo anterior, sobre
+respuestas sintéticas grandes y anidadas.
+
+Uso (desde la raíz del repositorio):
+    python benchmarks/bench_entidades.py [--entidades 2000] [--profundidad 4] [--repeticiones 20]
+"""
+import os
+import sys
+import random
+import timeit
+import argparse
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import herramientas  # noqa: E402
+
+
+def _entidad_sintetica(indice: int, profundidad: int, hijos: int) -> Dict[str, Any]:
+    entidad = {
+        "type": f"campo_{indice % 50}",
+        "mentionText": f"valor {indice}",
+        "confidence": random.random(),
+    }
+    if indice % 7 == 0:
+        entidad["normalizedValue"] = {"text": "2024-01-31", "dateValue": {"year": 2024, "month": 1, "day": 31}}
+    elif indice % 11 == 0:
+        entidad["normalizedValue"] = {"text": "1234.50", "moneyValue": {"units": "1234", "nanos": 500000000}}
+    if profundidad > 0:
+        entidad["properties"] = [
+            _entidad_sintetica(indice * hijos + i, profundidad - 1, hijos) for i in range(hijos)
+        ]
+    return entidad
+
+
+def respuesta_sintetica(entidades: int, profundidad: int, hijos: int = 2) -> Dict[str, Any]:
+    """Respuesta con la forma de Document AI: {'document': {'entities': [...]}}."""
+    return {"document": {"entities": [_entidad_sintetica(i, profundidad, hijos) for i in range(entidades)]}}
+
+
+def aplanado_recursivo_anterior(entidades: List[Dict[str, Any]]) -> Dict[str, str]:
+    """Copia del aplanado recursivo que se reemplazó, solo como referencia."""
+    datos_planos = {}
+    for entidad in entidades:
+        nombre_campo = entidad.get('type')
+        valor_campo = entidad.get('mentionText')
+        if nombre_campo and valor_campo:
+            datos_planos[nombre_campo] = valor_campo
+        if 'properties' in entidad and entidad['properties']:
+            datos_planos.update(aplanado_recursivo_anterior(entidad['properties']))
+    return datos_planos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entidades", type=int, default=2000)
+    parser.add_argument("--profundidad", type=int, default=4)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(0)
+    respuesta = respuesta_sintetica(args.entidades, args.profundidad)
+    raiz = respuesta["document"]["entities"]
+    total = len(herramientas.extraer_entidades(raiz))
+    print(f"Entidades totales (incluyendo anidadas): {total}")
+
+    casos = {
+        "recursivo anterior": lambda: aplanado_recursivo_anterior(raiz),
+        "iterativo": lambda: herramientas.agrupar_entidades(herramientas.extraer_entidades(raiz)),
+        "iterativo detallado": lambda: herramientas.agrupar_entidades(
+            herramientas.extraer_entidades(raiz), detallado=True
+        ),
+        "iterativo umbral 0.5": lambda: herramientas.agrupar_entidades(
+            herramientas.extraer_entidades(raiz, umbral_confianza=0.5)
+        ),
+    }
+    for nombre, caso in casos.items():
+        tiempos = timeit.repeat(caso, number=1, repeat=args.repeticiones)
+        print(f"{nombre:<22} mejor {min(tiempos) * 1000:8.2f} ms   mediana {sorted(tiempos)[len(tiempos) // 2] * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark de la rasterización de PDFs (herramientas.unir_paginas_pdf_a_una_imagen).
+
+Mide latencia p50/p95/p99 y RSS pico para PDFs sintéticos de distinto
+número de páginas.
+
+Uso (desde la raíz del repositorio):
+    python benchmarks/bench_raster.py [--paginas 1 3 6] [--dpi 150] [--repeticiones 20] [--json raster.json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import datos  # noqa: E402
+
+sys.path.insert(0, datos.raiz_repositorio())
+
+import herramientas  # noqa: E402
+import ejecutores  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paginas", type=int, nargs="+", default=[1, 3, 6])
+    parser.add_argument("--dpi", type=int, default=150)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--json", help="Archivo donde guardar los resultados para comparar corridas")
+    args = parser.parse_args()
+
+    resultados = []
+    with tempfile.TemporaryDirectory(prefix="bench_raster_") as directorio:
+        ruta_salida = os.path.join(directorio, "salida.png")
+        for paginas in args.paginas:
+            ruta_pdf = os.path.join(directorio, f"documento_{paginas}.pdf")
+            with open(ruta_pdf, "wb") as archivo:
+                archivo.write(datos.pdf_documento(paginas, semilla=paginas))
+
+            # Calentamiento: arranque del pool de procesos
+            herramientas.unir_paginas_pdf_a_una_imagen(ruta_pdf, ruta_salida, args.dpi)
+
+            tiempos = []
+            for _ in range(args.repeticiones):
+                inicio = time.perf_counter()
+                herramientas.unir_paginas_pdf_a_una_imagen(ruta_pdf, ruta_salida, args.dpi)
+                tiempos.append(time.perf_counter() - inicio)
+
+            resultado = {
+                "paginas": paginas,
+                "dpi": args.dpi,
+                "bytes_png": os.path.getsize(ruta_salida),
+                **{k: round(v * 1000, 1) for k, v in datos.percentiles(tiempos).items()},
+                "rss_pico_mb": datos.rss_pico_mb(),
+            }
+            resultados.append(resultado)
+            print(
+                f"{paginas:>3} páginas   p50 {resultado['p50']:>8} ms   p95 {resultado['p95']:>8} ms   "
+                f"p99 {resultado['p99']:>8} ms   PNG {resultado['bytes_png'] / 1024:>8.0f} KB   "
+                f"RSS pico {resultado['rss_pico_mb']} MB"
+            )
+
+    # El RSS de los procesos del pool solo se contabiliza cuando terminan
+    ejecutores.cerrar()
+    print(f"RSS pico incluyendo el pool de rasterización: {datos.rss_pico_mb()} MB")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as archivo:
+            json.dump({"parametros": vars(args), "resultados": resultados}, archivo, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Prueba de carga de las rutas /procesa_* contra el simulador local de Document AI.
+
+Por defecto levanta el simulador y la app con uvicorn en puertos locales,
+con la app apuntando al simulador (DOCUMENT_AI_URL_BASE) y un token
+estático, y mide cada ruta por separado: peticiones por segundo, latencia
+p50/p95/p99 y RSS pico del proceso de la app.
+
+Uso (desde la raíz del repositorio):
+    python benchmarks/bench_rutas.py [--peticiones 200] [--concurrencia 16] [--rutas pasaporte csf]
+                                     [--latencia-ms 300] [--tasa-error 0] [--rps 0]
+                                     [--con-cache] [--json resultados.json]
+
+    # contra una app ya levantada (no se mide RSS si no se indica --pid)
+    python benchmarks/bench_rutas.py --url http://127.0.0.1:8000 --pid 12345
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import datos  # noqa: E402
+
+# Ruta, nombre del campo del formulario y generador del documento de prueba
+RUTAS = {
+    "pasaporte": ("/procesa_pasaporte/", "image", "image/jpeg", lambda: datos.imagen_documento("JPEG", semilla=1)),
+    "fm": ("/procesa_fm/", "image", "image/jpeg", lambda: datos.imagen_documento("JPEG", semilla=2)),
+    "ine": ("/procesa_ine/", "image", "image/jpeg", lambda: datos.imagen_documento("JPEG", 1280, 800, semilla=3)),
+    "csf": ("/procesa_csf/", "pdf_file", "application/pdf", lambda: datos.pdf_documento(3, semilla=4)),
+    "cedula": ("/procesa_cedula/", "pdf_file", "application/pdf", lambda: datos.pdf_documento(1, semilla=5)),
+}
+
+
+async def _medir_ruta(cliente: httpx.AsyncClient, nombre: str, peticiones: int, concurrencia: int,
+                      unico: bool) -> Dict[str, Any]:
+    ruta, campo, mime, generar = RUTAS[nombre]
+    documento = generar()
+    latencias: List[float] = []
+    codigos: Dict[str, int] = {}
+    errores = 0
+    siguiente = iter(range(peticiones))
+
+    async def trabajador():
+        nonlocal errores
+        for indice in siguiente:
+            contenido = datos.hacer_unico(documento, indice) if unico else documento
+            inicio = time.perf_counter()
+            try:
+                respuesta = await cliente.post(ruta, files={campo: (f"doc-{indice}", contenido, mime)})
+                codigo = str(respuesta.status_code)
+                # La API responde 200 con {"error": ...} en varios casos
+                if respuesta.status_code != 200 or "error" in respuesta.json():
+                    errores += 1
+            except ValueError:
+                errores += 1
+            except httpx.TransportError:
+                codigo = "transporte"
+                errores += 1
+            latencias.append(time.perf_counter() - inicio)
+            codigos[codigo] = codigos.get(codigo, 0) + 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabajador() for _ in range(concurrencia)))
+    duracion = time.perf_counter() - inicio
+
+    resultado = {
+        "ruta": ruta,
+        "bytes_documento": len(documento),
+        "peticiones": peticiones,
+        "concurrencia": concurrencia,
+        "req_s": round(peticiones / duracion, 2),
+        "errores": errores,
+        "codigos": codigos,
+    }
+    resultado.update({k: round(v * 1000, 1) if v is not None else None for k, v in datos.percentiles(latencias).items()})
+    return resultado
+
+
+async def _correr(url: str, rutas: List[str], peticiones: int, concurrencia: int, unico: bool,
+                  pid: Optional[int]) -> List[Dict[str, Any]]:
+    limites = httpx.Limits(max_connections=concurrencia, max_keepalive_connections=concurrencia)
+    resultados = []
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=120.0) as cliente:
+        for nombre in rutas:
+            # Calentamiento: pool de conexiones, pool de procesos y token
+            await _medir_ruta(cliente, nombre, min(concurrencia, peticiones), concurrencia, unico)
+            resultado = await _medir_ruta(cliente, nombre, peticiones, concurrencia, unico)
+            resultado["rss_pico_mb"] = datos.rss_pico_mb(pid) if pid else None
+            resultados.append({"doc_type": nombre, **resultado})
+            print(
+                f"{nombre:<10} {resultado['req_s']:>8.2f} req/s   p50 {resultado['p50']:>8} ms   "
+                f"p95 {resultado['p95']:>8} ms   p99 {resultado['p99']:>8} ms   "
+                f"errores {resultado['errores']:>4}   RSS pico {resultado['rss_pico_mb']} MB"
+            )
+    return resultados
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="URL de una app ya levantada; si se omite se levantan app y simulador")
+    parser.add_argument("--pid", type=int, help="PID de la app, para medir su RSS pico con --url")
+    parser.add_argument("--rutas", nargs="+", choices=list(RUTAS), default=list(RUTAS))
+    parser.add_argument("--peticiones", type=int, default=200)
+    parser.add_argument("--concurrencia", type=int, default=16)
+    parser.add_argument("--latencia-ms", type=float, default=300)
+    parser.add_argument("--tasa-error", type=float, default=0.0)
+    parser.add_argument("--rps", type=float, default=0.0, help="Cuota del simulador (0 = sin límite)")
+    parser.add_argument("--con-cache", action="store_true", help="Repite el mismo documento y deja el cache activo")
+    parser.add_argument("--json", help="Archivo donde guardar los resultados para comparar corridas")
+    args = parser.parse_args()
+
+    procesos = []
+    try:
+        url, pid = args.url, args.pid
+        if url is None:
+            puerto_simulador, puerto_app = datos.puerto_libre(), datos.puerto_libre()
+            url_simulador = f"http://127.0.0.1:{puerto_simulador}"
+            simulador = datos.lanzar_uvicorn("simulador.servidor:app", puerto_simulador, {
+                "SIMULADOR_LATENCIA_MS": str(args.latencia_ms),
+                "SIMULADOR_TASA_ERROR": str(args.tasa_error),
+                "SIMULADOR_RPS": str(args.rps),
+            })
+            procesos.append(simulador)
+            datos.esperar_listo(url_simulador, simulador)
+
+            directorio = tempfile.mkdtemp(prefix="bench_rad_")
+            app = datos.lanzar_uvicorn("app:app", puerto_app, {
+                "DOCUMENT_AI_URL_BASE": url_simulador,
+                "DOCUMENT_AI_TOKEN_ESTATICO": "benchmark",
+                "CACHE_HABILITADO": "1" if args.con_cache else "0",
+                "TRABAJOS_DB": os.path.join(directorio, "trabajos.db"),
+                "LOG_NIVEL": "WARNING",
+            })
+            procesos.append(app)
+            url, pid = f"http://127.0.0.1:{puerto_app}", app.pid
+            datos.esperar_listo(url, app)
+
+        print(f"Benchmark contra {url}: {args.peticiones} peticiones por ruta, concurrencia {args.concurrencia}, "
+              f"latencia simulada {args.latencia_ms} ms, cache {'activo' if args.con_cache else 'evitado'}")
+        resultados = asyncio.run(
+            _correr(url, args.rutas, args.peticiones, args.concurrencia, not args.con_cache, pid)
+        )
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as archivo:
+                json.dump({"parametros": vars(args), "resultados": resultados}, archivo, indent=2)
+    finally:
+        for proceso in reversed(procesos):
+            proceso.terminate()
+            proceso.wait(timeout=10)
+
+
+if __name__ == "__main__":
+    main()
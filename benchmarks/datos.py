@@ -0,0 +1,123 @@
+"""
+Documentos sintéticos y utilidades comunes de los benchmarks.
+
+Los documentos se generan con una semilla fija para que dos corridas
+envíen exactamente los mismos bytes.
+"""
+import io
+import os
+import sys
+import time
+import random
+import socket
+import resource
+import subprocess
+from typing import Dict, List, Optional
+
+import fitz
+import httpx
+from PIL import Image, ImageDraw
+
+# Tamaño aproximado de una foto de documento tomada con celular
+ANCHO_IMAGEN = 2400
+ALTO_IMAGEN = 1600
+
+
+def imagen_documento(formato: str = "JPEG", ancho: int = ANCHO_IMAGEN, alto: int = ALTO_IMAGEN, semilla: int = 0) -> bytes:
+    """Imagen con renglones de texto y ruido, para que no comprima de forma irreal."""
+    aleatorio = random.Random(semilla)
+    imagen = Image.effect_noise((ancho, alto), 24).convert("RGB")
+    dibujo = ImageDraw.Draw(imagen)
+    for renglon in range(40, alto - 40, 48):
+        texto = "".join(aleatorio.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789 ") for _ in range(60))
+        dibujo.text((60, renglon), texto, fill=(20, 20, 20))
+    buffer = io.BytesIO()
+    imagen.save(buffer, format=formato, quality=90)
+    return buffer.getvalue()
+
+
+def pdf_documento(paginas: int = 3, semilla: int = 0) -> bytes:
+    """PDF tamaño carta con texto vectorial, similar a una CSF del SAT."""
+    aleatorio = random.Random(semilla)
+    documento = fitz.open()
+    for _ in range(paginas):
+        pagina = documento.new_page(width=612, height=792)
+        for renglon in range(60, 740, 14):
+            texto = " ".join(
+                "".join(aleatorio.choice("ABCDEFGHIJKLMNOPQRSTUVWXYZ") for _ in range(aleatorio.randint(3, 10)))
+                for _ in range(8)
+            )
+            pagina.insert_text((50, renglon), texto, fontsize=9)
+    datos = documento.tobytes()
+    documento.close()
+    return datos
+
+
+def hacer_unico(contenido: bytes, indice: int) -> bytes:
+    """
+    Agrega bytes al final del archivo (ignorados por PNG, JPEG y PDF) para
+    que cada petición tenga un hash distinto y no la resuelva el cache.
+    """
+    return contenido + f"\n%unico-{indice}\n".encode("ascii")
+
+
+def percentiles(muestras: List[float], cuantiles=(0.50, 0.95, 0.99)) -> Dict[str, Optional[float]]:
+    if not muestras:
+        return {f"p{int(c * 100)}": None for c in cuantiles}
+    ordenadas = sorted(muestras)
+    return {f"p{int(c * 100)}": ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * c))] for c in cuantiles}
+
+
+def rss_pico_mb(pid: Optional[int] = None) -> Optional[float]:
+    """
+    RSS pico en MB: de otro proceso (VmHWM de /proc, solo Linux) o, sin pid,
+    del proceso actual más sus hijos terminados.
+    """
+    if pid is None:
+        propio = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        hijos = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        # ru_maxrss está en KB en Linux
+        return round(max(propio, hijos) / 1024, 1)
+    try:
+        with open(f"/proc/{pid}/status", "r") as estado:
+            for linea in estado:
+                if linea.startswith("VmHWM:"):
+                    return round(int(linea.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def raiz_repositorio() -> str:
+    return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def lanzar_uvicorn(modulo: str, puerto: int, entorno: Dict[str, str]) -> subprocess.Popen:
+    """Levanta `modulo` (ej. "app:app") con uvicorn desde la raíz del repositorio."""
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", modulo, "--host", "127.0.0.1", "--port", str(puerto),
+         "--log-level", "warning", "--no-access-log"],
+        cwd=raiz_repositorio(),
+        env={**os.environ, **entorno},
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def esperar_listo(url: str, proceso: subprocess.Popen, espera: float = 30.0):
+    limite = time.monotonic() + espera
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"El proceso terminó al arrancar (código {proceso.returncode}).")
+        try:
+            if httpx.get(f"{url}/health", timeout=1.0).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} no respondió en {espera:.0f} s.")
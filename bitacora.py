@@ -0,0 +1,162 @@
+import os
+import sys
+import copy
+import json
+import time
+import queue
+import uuid
+import logging
+import logging.handlers
+import contextvars
+from typing import Optional
+
+# Id de correlación de la petición en curso; se propaga a tareas y a
+# asyncio.to_thread porque ambos copian el contexto
+id_peticion: contextvars.ContextVar[str] = contextvars.ContextVar("id_peticion", default="-")
+
+# Modo depuración: habilita los volcados de respuestas de Document AI en
+# herramientas. Nunca en producción: los volcados contienen datos personales
+DEPURACION = os.getenv("DEPURACION", "0").lower() in ("1", "true", "si", "yes")
+
+NIVEL = os.getenv("LOG_NIVEL", "DEBUG" if DEPURACION else "INFO").upper()
+# "json" (una línea por evento, para agregadores) o "texto" (desarrollo local)
+FORMATO = os.getenv("LOG_FORMATO", "json").lower()
+
+# Atributos estándar de LogRecord; todo lo demás viene de `extra=` y se
+# incluye como campo estructurado
+_ATRIBUTOS_REGISTRO = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_escucha: Optional[logging.handlers.QueueListener] = None
+
+
+class FiltroContexto(logging.Filter):
+    """Agrega el id de correlación al registro en el hilo que lo emite."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.id_peticion = id_peticion.get()
+        return True
+
+
+class ManejadorCola(logging.handlers.QueueHandler):
+    """
+    QueueHandler que conserva la traza de la excepción en exc_text en lugar
+    de pegarla al mensaje, para que el formato JSON la emita como campo.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        registro = copy.copy(record)
+        registro.message = record.getMessage()
+        registro.msg = registro.message
+        registro.args = None
+        if record.exc_info:
+            registro.exc_text = logging.Formatter().formatException(record.exc_info)
+        registro.exc_info = None
+        return registro
+
+
+class FormatoJSON(logging.Formatter):
+    """Una línea JSON por evento, con los campos de `extra=` al mismo nivel."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        evento = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensaje": record.getMessage(),
+        }
+        for clave, valor in vars(record).items():
+            if clave not in _ATRIBUTOS_REGISTRO:
+                evento[clave] = valor
+        if record.exc_info:
+            evento["excepcion"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            evento["excepcion"] = record.exc_text
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+
+def nuevo_id_peticion() -> str:
+    return uuid.uuid4().hex
+
+
+def configurar_logging():
+    """
+    Configura el logger raíz con un QueueHandler: el event loop solo encola
+    el registro y un hilo aparte (QueueListener) formatea y escribe a stdout,
+    así que una escritura lenta no bloquea peticiones. Es idempotente.
+    """
+    global _escucha
+    if _escucha is not None:
+        return
+
+    if FORMATO == "texto":
+        formato = logging.Formatter("%(asctime)s %(levelname)s [%(id_peticion)s] %(name)s: %(message)s")
+    else:
+        formato = FormatoJSON()
+    salida = logging.StreamHandler(sys.stdout)
+    salida.setFormatter(formato)
+
+    cola = queue.SimpleQueue()
+    manejador = ManejadorCola(cola)
+    manejador.addFilter(FiltroContexto())
+
+    raiz = logging.getLogger()
+    raiz.handlers = [manejador]
+    raiz.setLevel(NIVEL)
+
+    _escucha = logging.handlers.QueueListener(cola, salida, respect_handler_level=True)
+    _escucha.start()
+
+
+def detener_logging():
+    """Vacía la cola pendiente y detiene el hilo escritor."""
+    global _escucha
+    if _escucha is not None:
+        _escucha.stop()
+        _escucha = None
+
+
+class MiddlewareCorrelacion:
+    """
+    Middleware ASGI que asigna un id de correlación a cada petición HTTP.
+
+    Usa el encabezado X-Request-ID del cliente si viene (para seguir una
+    petición entre servicios) o genera uno nuevo, lo devuelve en la
+    respuesta y registra una línea por petición con su estado y duración.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.logger = logging.getLogger("acceso")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        recibido = None
+        for nombre, valor in scope.get("headers", ()):
+            if nombre == b"x-request-id":
+                recibido = valor.decode("latin-1")[:128]
+                break
+        identificador = recibido or nuevo_id_peticion()
+        marca = id_peticion.set(identificador)
+
+        inicio = time.perf_counter()
+        estado = 500
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+                mensaje["headers"] = list(mensaje.get("headers", ())) + [(b"x-request-id", identificador.encode("latin-1"))]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            self.logger.info(
+                "%s %s %s", scope["method"], scope["path"], estado,
+                extra={"metodo": scope["method"], "ruta": scope["path"], "estado": estado,
+                       "duracion_ms": round((time.perf_counter() - inicio) * 1000, 1)},
+            )
+            id_peticion.reset(marca)
@@ -0,0 +1,147 @@
+import os
+import logging
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Se incrementa cuando cambia la forma de los resultados guardados, para no
+# servir entradas en disco con el formato anterior
+VERSION_FORMATO = 2
+
+
+def construir_clave(doc_type: str, endpoint_url: str, sha256: str) -> str:
+    """
+    Clave direccionada por contenido: el mismo archivo enviado al mismo
+    procesador produce siempre la misma clave. El endpoint se incluye para que
+    un cambio de versión del procesador no devuelva resultados viejos.
+    """
+    endpoint_hash = hashlib.sha256(endpoint_url.encode("utf-8")).hexdigest()[:16]
+    return f"{doc_type}-{endpoint_hash}-{sha256}-v{VERSION_FORMATO}"
+
+
+class CacheResultados:
+    """
+    Cache de resultados de Document AI en dos niveles:
+
+    - Memoria: LRU acotado por número de entradas, con expiración por TTL.
+    - Disco (opcional): un archivo JSON por entrada en `directorio`, para
+      sobrevivir reinicios y compartirse entre workers del mismo host.
+    """
+
+    def __init__(self, max_entradas: int = 1024, ttl_segundos: float = 86400, directorio: Optional[str] = None):
+        self.max_entradas = max_entradas
+        self.ttl_segundos = ttl_segundos
+        self.directorio = directorio
+        self._memoria: "OrderedDict[str, tuple]" = OrderedDict()
+        self.aciertos = 0
+        self.fallos = 0
+
+        if self.directorio:
+            os.makedirs(self.directorio, exist_ok=True)
+
+    # --- Nivel en memoria ---
+
+    def _obtener_memoria(self, clave: str) -> Optional[Dict[str, Any]]:
+        entrada = self._memoria.get(clave)
+        if entrada is None:
+            return None
+        expira, valor = entrada
+        if expira < time.time():
+            del self._memoria[clave]
+            return None
+        self._memoria.move_to_end(clave)
+        return valor
+
+    def _guardar_memoria(self, clave: str, valor: Dict[str, Any], expira: float):
+        self._memoria[clave] = (expira, valor)
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.max_entradas:
+            self._memoria.popitem(last=False)
+
+    # --- Nivel en disco ---
+
+    def _ruta(self, clave: str) -> str:
+        return os.path.join(self.directorio, f"{clave}.json")
+
+    def _leer_disco(self, clave: str) -> Optional[tuple]:
+        try:
+            with open(self._ruta(clave), "r", encoding="utf-8") as archivo:
+                entrada = json.load(archivo)
+        except (FileNotFoundError, ValueError):
+            return None
+        if entrada.get("expira", 0) < time.time():
+            try:
+                os.remove(self._ruta(clave))
+            except OSError:
+                pass
+            return None
+        return entrada["expira"], entrada["valor"]
+
+    def _escribir_disco(self, clave: str, valor: Dict[str, Any], expira: float):
+        # Escritura atómica: otro worker nunca lee un archivo a medio escribir
+        ruta = self._ruta(clave)
+        ruta_temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(ruta_temporal, "w", encoding="utf-8") as archivo:
+            json.dump({"expira": expira, "valor": valor}, archivo, ensure_ascii=False)
+        os.replace(ruta_temporal, ruta)
+
+    # --- API pública ---
+
+    async def obtener(self, clave: str) -> Optional[Dict[str, Any]]:
+        """Busca la clave en memoria y luego en disco. Devuelve una copia o None."""
+        valor = self._obtener_memoria(clave)
+        if valor is None and self.directorio:
+            entrada = await asyncio.to_thread(self._leer_disco, clave)
+            if entrada is not None:
+                expira, valor = entrada
+                # Se promueve al nivel en memoria
+                self._guardar_memoria(clave, valor, expira)
+
+        if valor is None:
+            self.fallos += 1
+            return None
+        self.aciertos += 1
+        return dict(valor)
+
+    async def guardar(self, clave: str, valor: Dict[str, Any]):
+        """Guarda una copia del resultado en memoria y, si está habilitado, en disco."""
+        expira = time.time() + self.ttl_segundos
+        valor = dict(valor)
+        self._guardar_memoria(clave, valor, expira)
+        if self.directorio:
+            try:
+                await asyncio.to_thread(self._escribir_disco, clave, valor, expira)
+            except OSError as e:
+                logger.warning("No se pudo escribir la entrada de cache en disco: %s", e)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        total = self.aciertos + self.fallos
+        return {
+            "entradas_memoria": len(self._memoria),
+            "max_entradas": self.max_entradas,
+            "ttl_segundos": self.ttl_segundos,
+            "disco": self.directorio,
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_aciertos": round(self.aciertos / total, 3) if total else None,
+        }
+
+
+def _crear_cache_desde_entorno() -> Optional[CacheResultados]:
+    if os.getenv("CACHE_HABILITADO", "1").lower() not in ("1", "true", "si", "yes"):
+        return None
+    return CacheResultados(
+        max_entradas=int(os.getenv("CACHE_MAX_ENTRADAS", "1024")),
+        ttl_segundos=float(os.getenv("CACHE_TTL_SEGUNDOS", "86400")),
+        directorio=os.getenv("CACHE_DIRECTORIO") or None,
+    )
+
+
+# Cache compartido por el proceso (None si está deshabilitado)
+cache = _crear_cache_desde_entorno()
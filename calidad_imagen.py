@@ -0,0 +1,145 @@
+import io
+import os
+import logging
+import procesadores
+from typing import Any, Dict, List, Optional
+from PIL import Image, ImageOps
+
+# numpy es opcional: sin él no se evalúa la calidad y toda imagen pasa
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Revisión local de fotos de credenciales antes de pagar la llamada a
+# Document AI: una foto borrosa, oscura, recortada o girada regresa sin
+# entidades después de varios segundos.
+HABILITADO = np is not None and os.getenv("CALIDAD_HABILITADA", "1").lower() in ("1", "true", "si", "yes")
+# "marcar" llama a Document AI de todos modos y agrega "_calidad" a la
+# respuesta; "rechazar" responde el error sin llamarlo. Los umbrales aún no
+# están calibrados con fotos reales, así que por defecto solo se marca.
+MODO = os.getenv("CALIDAD_MODO", "marcar")
+# Lado mayor de la miniatura sobre la que se miden nitidez y exposición
+LADO_ANALISIS = 512
+
+# Los umbrales de cada tipo de documento vienen del registro de procesadores
+# ("calidad"); un tipo sin ellos no se revisa:
+#   lado_minimo: píxeles mínimos del lado mayor de la imagen original
+#   nitidez_minima: varianza mínima del laplaciano sobre la miniatura
+#   proporcion: [mínima, máxima] del lado mayor entre el menor, o null
+#   horizontal: la credencial debe estar en horizontal
+# La INE es una tarjeta ID-1 (85.6 x 54 mm, 1.59:1); el pasaporte puede
+# fotografiarse abierto, en vertical. Una foto con algo de fondo queda
+# dentro de los márgenes.
+# Exposición: brillo medio aceptable (0-255), fracción máxima de píxeles
+# quemados (>= 250, reflejos o flash) y contraste mínimo (desviación estándar)
+BRILLO_MINIMO = float(os.getenv("CALIDAD_BRILLO_MINIMO", "45"))
+BRILLO_MAXIMO = float(os.getenv("CALIDAD_BRILLO_MAXIMO", "225"))
+QUEMADOS_MAXIMO = float(os.getenv("CALIDAD_QUEMADOS_MAXIMO", "0.25"))
+CONTRASTE_MINIMO = float(os.getenv("CALIDAD_CONTRASTE_MINIMO", "20"))
+
+
+def perfil(doc_type: str) -> Optional[Dict[str, Any]]:
+    return procesadores.obtener(doc_type, "calidad")
+
+
+def aplica(doc_type: str, mime_type: str) -> bool:
+    return HABILITADO and perfil(doc_type) is not None and mime_type.startswith("image/")
+
+
+def _umbral(doc_type: str, perfil_tipo: Dict[str, Any], nombre: str) -> Any:
+    """Umbral del perfil, sobreescribible con CALIDAD_<NOMBRE>_<TIPO> (ej. CALIDAD_NITIDEZ_MINIMA_INE=40)."""
+    valor = os.getenv(f"CALIDAD_{nombre.upper()}_{doc_type.upper()}")
+    return float(valor) if valor else perfil_tipo[nombre]
+
+
+def _varianza_laplaciano(gris: "np.ndarray") -> float:
+    """Varianza del laplaciano de 4 vecinos: baja cuando la imagen no tiene bordes definidos."""
+    laplaciano = (
+        gris[:-2, 1:-1] + gris[2:, 1:-1] + gris[1:-1, :-2] + gris[1:-1, 2:]
+        - 4 * gris[1:-1, 1:-1]
+    )
+    return float(laplaciano.var())
+
+
+def evaluar(contenido: bytes, doc_type: str) -> Dict[str, Any]:
+    """
+    Mide resolución, proporción, orientación, nitidez y exposición de la
+    imagen y las compara con los umbrales de su tipo.
+
+    Es bloqueante (decodifica la imagen): desde código async debe llamarse con
+    ejecutores.en_hilo.
+
+    Returns:
+        {"problemas": [{"codigo", "mensaje"}], "medidas": {...}}. Una imagen
+        que no se puede decodificar no se rechaza aquí: lo decide Document AI.
+    """
+    perfil_tipo = perfil(doc_type)
+    if perfil_tipo is None:
+        return {"problemas": [], "medidas": {}}
+    try:
+        imagen = Image.open(io.BytesIO(contenido))
+        # Dimensiones como se ve la foto, ya aplicada la orientación EXIF
+        ancho_original, alto_original = imagen.size
+        if imagen.getexif().get(0x0112, 1) in (5, 6, 7, 8):
+            ancho_original, alto_original = alto_original, ancho_original
+        # En JPEG decodifica directamente a escala reducida
+        imagen.draft("L", (LADO_ANALISIS, LADO_ANALISIS))
+        imagen = ImageOps.exif_transpose(imagen).convert("L")
+        imagen.thumbnail((LADO_ANALISIS, LADO_ANALISIS), Image.BOX)
+    except Exception as e:
+        logger.debug("No se pudo decodificar la imagen para evaluar su calidad: %s", e)
+        return {"problemas": [], "medidas": {}}
+
+    gris = np.asarray(imagen, dtype=np.float32)
+    lado_mayor, lado_menor = max(ancho_original, alto_original), min(ancho_original, alto_original)
+    medidas = {
+        "ancho": ancho_original,
+        "alto": alto_original,
+        "proporcion": round(lado_mayor / max(lado_menor, 1), 2),
+        "nitidez": round(_varianza_laplaciano(gris), 1),
+        "brillo": round(float(gris.mean()), 1),
+        "contraste": round(float(gris.std()), 1),
+        "quemados": round(float((gris >= 250).mean()), 3),
+    }
+
+    problemas: List[Dict[str, str]] = []
+
+    def problema(codigo: str, mensaje: str):
+        problemas.append({"codigo": codigo, "mensaje": mensaje})
+
+    lado_minimo = _umbral(doc_type, perfil_tipo, "lado_minimo")
+    if lado_mayor < lado_minimo:
+        problema("resolucion", f"La imagen es muy pequeña ({ancho_original}x{alto_original} px); se necesitan al menos "
+                               f"{lado_minimo:.0f} px en el lado mayor. Tómala más cerca o sin recortarla.")
+
+    proporcion = perfil_tipo["proporcion"]
+    if perfil_tipo["horizontal"] and alto_original > ancho_original * 1.1:
+        problema("orientacion", "La credencial está en vertical; gírala o tómala en horizontal.")
+    elif proporcion and not proporcion[0] <= medidas["proporcion"] <= proporcion[1]:
+        problema("proporcion", f"La proporción de la imagen ({medidas['proporcion']}:1) no corresponde al documento; "
+                               "encuádralo completo, sin cortar bordes.")
+
+    nitidez_minima = _umbral(doc_type, perfil_tipo, "nitidez_minima")
+    if medidas["nitidez"] < nitidez_minima:
+        problema("borrosa", f"La imagen está borrosa (nitidez {medidas['nitidez']}, mínimo {nitidez_minima:.0f}). "
+                            "Enfoca el documento y no muevas la cámara al tomarla.")
+
+    if medidas["brillo"] < BRILLO_MINIMO:
+        problema("oscura", "La imagen está muy oscura. Tómala con más luz.")
+    elif medidas["brillo"] > BRILLO_MAXIMO or medidas["quemados"] > QUEMADOS_MAXIMO:
+        problema("sobreexpuesta", "La imagen tiene zonas quemadas por reflejos o exceso de luz. "
+                                  "Evita el flash y la luz directa sobre el documento.")
+    elif medidas["contraste"] < CONTRASTE_MINIMO:
+        problema("contraste", "La imagen tiene muy poco contraste; el texto no se distingue del fondo.")
+
+    return {"problemas": problemas, "medidas": medidas}
+
+
+def mensaje_error(evaluacion: Dict[str, Any]) -> Optional[str]:
+    problemas = evaluacion["problemas"]
+    if not problemas:
+        return None
+    return "La imagen no tiene la calidad suficiente: " + " ".join(p["mensaje"] for p in problemas)
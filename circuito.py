@@ -0,0 +1,133 @@
+import os
+import logging
+import time
+from typing import Dict, Any
+
+logger = logging.getLogger(__name__)
+
+CERRADO = "cerrado"
+ABIERTO = "abierto"
+SEMIABIERTO = "semiabierto"
+
+
+class CircuitoAbierto(Exception):
+    """El procesador está marcado como no disponible; la petición falla de inmediato."""
+
+    def __init__(self, nombre: str, reintentar_en: float):
+        self.nombre = nombre
+        self.reintentar_en = max(reintentar_en, 0.0)
+        super().__init__(
+            f"El procesador '{nombre}' no está disponible temporalmente; reintente en {self.reintentar_en:.0f} s."
+        )
+
+
+class Circuito:
+    """
+    Interruptor de circuito para un procesador de Document AI.
+
+    - cerrado: las llamadas pasan; tras `umbral_fallos` fallos consecutivos se abre.
+    - abierto: las llamadas fallan de inmediato durante `tiempo_apertura` segundos.
+    - semiabierto: se permiten hasta `max_pruebas` llamadas de prueba; si una
+      funciona el circuito se cierra, si falla vuelve a abrirse.
+    """
+
+    def __init__(self, nombre: str, umbral_fallos: int = 5, tiempo_apertura: float = 30.0, max_pruebas: int = 1):
+        self.nombre = nombre
+        self.umbral_fallos = umbral_fallos
+        self.tiempo_apertura = tiempo_apertura
+        self.max_pruebas = max_pruebas
+        self.estado = CERRADO
+        self.fallos_consecutivos = 0
+        self.abierto_desde = 0.0
+        self.pruebas_en_curso = 0
+        self.aperturas = 0
+        self.rechazadas = 0
+
+    def rechazar_si_abierto(self):
+        """Comprobación previa sin ocupar un lugar de prueba: solo falla si está abierto."""
+        if self.estado == ABIERTO:
+            transcurrido = time.monotonic() - self.abierto_desde
+            if transcurrido < self.tiempo_apertura:
+                self.rechazadas += 1
+                raise CircuitoAbierto(self.nombre, self.tiempo_apertura - transcurrido)
+
+    def verificar(self):
+        """Lanza CircuitoAbierto si la llamada no debe pasar."""
+        if self.estado == CERRADO:
+            return
+
+        transcurrido = time.monotonic() - self.abierto_desde
+        if self.estado == ABIERTO:
+            if transcurrido < self.tiempo_apertura:
+                self.rechazadas += 1
+                raise CircuitoAbierto(self.nombre, self.tiempo_apertura - transcurrido)
+            self.estado = SEMIABIERTO
+            self.pruebas_en_curso = 0
+            logger.info("Circuito de %s semiabierto: se permiten llamadas de prueba.", self.nombre)
+
+        # Semiabierto: solo pasan unas cuantas llamadas de prueba a la vez
+        if self.pruebas_en_curso >= self.max_pruebas:
+            self.rechazadas += 1
+            raise CircuitoAbierto(self.nombre, 1.0)
+        self.pruebas_en_curso += 1
+
+    def liberar_prueba(self):
+        """Libera el lugar de una llamada de prueba que terminó sin veredicto (ej. cancelada)."""
+        if self.estado == SEMIABIERTO and self.pruebas_en_curso > 0:
+            self.pruebas_en_curso -= 1
+
+    def registrar_resultado(self, status_code: int):
+        """Los 5xx cuentan como fallo del procesador; cualquier otra respuesta indica que está vivo."""
+        if status_code >= 500:
+            self.registrar_fallo()
+        else:
+            self.registrar_exito()
+
+    def registrar_exito(self):
+        if self.estado != CERRADO:
+            logger.info("Circuito de %s cerrado: el procesador respondió correctamente.", self.nombre)
+        self.estado = CERRADO
+        self.fallos_consecutivos = 0
+        self.pruebas_en_curso = 0
+
+    def registrar_fallo(self):
+        self.fallos_consecutivos += 1
+        if self.estado == SEMIABIERTO or self.fallos_consecutivos >= self.umbral_fallos:
+            if self.estado != ABIERTO:
+                self.aperturas += 1
+                logger.warning("Circuito de %s abierto tras %d fallos consecutivos.", self.nombre, self.fallos_consecutivos)
+            self.estado = ABIERTO
+            self.abierto_desde = time.monotonic()
+            self.pruebas_en_curso = 0
+
+    def resumen(self) -> Dict[str, Any]:
+        resumen = {
+            "estado": self.estado,
+            "fallos_consecutivos": self.fallos_consecutivos,
+            "aperturas": self.aperturas,
+            "rechazadas": self.rechazadas,
+        }
+        if self.estado == ABIERTO:
+            resumen["reintentar_en"] = round(max(self.tiempo_apertura - (time.monotonic() - self.abierto_desde), 0), 1)
+        return resumen
+
+
+_circuitos: Dict[str, Circuito] = {}
+
+
+def obtener_circuito(doc_type: str) -> Circuito:
+    """Circuito del procesador de un tipo de documento (se crea al primer uso)."""
+    circuito = _circuitos.get(doc_type)
+    if circuito is None:
+        circuito = Circuito(
+            doc_type,
+            umbral_fallos=int(os.getenv("CIRCUITO_UMBRAL_FALLOS", "5")),
+            tiempo_apertura=float(os.getenv("CIRCUITO_TIEMPO_APERTURA", "30")),
+            max_pruebas=int(os.getenv("CIRCUITO_MAX_PRUEBAS", "1")),
+        )
+        _circuitos[doc_type] = circuito
+    return circuito
+
+
+def estado_circuitos() -> Dict[str, Any]:
+    return {doc_type: circuito.resumen() for doc_type, circuito in _circuitos.items()}
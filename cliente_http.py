@@ -0,0 +1,111 @@
+import os
+import importlib.util
+import logging
+import httpx
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# Cliente compartido por el worker. Se crea y se cierra en el lifespan de app.py
+_cliente: Optional[httpx.AsyncClient] = None
+
+
+def _http2_disponible() -> bool:
+    """HTTP/2 en httpx requiere el paquete opcional 'h2' (httpx[http2])."""
+    return importlib.util.find_spec("h2") is not None
+
+
+def _configuracion() -> Dict[str, Any]:
+    """Lee la configuración del pool desde variables de entorno."""
+    return {
+        "max_conexiones": int(os.getenv("HTTP_MAX_CONEXIONES", "100")),
+        "max_keepalive": int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+        "keepalive_expiry": float(os.getenv("HTTP_KEEPALIVE_SEGUNDOS", "60")),
+        "timeout": float(os.getenv("HTTP_TIMEOUT_SEGUNDOS", "60")),
+        "timeout_conexion": float(os.getenv("HTTP_TIMEOUT_CONEXION_SEGUNDOS", "10")),
+        "http2": os.getenv("HTTP_HTTP2", "1").lower() in ("1", "true", "si", "yes"),
+    }
+
+
+def iniciar_cliente() -> httpx.AsyncClient:
+    """
+    Crea el httpx.AsyncClient compartido con límites de pool, keep-alive y
+    HTTP/2 opcional. Las conexiones TLS a Document AI se reutilizan entre
+    peticiones en lugar de abrir una nueva por documento.
+    """
+    global _cliente
+    if _cliente is not None and not _cliente.is_closed:
+        return _cliente
+
+    config = _configuracion()
+    http2 = config["http2"] and _http2_disponible()
+    if config["http2"] and not http2:
+        logger.warning("HTTP/2 solicitado pero el paquete 'h2' no está instalado; se usa HTTP/1.1.")
+
+    _cliente = httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=config["max_conexiones"],
+            max_keepalive_connections=config["max_keepalive"],
+            keepalive_expiry=config["keepalive_expiry"],
+        ),
+        timeout=httpx.Timeout(config["timeout"], connect=config["timeout_conexion"]),
+    )
+    logger.info("Cliente HTTP iniciado (http2=%s, max_conexiones=%s).", http2, config["max_conexiones"])
+    return _cliente
+
+
+async def cerrar_cliente():
+    """Cierra el cliente compartido y todas sus conexiones."""
+    global _cliente
+    if _cliente is not None:
+        await _cliente.aclose()
+        _cliente = None
+
+
+def obtener_cliente() -> httpx.AsyncClient:
+    """
+    Devuelve el cliente compartido. Si la app corre sin lifespan (scripts,
+    pruebas manuales) se crea al primer uso.
+    """
+    if _cliente is None or _cliente.is_closed:
+        return iniciar_cliente()
+    return _cliente
+
+
+def estadisticas_pool() -> Dict[str, Any]:
+    """
+    Reporta el estado del pool de conexiones: conexiones abiertas, ocupadas,
+    ociosas, peticiones esperando conexión y nivel de saturación.
+    """
+    if _cliente is None or _cliente.is_closed:
+        return {"activo": False}
+
+    config = _configuracion()
+    estadisticas = {
+        "activo": True,
+        "max_conexiones": config["max_conexiones"],
+        "max_keepalive": config["max_keepalive"],
+    }
+
+    # httpx no expone el pool de httpcore públicamente; si cambia la
+    # estructura interna solo se omiten estos datos.
+    try:
+        pool = _cliente._transport._pool
+        conexiones = list(pool.connections)
+        ociosas = sum(1 for c in conexiones if c.is_idle())
+        ocupadas = len(conexiones) - ociosas
+        estadisticas.update({
+            "conexiones_abiertas": len(conexiones),
+            "conexiones_ocupadas": ocupadas,
+            "conexiones_ociosas": ociosas,
+            "peticiones_en_espera": sum(
+                1 for r in getattr(pool, "_requests", []) if getattr(r, "is_queued", lambda: False)()
+            ),
+            "http2": sum(1 for c in conexiones if "HTTP/2" in repr(c)),
+            "saturacion": round(ocupadas / config["max_conexiones"], 3) if config["max_conexiones"] else None,
+        })
+    except AttributeError:
+        estadisticas["detalle"] = "No disponible para esta versión de httpx."
+
+    return estadisticas
@@ -0,0 +1,126 @@
+import os
+import asyncio
+import logging
+import datetime
+from typing import Optional
+from google.auth import default
+from google.auth.transport.requests import Request
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
+
+# Segundos antes de la expiración en los que se renueva el token
+MARGEN_REFRESCO = 300
+# Espera entre reintentos si la renovación en segundo plano falla
+ESPERA_REINTENTO = 30
+
+
+class ProveedorToken:
+    """
+    Mantiene una sola credencial por proceso y la renueva en segundo plano
+    antes de que expire.
+
+    El refresh de google-auth es bloqueante, así que siempre se ejecuta en un
+    hilo (asyncio.to_thread) y nunca dentro del event loop. Las peticiones
+    concurrentes que encuentran el token vencido comparten el mismo refresh
+    en curso en lugar de lanzar uno cada una.
+
+    Con `token_estatico` no se usa google-auth: se entrega siempre ese token
+    (para el simulador local de Document AI y los benchmarks).
+    """
+
+    def __init__(self, scopes=SCOPES, margen_refresco: int = MARGEN_REFRESCO, token_estatico: Optional[str] = None):
+        self._scopes = scopes
+        self._margen_refresco = margen_refresco
+        self._token_estatico = token_estatico
+        self._credenciales = None
+        self._refresco_en_curso: Optional[asyncio.Task] = None
+        self._tarea_fondo: Optional[asyncio.Task] = None
+
+    def _refrescar_bloqueante(self):
+        """Carga (la primera vez) y renueva la credencial. Se ejecuta en un hilo."""
+        if self._credenciales is None:
+            self._credenciales, _ = default(scopes=self._scopes)
+        self._credenciales.refresh(Request())
+        return self._credenciales.token
+
+    def segundos_restantes(self) -> float:
+        """Segundos de vida que le quedan al token actual (0 si no hay token)."""
+        if self._credenciales is None or not self._credenciales.token:
+            return 0.0
+        expiracion = self._credenciales.expiry
+        if expiracion is None:
+            # Credenciales sin expiración conocida: se consideran vigentes
+            return float("inf")
+        # google-auth maneja la expiración como datetime UTC sin tzinfo
+        ahora = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return (expiracion - ahora).total_seconds()
+
+    def _vigente(self) -> bool:
+        return self.segundos_restantes() > self._margen_refresco
+
+    async def _refrescar(self) -> str:
+        """Renueva el token compartiendo un único refresh entre llamadas concurrentes."""
+        if self._refresco_en_curso is None or self._refresco_en_curso.done():
+            self._refresco_en_curso = asyncio.create_task(
+                asyncio.to_thread(self._refrescar_bloqueante)
+            )
+        # shield: si una petición se cancela no cancela el refresh de las demás
+        return await asyncio.shield(self._refresco_en_curso)
+
+    async def obtener_token(self) -> str:
+        """
+        Devuelve un access token vigente. Solo hace la llamada de red cuando no
+        hay token o está por expirar.
+        """
+        if self._token_estatico:
+            return self._token_estatico
+        self.iniciar()
+        if self._vigente():
+            return self._credenciales.token
+        return await self._refrescar()
+
+    async def _ciclo_refresco(self):
+        """Renueva el token poco antes de que expire, indefinidamente."""
+        while True:
+            try:
+                if not self._vigente():
+                    await self._refrescar()
+                espera = self.segundos_restantes() - self._margen_refresco
+                espera = min(max(espera, 1.0), 3600.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Error al renovar el access token en segundo plano: %s", e)
+                espera = ESPERA_REINTENTO
+            await asyncio.sleep(espera)
+
+    def iniciar(self):
+        """Arranca la tarea de renovación en segundo plano si no está corriendo."""
+        if self._token_estatico:
+            return
+        if self._tarea_fondo is None or self._tarea_fondo.done():
+            self._tarea_fondo = asyncio.get_running_loop().create_task(self._ciclo_refresco())
+
+    async def detener(self):
+        """Cancela la tarea de renovación en segundo plano."""
+        if self._tarea_fondo is not None:
+            self._tarea_fondo.cancel()
+            try:
+                await self._tarea_fondo
+            except asyncio.CancelledError:
+                pass
+            self._tarea_fondo = None
+
+    def obtener_token_sincrono(self) -> str:
+        """Versión bloqueante para scripts fuera del event loop."""
+        if self._token_estatico:
+            return self._token_estatico
+        if not self._vigente():
+            self._refrescar_bloqueante()
+        return self._credenciales.token
+
+
+# Proveedor compartido por todo el proceso
+proveedor_token = ProveedorToken(token_estatico=os.getenv("DOCUMENT_AI_TOKEN_ESTATICO") or None)
@@ -0,0 +1,149 @@
+import io
+import os
+import json
+import base64
+import hashlib
+import threading
+import ejecutores
+from typing import AsyncIterator, BinaryIO, Dict, Optional, Union
+
+# Bytes crudos por bloque; múltiplo de 3 para que cada bloque se codifique en
+# Base64 sin relleno intermedio
+TAMANO_BLOQUE = int(os.getenv("STREAM_BLOQUE_BYTES", str(3 * 64 * 1024))) // 3 * 3
+# Archivos hasta este tamaño se copian a memoria al crear una fuente
+# independiente; los mayores comparten el archivo con un descriptor propio.
+# Coincide con el tamaño en que el upload de Starlette pasa de memoria a disco.
+TAMANO_COPIA_MEMORIA = int(os.getenv("STREAM_COPIA_MEMORIA_BYTES", str(1024 * 1024)))
+
+
+class FuenteDocumento:
+    """
+    Contenido de un documento que se puede leer por bloques sin cargarlo
+    completo en memoria: bytes ya en memoria, una ruta local, un archivo
+    binario abierto (el SpooledTemporaryFile de un UploadFile) o un
+    descriptor de archivo propio, que se cierra con la fuente.
+
+    Cada lectura indica su propio desplazamiento, así que varias lecturas
+    concurrentes (reintentos o peticiones de cobertura) no se estorban.
+    """
+
+    def __init__(self, origen: Union[bytes, bytearray, str, int, BinaryIO]):
+        self._bytes: Optional[memoryview] = None
+        self._archivo: Optional[BinaryIO] = None
+        self._ruta: Optional[str] = None
+        self._descriptor: Optional[int] = None
+        self._candado = threading.Lock()
+
+        if isinstance(origen, (bytes, bytearray)):
+            self._bytes = memoryview(origen)
+        elif isinstance(origen, int):
+            self._descriptor = origen
+            self._tamano = os.fstat(origen).st_size
+        elif isinstance(origen, str):
+            self._ruta = origen
+            self._archivo = open(origen, "rb")
+        else:
+            self._archivo = origen
+
+        if self._archivo is not None:
+            with self._candado:
+                self._archivo.seek(0, os.SEEK_END)
+                self._tamano = self._archivo.tell()
+        elif self._bytes is not None:
+            self._tamano = len(self._bytes)
+
+    @property
+    def en_memoria(self) -> bool:
+        return self._bytes is not None
+
+    def tamano(self) -> int:
+        return self._tamano
+
+    def leer(self, desplazamiento: int, cantidad: int) -> bytes:
+        """Lee `cantidad` bytes a partir de `desplazamiento` (bloqueante si es archivo)."""
+        if self._bytes is not None:
+            return self._bytes[desplazamiento:desplazamiento + cantidad].tobytes()
+        if self._descriptor is not None:
+            # pread no usa la posición del descriptor, que comparte con el original
+            return os.pread(self._descriptor, cantidad, desplazamiento)
+        with self._candado:
+            self._archivo.seek(desplazamiento)
+            return self._archivo.read(cantidad)
+
+    def inicio(self, cantidad: int = 16) -> bytes:
+        """Primeros bytes, para detectar el tipo MIME por su firma."""
+        return self.leer(0, cantidad)
+
+    def sha256(self) -> str:
+        """Hash SHA-256 calculado por bloques (bloqueante si es archivo)."""
+        if self._bytes is not None:
+            return hashlib.sha256(self._bytes).hexdigest()
+        hash_sha = hashlib.sha256()
+        for desplazamiento in range(0, self._tamano, TAMANO_BLOQUE):
+            hash_sha.update(self.leer(desplazamiento, TAMANO_BLOQUE))
+        return hash_sha.hexdigest()
+
+    def a_bytes(self) -> bytes:
+        """Contenido completo en memoria (solo para etapas que decodifican la imagen)."""
+        if self._bytes is not None:
+            return self._bytes.tobytes()
+        return self.leer(0, self._tamano)
+
+    def independiente(self) -> "FuenteDocumento":
+        """
+        Fuente con su propio acceso al contenido, que sigue siendo legible
+        aunque se cierre el upload o se borre el archivo de esta fuente. El
+        llamador debe cerrarla.
+        """
+        if self._bytes is not None:
+            # bytes es inmutable; un bytearray se copia
+            return FuenteDocumento(self._bytes.obj if isinstance(self._bytes.obj, bytes) else self._bytes.tobytes())
+        if self._descriptor is not None:
+            return FuenteDocumento(os.dup(self._descriptor))
+        if self._tamano > TAMANO_COPIA_MEMORIA:
+            try:
+                # El descriptor duplicado mantiene vivo el archivo aunque se borre
+                return FuenteDocumento(os.dup(self._archivo.fileno()))
+            except (AttributeError, OSError, io.UnsupportedOperation):
+                pass
+        return FuenteDocumento(self.a_bytes())
+
+    def cerrar(self):
+        # Solo se cierran los archivos que abrió esta clase
+        if self._ruta is not None and self._archivo is not None:
+            self._archivo.close()
+        if self._descriptor is not None:
+            os.close(self._descriptor)
+            self._descriptor = None
+
+
+def _envoltura(mime_type: str, campos_extra: Optional[Dict[str, str]] = None):
+    """Prefijo y sufijo del JSON de la petición alrededor del contenido Base64."""
+    extra = "".join(f"{json.dumps(clave)}: {json.dumps(valor)}, " for clave, valor in (campos_extra or {}).items())
+    prefijo = f'{{{extra}"rawDocument": {{"mimeType": {json.dumps(mime_type)}, "content": "'.encode("utf-8")
+    sufijo = b'"}}'
+    return prefijo, sufijo
+
+
+def longitud_cuerpo(fuente: FuenteDocumento, mime_type: str, campos_extra: Optional[Dict[str, str]] = None) -> int:
+    """Longitud exacta del cuerpo JSON, para enviar Content-Length en vez de chunked."""
+    prefijo, sufijo = _envoltura(mime_type, campos_extra)
+    return len(prefijo) + 4 * ((fuente.tamano() + 2) // 3) + len(sufijo)
+
+
+async def generar_cuerpo(fuente: FuenteDocumento, mime_type: str,
+                         campos_extra: Optional[Dict[str, str]] = None) -> AsyncIterator[bytes]:
+    """
+    Genera el cuerpo JSON de la petición a Document AI como un flujo de bytes:
+    el documento se lee y se codifica en Base64 bloque por bloque, así que la
+    memoria pico es del orden de TAMANO_BLOQUE y no del tamaño del archivo.
+    """
+    prefijo, sufijo = _envoltura(mime_type, campos_extra)
+    yield prefijo
+    for desplazamiento in range(0, fuente.tamano(), TAMANO_BLOQUE):
+        if fuente.en_memoria:
+            bloque = fuente.leer(desplazamiento, TAMANO_BLOQUE)
+        else:
+            bloque = await ejecutores.en_hilo(fuente.leer, desplazamiento, TAMANO_BLOQUE)
+        yield base64.b64encode(bloque)
+    yield sufijo
@@ -0,0 +1,74 @@
+import json
+from typing import Any, Dict, List, Optional
+
+# Decodificadores rápidos opcionales; se usa el mejor disponible
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if msgspec is not None:
+    class _Documento(msgspec.Struct):
+        # Solo se materializan las entidades; 'text', 'pages', etc. se
+        # recorren sin crear objetos de Python
+        entities: List[Dict[str, Any]] = []
+
+    class _RespuestaProceso(msgspec.Struct):
+        document: Optional[_Documento] = None
+
+    _decodificador_msgspec = msgspec.json.Decoder(_RespuestaProceso)
+
+
+def motor() -> str:
+    """Nombre del decodificador en uso."""
+    if msgspec is not None:
+        return "msgspec"
+    if orjson is not None:
+        return "orjson"
+    return "json"
+
+
+def extraer_entidades(cuerpo: bytes) -> List[Dict[str, Any]]:
+    """
+    Decodifica la respuesta de Document AI y devuelve solo `document.entities`.
+
+    Con msgspec el resto del documento (texto OCR, imágenes Base64 de las
+    páginas) no se convierte a objetos de Python. Con orjson o json se
+    decodifica todo y se descarta lo que no son entidades.
+
+    Raises:
+        KeyError si la respuesta no contiene el nodo 'document'.
+        ValueError si el cuerpo no es JSON válido.
+    """
+    if msgspec is not None:
+        try:
+            respuesta = _decodificador_msgspec.decode(cuerpo)
+        except msgspec.ValidationError as e:
+            raise ValueError(f"Respuesta de Document AI inesperada: {e}") from e
+        except msgspec.DecodeError as e:
+            raise ValueError(f"Respuesta de Document AI no es JSON válido: {e}") from e
+        if respuesta.document is None:
+            raise KeyError("document")
+        return respuesta.document.entities
+
+    data_json = orjson.loads(cuerpo) if orjson is not None else json.loads(cuerpo)
+    return data_json["document"].get("entities", [])
+
+
+def decodificar_respuesta(cuerpo: bytes) -> Dict[str, Any]:
+    """
+    Respuesta reducida con la misma forma que la original ({'document':
+    {'entities': [...]}}), lista para herramientas.obtener_datos_completos.
+    Si falta el nodo 'document' se devuelve un diccionario vacío, igual que
+    una respuesta sin ese nodo.
+    """
+    try:
+        return {"document": {"entities": extraer_entidades(cuerpo)}}
+    except KeyError:
+        return {}
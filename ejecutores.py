@@ -0,0 +1,185 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import functools
+import contextvars
+import multiprocessing
+from typing import Any, Callable, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Hilos para trabajo que libera el GIL (hash, Base64, PIL, zlib, E/S de
+# disco, sqlite, refresh del token)
+HILOS = int(os.getenv("EJECUTOR_HILOS", str(min(32, (os.cpu_count() or 1) + 4))))
+# Procesos para rasterizar PDFs: MuPDF no libera el GIL, así que en un hilo
+# frenaría al event loop. 0 renderiza en el hilo que llama. PDF_TRABAJADORES
+# se acepta por compatibilidad.
+PROCESOS = int(os.getenv("EJECUTOR_PROCESOS") or os.getenv("PDF_TRABAJADORES") or str(min(4, os.cpu_count() or 1)))
+# Por debajo de este tamaño el trabajo se hace en el event loop: mandarlo a
+# un hilo cuesta más que hacerlo
+UMBRAL_BYTES = int(os.getenv("EJECUTOR_UMBRAL_BYTES", str(256 * 1024)))
+
+
+class PoolHilos(ThreadPoolExecutor):
+    """ThreadPoolExecutor que lleva la cuenta de tareas en cola, activas y del tiempo de espera."""
+
+    def __init__(self, max_workers: int):
+        super().__init__(max_workers=max_workers, thread_name_prefix="rad")
+        self._candado_conteo = threading.Lock()
+        self.en_cola = 0
+        self.activas = 0
+        self.completadas = 0
+        self.espera_total = 0.0
+
+    def submit(self, fn, /, *args, **kwargs):
+        encolada = time.monotonic()
+        with self._candado_conteo:
+            self.en_cola += 1
+
+        def medida():
+            with self._candado_conteo:
+                self.en_cola -= 1
+                self.activas += 1
+                self.espera_total += time.monotonic() - encolada
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._candado_conteo:
+                    self.activas -= 1
+                    self.completadas += 1
+
+        return super().submit(medida)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._candado_conteo:
+            iniciadas = self.completadas + self.activas
+            return {
+                "maximo": self._max_workers,
+                "activas": self.activas,
+                "en_cola": self.en_cola,
+                "completadas": self.completadas,
+                "saturacion": round(self.activas / self._max_workers, 2),
+                "espera_promedio_ms": round(self.espera_total / iniciadas * 1000, 2) if iniciadas else None,
+            }
+
+
+class PoolProcesos(ProcessPoolExecutor):
+    """
+    ProcessPoolExecutor con conteo de tareas pendientes. Desde el proceso
+    padre no se distingue la tarea en cola de la que se ejecuta, así que la
+    cola se estima como lo pendiente que excede el número de procesos.
+    """
+
+    def __init__(self, max_workers: int):
+        # 'spawn' evita heredar hilos y locks del proceso del servidor
+        super().__init__(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+        self._candado_conteo = threading.Lock()
+        self._procesos_maximos = max_workers
+        self.pendientes = 0
+        self.completadas = 0
+
+    def submit(self, fn, /, *args, **kwargs):
+        futuro = super().submit(fn, *args, **kwargs)
+        with self._candado_conteo:
+            self.pendientes += 1
+        futuro.add_done_callback(self._terminada)
+        return futuro
+
+    def _terminada(self, _futuro):
+        with self._candado_conteo:
+            self.pendientes -= 1
+            self.completadas += 1
+
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._candado_conteo:
+            return {
+                "maximo": self._procesos_maximos,
+                "pendientes": self.pendientes,
+                "en_cola": max(self.pendientes - self._procesos_maximos, 0),
+                "completadas": self.completadas,
+                "saturacion": round(min(self.pendientes, self._procesos_maximos) / self._procesos_maximos, 2),
+            }
+
+
+_hilos: Optional[PoolHilos] = None
+_procesos: Optional[PoolProcesos] = None
+_candado = threading.Lock()
+
+
+def pool_hilos() -> PoolHilos:
+    global _hilos
+    with _candado:
+        if _hilos is None:
+            _hilos = PoolHilos(HILOS)
+        return _hilos
+
+
+def pool_procesos() -> Optional[PoolProcesos]:
+    """Pool de procesos compartido (se crea al primer uso), o None si PROCESOS es 0."""
+    global _procesos
+    if PROCESOS <= 0:
+        return None
+    with _candado:
+        if _procesos is None:
+            _procesos = PoolProcesos(PROCESOS)
+        return _procesos
+
+
+async def en_hilo(funcion: Callable, *args, **kwargs) -> Any:
+    """
+    Equivalente a asyncio.to_thread sobre el pool compartido: conserva el
+    contexto (id de correlación) y cuenta en las estadísticas.
+    """
+    contexto = contextvars.copy_context()
+    llamada = functools.partial(contexto.run, funcion, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(pool_hilos(), llamada)
+
+
+async def en_hilo_si_grande(tamano: int, funcion: Callable, *args, **kwargs) -> Any:
+    """Ejecuta en el pool de hilos solo si `tamano` supera UMBRAL_BYTES; si no, en línea."""
+    if tamano < UMBRAL_BYTES:
+        return funcion(*args, **kwargs)
+    return await en_hilo(funcion, *args, **kwargs)
+
+
+async def en_proceso(funcion: Callable, *args) -> Any:
+    """
+    Ejecuta `funcion` (de nivel de módulo, con argumentos serializables) en
+    el pool de procesos. Sin pool (PROCESOS=0) se ejecuta en el pool de hilos.
+    """
+    pool = pool_procesos()
+    if pool is None:
+        return await en_hilo(funcion, *args)
+    return await asyncio.get_running_loop().run_in_executor(pool, functools.partial(funcion, *args))
+
+
+def iniciar():
+    """
+    Usa el pool de hilos como ejecutor por defecto del event loop, para que
+    asyncio.to_thread y run_in_executor(None, ...) de las librerías también
+    pasen por él.
+    """
+    asyncio.get_running_loop().set_default_executor(pool_hilos())
+    logger.info("Ejecutores iniciados (hilos=%d, procesos=%d).", HILOS, PROCESOS)
+
+
+def cerrar():
+    """Cierra ambos pools; las tareas en curso terminan antes de regresar."""
+    global _hilos, _procesos
+    with _candado:
+        hilos, procesos = _hilos, _procesos
+        _hilos = _procesos = None
+    if procesos is not None:
+        procesos.shutdown(wait=True, cancel_futures=True)
+    if hilos is not None:
+        hilos.shutdown(wait=True, cancel_futures=True)
+
+
+def estadisticas() -> Dict[str, Any]:
+    return {
+        "hilos": _hilos.estadisticas() if _hilos is not None else None,
+        "procesos": _procesos.estadisticas() if _procesos is not None else None,
+    }
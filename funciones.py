@@ -1,143 +1,639 @@
+import os
+import time
+import logging
 import httpx
+import asyncio
+import tempfile
+import bitacora
+import ejecutores
 import herramientas
-from fastapi import UploadFile
-from google.auth import default
-from typing import Optional, Union
-from google.auth.transport.requests import Request
-
-SCOPES = ["https://www.googleapis.com/auth/cloud-platform"]
-
-# Mapeo de endpoints por tipo de documento
-ENDPOINTS = {
-    "pasaporte": "https://us-documentai.googleapis.com/v1/projects/62740263137/locations/us/processors/24ee194a233ec5cc:process",  # Endpoint entrenado
-    "fm": "https://us-documentai.googleapis.com/v1/projects/62740263137/locations/us/processors/edfba1d1c9ed6145:process",  # Endpoint Formas Migratorias
-    "csf": "https://us-documentai.googleapis.com/v1/projects/62740263137/locations/us/processors/339fc7810b01699b:process",  # Endpoint Sat CSF
-    "cedula": "https://us-documentai.googleapis.com/v1/projects/62740263137/locations/us/processors/2da02220d55dabf1/processorVersions/pretrained-foundation-model-v1.5-pro-2025-06-20:process",  # Nuevo
-    "ine": "https://us-documentai.googleapis.com/v1/projects/62740263137/locations/us/processors/bf35151f51b51521:process",  # INE
-}
-
-# Mapeo de MIME types por tipo de documento
-MIME_TYPES = {
-    "pasaporte": "image/png",     # Imagen
-    "fm": "image/png",             # Imagen
-    "csf": "image/png",            # Imagen
-    "cedula": "application/pdf",   # PDF
-    "ine": "image/jpeg",           # JPG
-}
-
-# Variables legadas para compatibilidad
-ENDPOINT_URL = ENDPOINTS["pasaporte"]
-ENDPOINT_FM = ENDPOINTS["fm"]
-ENDPOINT_CSF = ENDPOINTS["csf"]
-ENDPOINT_CEDULA = ENDPOINTS["cedula"]
-ENDPOINT_INE = ENDPOINTS["ine"]
+import texto_pdf
+import huellas
+import procesadores
+import calidad_imagen
+import cuerpo_documento
+import preprocesamiento
+import limitador
+import limite_carga
+import resiliencia
+import decodificador
+import metricas
+import circuito
+import cliente_http
+import cache_resultados
+from vuelo_unico import VueloUnico
+from pathlib import Path
+from fastapi import HTTPException, UploadFile
+from typing import Optional, Union, List, Tuple, Dict, Any
+from credenciales import proveedor_token
+
+logger = logging.getLogger(__name__)
+
+# PDFs mayores a este tamaño (bytes) que se envían como imagen se rasterizan
+# con archivos temporales en TEMP_DIR_ROOT en lugar de memoria (ver
+# _procesa_pdf_con_temporales). 0 deshabilita el modo con archivos temporales.
+UMBRAL_ARCHIVO_TEMPORAL = int(os.getenv("PDF_UMBRAL_ARCHIVO_TEMPORAL", "0"))
+TEMP_DIR_ROOT = os.getenv("TEMP_DIR_ROOT") or tempfile.gettempdir()
+
+# Documentos procesados en paralelo dentro de un mismo lote y tamaño máximo del lote
+LOTE_CONCURRENCIA = int(os.getenv("LOTE_CONCURRENCIA", "4"))
+LOTE_MAX_ELEMENTOS = int(os.getenv("LOTE_MAX_ELEMENTOS", "10"))
+
+# Cómo se envía a Document AI cada tipo de documento PDF. El registro de
+# procesadores define "pdf": {"estrategia", "paginas", "dpi"} por tipo y
+# ESTRATEGIA_<TIPO>, PAGINAS_<TIPO> y DPI_<TIPO> lo sobreescriben:
+#  - "pdf": el PDF original como application/pdf. Document AI lo procesa de
+#    forma nativa y pesa mucho menos que las páginas rasterizadas.
+#  - "paginas": solo las páginas indicadas (ej. "1-2"), como PDF.
+#  - "imagen": todas las páginas unidas en un PNG al DPI indicado.
+#  - "imagen_adaptativa": igual, con el DPI elegido según el tamaño del texto.
+# La CSF usa "imagen": su procesador entrenado solo ha recibido PNG unidos.
+# ESTRATEGIA_CSF=pdf la envía nativa, pendiente de validar contra ese
+# procesador.
+ESTRATEGIAS_PDF = procesadores.ESTRATEGIAS_PDF
+
+
+def _config_pdf(doc_type: str, nombre: str) -> str:
+    """Valor de "pdf" del registro para el tipo, sobreescribible con <NOMBRE>_<TIPO>."""
+    valor = os.getenv(f"{nombre.upper()}_{doc_type.upper()}")
+    if valor is not None:
+        return valor
+    tipo = procesadores.tipo(doc_type)
+    return str(tipo.pdf[nombre]) if tipo is not None else ""
+
+
+def estrategia_pdf(doc_type: str) -> str:
+    estrategia = _config_pdf(doc_type, "estrategia") or "pdf"
+    if estrategia not in ESTRATEGIAS_PDF:
+        raise ValueError(f"ESTRATEGIA_{doc_type.upper()}={estrategia!r} no es válida. Opciones: {list(ESTRATEGIAS_PDF)}")
+    return estrategia
+
+
+def paginas_pdf(doc_type: str) -> str:
+    return _config_pdf(doc_type, "paginas") or "1"
+
+
+def dpi_pdf(doc_type: str) -> int:
+    return int(_config_pdf(doc_type, "dpi") or 150)
+
+
+# Un valor inválido en el entorno se detecta al arrancar y no en la primera petición
+for _tipo in procesadores.tipos().values():
+    if _tipo.es_pdf:
+        estrategia_pdf(_tipo.nombre)
+
+# Campos del documento que Document AI debe incluir en la respuesta ("" = todos)
+FIELD_MASK = os.getenv("DOCUMENT_AI_FIELD_MASK", "entities")
+
+# Coalescencia de llamadas idénticas en curso (misma clave de contenido)
+_vuelo_unico = VueloUnico()
 
 
 async def procesa_documento(
-    file: Union[UploadFile, str],
+    file: Union[UploadFile, str, bytes],
     doc_type: str,
-    mime_type_override: Optional[str] = None
+    mime_type_override: Optional[str] = None,
+    deadline: Optional[float] = None,
+    umbral_confianza: Optional[float] = None,
+    detallado: bool = False
 ):
     """
     Función genérica para procesar documentos con Google Document AI.
     
     Args:
-        file: UploadFile (para endpoints que reciben upload) o ruta string (para archivos locales)
-        doc_type: Tipo de documento ("pasaporte", "fm", "csf", "cedula")
-        mime_type_override: Tipo MIME personalizado (opcional, por defecto se detecta del archivo)
+        file: UploadFile (para endpoints que reciben upload), bytes (contenido ya en memoria)
+              o ruta string (para archivos locales)
+        doc_type: Tipo de documento del registro de procesadores (procesadores.json)
+        mime_type_override: Tipo MIME personalizado (opcional, por defecto se detecta del contenido)
+        deadline: Instante límite (time.monotonic) para responder. Por defecto se
+                  usa el presupuesto de latencia del tipo de documento.
+        umbral_confianza: Descarta entidades con confianza menor (opcional)
+        detallado: Si es True cada entidad incluye valor, confianza y valor normalizado
     
     Returns:
-        Diccionario con entidades extraídas o error
+        Diccionario con entidades extraídas o error. Los resultados exitosos
+        incluyen "_cache": "hit" (cache), "miss" (llamada propia a Document AI)
+        o "coalesced" (llamada compartida con una petición idéntica en curso),
+        o "similar" (resultado de una imagen casi idéntica, con HUELLAS_MODO=
+        reutilizar). Si la imagen se parece a una ya procesada se agrega
+        "_duplicado": {"distancia": bits distintos de la huella}. Una foto
+        con problemas de calidad (CALIDAD_MODO=marcar) agrega "_calidad":
+        {"problemas": [códigos], "medidas": {...}}.
+        procesa_pdf agrega "local" (extraído de la capa de texto del PDF).
     """
     # Validar tipo de documento
-    if doc_type not in ENDPOINTS:
-        return {"error": f"Tipo de documento no soportado: {doc_type}. Opciones: {list(ENDPOINTS.keys())}"}
+    tipo = procesadores.tipo(doc_type)
+    if tipo is None:
+        return {"error": f"Tipo de documento no soportado: {doc_type}. Opciones: {list(procesadores.tipos())}"}
     
-    endpoint_url = ENDPOINTS[doc_type]
+    # Con varias versiones del procesador, cada petición va a una según su peso
+    version = tipo.elegir_version()
+    if deadline is None:
+        deadline = resiliencia.calcular_deadline(doc_type)
     
-    # Obtener credenciales y token
-    credentials, _ = default(scopes=SCOPES)
-    credentials.refresh(Request())
-    access_token = credentials.token
-    print(f"Access token obtenido para {doc_type}")
-    
-    #Obtengo base64 y MIME type según el tipo de entrada
+    #Obtengo una fuente legible por bloques según el tipo de entrada; el
+    #archivo no se carga completo en memoria salvo que haya que decodificarlo
     try:
-        if isinstance(file, str):
+        if isinstance(file, (bytes, bytearray)):
+            # Contenido ya en memoria (ej. imagen generada a partir de un PDF)
+            fuente = cuerpo_documento.FuenteDocumento(file)
+            mime_respaldo = tipo.mime_respaldo
+        elif isinstance(file, str):
             # Es una ruta de archivo local
-            base64_content = herramientas.archivo_local_a_base64(file)
-            mime_type = mime_type_override or MIME_TYPES.get(doc_type, "image/png")
+            fuente = await ejecutores.en_hilo(cuerpo_documento.FuenteDocumento, file)
+            mime_respaldo = tipo.mime_respaldo
         else:
-            # Es un UploadFile
-            base64_content = await herramientas.upload_a_base64(file)
-            mime_type = mime_type_override or MIME_TYPES.get(doc_type, file.content_type or "application/octet-stream")
+            # Es un UploadFile: se lee directo de su archivo temporal
+            fuente = cuerpo_documento.FuenteDocumento(file.file)
+            mime_respaldo = file.content_type or tipo.mime_respaldo
     except Exception as e:
         return {"error": f"Error al procesar archivo: {e}"}
-    
-    print(f"MIME type para {doc_type}: {mime_type}")
-    
-    # Estructura del JSON para Document AI
-    processor_json = {
-        "rawDocument": {
-            "mimeType": mime_type,
-            "content": base64_content
-        }
-    }
 
-    # Definir las cabeceras con el token de autenticación
+    try:
+        with metricas.en_vuelo(doc_type):
+            entidades = await _procesa_fuente(fuente, doc_type, version, mime_type_override, mime_respaldo, deadline)
+    finally:
+        fuente.cerrar()
+
+    if "error" in entidades:
+        return entidades
+
+    # Cache y llamada comparten la forma detallada; aquí se da la forma pedida
+    origen = entidades.pop("_cache")
+    duplicado = entidades.pop("_duplicado", None)
+    calidad = entidades.pop("_calidad", None)
+    entidades = herramientas.formatear_datos_detallados(entidades, umbral_confianza, detallado)
+    entidades["_cache"] = origen
+    if duplicado is not None:
+        entidades["_duplicado"] = duplicado
+    if calidad is not None:
+        entidades["_calidad"] = calidad
+    return entidades
+
+
+async def _procesa_fuente(fuente, doc_type: str, version: procesadores.Version, mime_type_override: Optional[str],
+                          mime_respaldo: str, deadline: float):
+    """
+    Cache, coalescencia y llamada a Document AI para una fuente ya abierta.
+    Devuelve las entidades en forma detallada (valor, confianza, normalizado).
+    """
+    # El MIME real se detecta del contenido; el mapeo fijo es solo respaldo
+    mime_type = mime_type_override or preprocesamiento.detectar_mime(fuente.inicio(), mime_respaldo)
+    metricas.registrar_documento(doc_type, "recibido", fuente.tamano())
+
+    with metricas.etapa(metricas.CACHE, doc_type):
+        # El hash se calcula por bloques; para archivos en disco o documentos
+        # grandes, fuera del event loop
+        if fuente.en_memoria:
+            sha256 = await ejecutores.en_hilo_si_grande(fuente.tamano(), fuente.sha256)
+        else:
+            sha256 = await ejecutores.en_hilo(fuente.sha256)
+
+        # Cache direccionado por contenido: un reenvío del mismo archivo no llama a Document AI
+        clave = cache_resultados.construir_clave(doc_type, version.url, sha256)
+        resultado_cache = None
+        if cache_resultados.cache is not None:
+            resultado_cache = await cache_resultados.cache.obtener(clave)
+
+    if resultado_cache is not None:
+        logger.info("Resultado en cache", extra={"doc_type": doc_type})
+        metricas.registrar_cache(doc_type, "hit")
+        resultado_cache["_cache"] = "hit"
+        return resultado_cache
+
+    contenido = None
+    if calidad_imagen.aplica(doc_type, mime_type) or huellas.aplica(doc_type, mime_type):
+        contenido = fuente.a_bytes() if fuente.en_memoria else await ejecutores.en_hilo(fuente.a_bytes)
+
+    # Fotos que Document AI probablemente no va a poder leer: con
+    # CALIDAD_MODO=rechazar se responden sin llamarlo, con un mensaje que le
+    # dice al usuario qué corregir; si no, solo se marcan en la respuesta
+    calidad = None
+    if calidad_imagen.aplica(doc_type, mime_type):
+        with metricas.etapa(metricas.CALIDAD, doc_type):
+            evaluacion = await ejecutores.en_hilo(calidad_imagen.evaluar, contenido, doc_type)
+        error_calidad = calidad_imagen.mensaje_error(evaluacion)
+        if error_calidad:
+            codigos = [p["codigo"] for p in evaluacion["problemas"]]
+            if calidad_imagen.MODO == "rechazar":
+                logger.info("Imagen rechazada por calidad", extra={
+                    "doc_type": doc_type, "problemas": codigos, **evaluacion["medidas"],
+                })
+                metricas.registrar_rechazo_calidad(doc_type, codigos)
+                return {"error": error_calidad, "calidad": evaluacion}
+            logger.info("Imagen con problemas de calidad", extra={
+                "doc_type": doc_type, "problemas": codigos, **evaluacion["medidas"],
+            })
+            metricas.registrar_marca_calidad(doc_type, codigos)
+            calidad = {"problemas": codigos, "medidas": evaluacion["medidas"]}
+
+    # Casi duplicados (la misma foto re-codificada o vuelta a tomar) que el
+    # hash de bytes no reconoce
+    huella = duplicado = None
+    if huellas.aplica(doc_type, mime_type):
+        with metricas.etapa(metricas.HUELLA, doc_type):
+            huella = await ejecutores.en_hilo(huellas.calcular, contenido)
+        if huella is not None:
+            duplicado = huellas.buscar(doc_type, huella)
+        if duplicado is not None and huellas.MODO == "reutilizar" and cache_resultados.cache is not None:
+            clave_similar, distancia = duplicado
+            resultado_similar = await cache_resultados.cache.obtener(clave_similar)
+            if resultado_similar is not None:
+                logger.info("Resultado de una imagen casi idéntica", extra={"doc_type": doc_type, "distancia": distancia})
+                metricas.registrar_cache(doc_type, "similar")
+                resultado_similar["_cache"] = "similar"
+                resultado_similar["_duplicado"] = {"distancia": distancia}
+                return resultado_similar
+
+    # Peticiones idénticas concurrentes comparten una sola llamada a Document AI.
+    # Cada petición espera el resultado compartido solo hasta su propio deadline;
+    # la llamada no depende de la petición que la lanzó (ver _extraer_y_guardar).
+    try:
+        entidades, compartido = await asyncio.wait_for(
+            _vuelo_unico.ejecutar(
+                clave,
+                lambda plazo: _extraer_y_guardar(doc_type, version, fuente.independiente(), mime_type, clave, plazo),
+                deadline
+            ),
+            timeout=max(resiliencia.tiempo_restante(deadline), 0)
+        )
+    except asyncio.TimeoutError:
+        return {"error": f"Tiempo límite agotado para {doc_type}."}
+    # Cada petición recibe su propia copia del resultado compartido
+    entidades = dict(entidades)
+    if "error" not in entidades:
+        entidades["_cache"] = "coalesced" if compartido else "miss"
+        metricas.registrar_cache(doc_type, entidades["_cache"])
+        if duplicado is not None:
+            entidades["_duplicado"] = {"distancia": duplicado[1]}
+        if calidad is not None:
+            entidades["_calidad"] = calidad
+        if huella is not None and not compartido and entidades.keys() - {"_cache", "_duplicado", "_calidad"}:
+            huellas.agregar(doc_type, huella, clave)
+    return entidades
+
+
+async def _extraer_y_guardar(doc_type: str, version: procesadores.Version, fuente, mime_type: str, clave: str,
+                             plazo: resiliencia.Plazo):
+    """
+    Llama a Document AI y guarda el resultado en el cache antes de liberar a
+    las peticiones que esperan la misma clave.
+
+    Es la operación compartida de la coalescencia, así que no depende de la
+    petición que la lanzó: `fuente` es una copia independiente que se cierra
+    aquí (el upload o el archivo temporal de esa petición pueden cerrarse o
+    borrarse antes) y `plazo` llega hasta el deadline más lejano de las
+    peticiones que la esperan (ver vuelo_unico). Cada petición deja de
+    esperar al llegar a su propio deadline, y cuando ya no queda ninguna la
+    llamada se cancela.
+    """
+    try:
+        return await _extraer_y_guardar_fuente(doc_type, version, fuente, mime_type, clave, plazo)
+    finally:
+        fuente.cerrar()
+
+
+async def _extraer_y_guardar_fuente(doc_type: str, version: procesadores.Version, fuente, mime_type: str,
+                                    clave: str, deadline: Union[float, resiliencia.Plazo]):
+    # Reducir el payload antes de codificarlo (orientación, resolución, formato).
+    # Solo las imágenes se decodifican completas; los PDFs se envían en streaming.
+    if mime_type.startswith("image/"):
+        contenido = fuente.a_bytes() if fuente.en_memoria else await ejecutores.en_hilo(fuente.a_bytes)
+        with metricas.etapa(metricas.PREPROCESAMIENTO, doc_type):
+            contenido, mime_type, resumen = await ejecutores.en_hilo(
+                preprocesamiento.preprocesar_imagen, contenido, doc_type
+            )
+        fuente = cuerpo_documento.FuenteDocumento(contenido)
+        if resumen["aplicado"]:
+            ahorro = resumen["bytes_originales"] - resumen["bytes_finales"]
+            logger.info(
+                "Imagen preprocesada",
+                extra={
+                    "doc_type": doc_type,
+                    "bytes_originales": resumen["bytes_originales"],
+                    "bytes_finales": resumen["bytes_finales"],
+                    "ahorro_bytes": ahorro,
+                },
+            )
+
+    entidades = await _llamar_document_ai(doc_type, version, fuente, mime_type, deadline)
+
+    # Solo se guardan extracciones con contenido; un resultado vacío puede ser transitorio
+    if cache_resultados.cache is not None and entidades and "error" not in entidades:
+        await cache_resultados.cache.guardar(clave, entidades)
+    return entidades
+
+
+async def _llamar_document_ai(doc_type: str, version: procesadores.Version, fuente, mime_type: str,
+                              deadline: Union[float, resiliencia.Plazo]):
+    """
+    Envía el documento al procesador y devuelve las entidades aplanadas o un
+    diccionario de error. Los errores transitorios se reintentan mientras
+    quede tiempo antes de `deadline`.
+
+    Raises:
+        circuito.CircuitoAbierto si el procesador está marcado como no disponible.
+    """
+    # Procesador marcado como caído: se falla de inmediato sin pedir token ni esperar timeout
+    # Cada versión del procesador tiene su propio circuito, limitador y
+    # latencias, así un canario con fallas no afecta a la versión estable
+    circuito_procesador = circuito.obtener_circuito(version.procesador)
+    circuito_procesador.rechazar_si_abierto()
+
+    # Token compartido por el proceso; solo se renueva cuando está por expirar
+    try:
+        with metricas.etapa(metricas.TOKEN, doc_type):
+            access_token = await proveedor_token.obtener_token()
+    except Exception as e:
+        return {"error": f"Error al obtener credenciales: {e}"}
+    logger.debug("Llamando a Document AI", extra={"doc_type": doc_type, "mime_type": mime_type})
+
+    # La máscara de campos evita que Document AI devuelva el texto OCR y las
+    # imágenes de las páginas, que no se usan
+    campos_extra = {"fieldMask": FIELD_MASK} if FIELD_MASK else None
+
+    # Definir las cabeceras con el token de autenticación. El cuerpo JSON se
+    # genera en streaming, así que se declara su longitud exacta
     headers = {
         "Authorization": f"Bearer {access_token}",
-        "Content-Type": "application/json; charset=utf-8"
+        "Content-Type": "application/json; charset=utf-8",
+        "Content-Length": str(cuerpo_documento.longitud_cuerpo(fuente, mime_type, campos_extra)),
     }
 
+    # Cada intento (reintento o cobertura) genera su propio flujo del cuerpo;
+    # se mide solo el tiempo de lectura y Base64, no el de envío
+    metricas.registrar_documento(doc_type, "enviado", fuente.tamano())
+
+    def cuerpo():
+        return metricas.medir_flujo(
+            cuerpo_documento.generar_cuerpo(fuente, mime_type, campos_extra), metricas.CODIFICACION, doc_type
+        )
+
+    # Limitador por procesador: ritmo y concurrencia adaptativa hacia Document AI
+    limitador_procesador = limitador.obtener_limitador(version.procesador)
+
     try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(
-                url=endpoint_url, 
-                headers=headers, 
-                json=processor_json
-            )
-            response.raise_for_status()
+        # Cliente compartido: reutiliza conexiones TLS/HTTP2 entre peticiones
+        client = cliente_http.obtener_cliente()
+        response = await resiliencia.post_resiliente(
+            client, version.url, headers, cuerpo, version.procesador, limitador_procesador, circuito_procesador, deadline
+        )
+        response.raise_for_status()
+
+    except circuito.CircuitoAbierto:
+        # Se propaga para que la API responda 503 de inmediato
+        raise
+
+    except limitador.LimiteExcedido as e:
+        logger.warning("Petición a Document AI descartada por el limitador: %s", e, extra={"doc_type": doc_type})
+        # "reintentable": la cola de trabajos vuelve a intentarlo más tarde
+        return {"error": f"Document AI saturado, intente más tarde: {e}", "reintentable": True}
+
+    except resiliencia.DeadlineExcedido as e:
+        return {"error": f"Tiempo límite agotado para {doc_type}: {e}"}
 
     except httpx.HTTPStatusError:
-        print(f"Error {response.status_code} del servidor Document AI.")
-        print("Mensaje de error:", response.text) 
-        return {"error": f"Error de Document AI: {response.status_code}", "details": response.json()}
+        logger.warning(
+            "Error %s del servidor Document AI", response.status_code,
+            extra={"doc_type": doc_type, "status_code": response.status_code}
+        )
+        try:
+            detalles = response.json()
+        except ValueError:
+            detalles = response.text
+        return {"error": f"Error de Document AI: {response.status_code}", "details": detalles}
     
     except Exception as e:
+        logger.exception("Error al ejecutar Document AI", extra={"doc_type": doc_type})
         return {"error": f"Error al ejecutar Document AI: {e}"}
-    
-    print(f"Respuesta recibida para {doc_type}")
+
+    logger.debug("Respuesta recibida", extra={"doc_type": doc_type, "bytes_respuesta": len(response.content)})
 
     try:
-        data_json = response.json()
-        entidades = herramientas.obtener_datos_completos(data_json)
-        return entidades
+        if bitacora.DEPURACION:
+            # El volcado necesita la respuesta completa, no solo las entidades
+            herramientas.inspeccionar_respuesta_sin_base64(response.json())
+        # Solo se decodifica el subárbol de entidades de la respuesta
+        with metricas.etapa(metricas.DECODIFICACION, doc_type):
+            data_json = await ejecutores.en_hilo_si_grande(
+                len(response.content), decodificador.decodificar_respuesta, response.content
+            )
+        with metricas.etapa(metricas.APLANADO, doc_type):
+            return herramientas.obtener_datos_completos(data_json, detallado=True)
     except Exception as e:
+        logger.exception("Error al procesar la respuesta de Document AI", extra={"doc_type": doc_type})
         return {"error": f"Error al procesar respuesta: {e}"}
 
 
-# Funciones wrapper para compatibilidad con app.py (mantienen la interfaz anterior)
-async def procesa_pasaporte(image: UploadFile):
-    """Procesa un pasaporte."""
-    return await procesa_documento(image, "pasaporte")
+async def preparar_pdf(pdf_contents: bytes, doc_type: str, estrategia: Optional[str] = None) -> Tuple[bytes, str]:
+    """
+    Aplica la estrategia de envío del tipo de documento (estrategia_pdf) y
+    devuelve el contenido que se mandará a Document AI con su tipo MIME.
+    """
+    estrategia = estrategia or estrategia_pdf(doc_type)
+    if estrategia == "pdf":
+        return pdf_contents, "application/pdf"
 
+    if estrategia == "paginas":
+        paginas = herramientas.interpretar_rango_paginas(paginas_pdf(doc_type))
+        with metricas.etapa(metricas.SELECCION_PAGINAS, doc_type):
+            recorte = await ejecutores.en_proceso(herramientas.extraer_paginas_pdf, pdf_contents, paginas)
+        return recorte, "application/pdf"
 
-async def procesa_fm(image: UploadFile):
-    """Procesa una forma migratoria."""
-    return await procesa_documento(image, "fm")
+    # La rasterización es bloqueante: un hilo la coordina y las páginas se
+    # renderizan en el pool de procesos
+    with metricas.etapa(metricas.RASTERIZACION, doc_type):
+        dpi = dpi_pdf(doc_type)
+        if estrategia == "imagen_adaptativa":
+            dpi = await ejecutores.en_proceso(herramientas.dpi_adaptativo, pdf_contents, dpi)
+        imagen_png = await ejecutores.en_hilo(herramientas.unir_paginas_pdf_a_png, pdf_contents, dpi)
+    return imagen_png, "image/png"
 
 
-async def procesa_csf(ruta_imagen_salida: str):
-    """Procesa un archivo CSF (Constancia de Situación Fiscal)."""
-    return await procesa_documento(ruta_imagen_salida, "csf", mime_type_override="image/png")
+async def procesa_pdf(pdf_contents: bytes, doc_type: str, deadline: Optional[float] = None, **opciones):
+    """
+    Procesa un documento PDF. Si el tipo tiene plantilla en texto_pdf se
+    intenta primero la extracción local de la capa de texto ("_cache":
+    "local"); si no aplica, se envía según la estrategia de su tipo
+    (estrategia_pdf).
 
+    Con las estrategias de imagen, un PDF que supera
+    PDF_UMBRAL_ARCHIVO_TEMPORAL se rasteriza con archivos temporales.
 
-async def procesa_cedula(pdf_file: UploadFile):
-    """Procesa una cédula profesional (PDF)."""
-    return await procesa_documento(pdf_file, "cedula")
+    Raises:
+        ValueError si el PDF no se puede preparar (sin páginas, demasiadas
+        páginas o rango inválido); herramientas.PaginasExcedidas en el
+        segundo caso.
+    """
+    # La preparación también cuenta contra el presupuesto
+    if deadline is None:
+        deadline = resiliencia.calcular_deadline(doc_type)
 
+    metricas.registrar_documento(doc_type, "pdf", len(pdf_contents))
 
-async def procesa_ine(image: UploadFile):
-    """Procesa una INE (imagen JPG)."""
-    return await procesa_documento(image, "ine")
\ No newline at end of file
+    # PDFs generados digitalmente: los campos se leen de la capa de texto sin
+    # llamar a Document AI. Sin texto o con campos inválidos se sigue normal.
+    if texto_pdf.aplica(doc_type):
+        with metricas.etapa(metricas.TEXTO_PDF, doc_type):
+            entidades, motivo = await ejecutores.en_proceso(texto_pdf.extraer, pdf_contents, doc_type)
+        if entidades is not None:
+            metricas.registrar_extraccion_local(doc_type, "local")
+            resultado = herramientas.formatear_datos_detallados(
+                entidades, opciones.get("umbral_confianza"), opciones.get("detallado", False)
+            )
+            resultado["_cache"] = "local"
+            return resultado
+        metricas.registrar_extraccion_local(doc_type, motivo.split(":", 1)[0])
+        logger.info("Extracción local descartada; se usa Document AI", extra={"doc_type": doc_type, "motivo": motivo})
+
+    estrategia = estrategia_pdf(doc_type)
+    if estrategia.startswith("imagen") and UMBRAL_ARCHIVO_TEMPORAL and len(pdf_contents) > UMBRAL_ARCHIVO_TEMPORAL:
+        return await _procesa_pdf_con_temporales(pdf_contents, doc_type, estrategia, deadline, **opciones)
+
+    contenido, mime_type = await preparar_pdf(pdf_contents, doc_type, estrategia)
+    logger.debug("PDF preparado", extra={
+        "doc_type": doc_type, "estrategia": estrategia,
+        "bytes_pdf": len(pdf_contents), "bytes_enviados": len(contenido),
+    })
+    return await procesa_documento(contenido, doc_type, mime_type_override=mime_type, deadline=deadline, **opciones)
+
+
+async def _procesa_pdf_con_temporales(pdf_contents: bytes, doc_type: str, estrategia: str,
+                                     deadline: float, **opciones):
+    """
+    Respaldo para PDFs muy grandes: el PDF y la imagen unida van a archivos
+    temporales en TEMP_DIR_ROOT. Los procesos del pool abren el PDF desde el
+    disco en lugar de recibir una copia, y las páginas se comprimen al PNG una
+    por una sin armar el lienzo en memoria. El PNG sale en escala de grises si
+    el perfil del tipo la pide, así el preprocesamiento no lo decodifica.
+    """
+    perfil = preprocesamiento.perfil_preprocesamiento(doc_type)
+    escala_grises = bool(preprocesamiento.PREPROCESAMIENTO_HABILITADO and perfil and perfil["escala_grises"])
+    os.makedirs(TEMP_DIR_ROOT, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix="rad_pdf_", dir=TEMP_DIR_ROOT) as directorio:
+        ruta_pdf = os.path.join(directorio, "documento.pdf")
+        ruta_png = os.path.join(directorio, "unido.png")
+        with metricas.etapa(metricas.RASTERIZACION, doc_type):
+            await ejecutores.en_hilo(Path(ruta_pdf).write_bytes, pdf_contents)
+            dpi = dpi_pdf(doc_type)
+            if estrategia == "imagen_adaptativa":
+                dpi = await ejecutores.en_proceso(herramientas.dpi_adaptativo, pdf_contents, dpi)
+            await ejecutores.en_hilo(herramientas.unir_paginas_pdf_a_una_imagen, ruta_pdf, ruta_png, dpi, escala_grises)
+        logger.debug("PDF unido en archivo temporal", extra={"doc_type": doc_type, "bytes_png": os.path.getsize(ruta_png)})
+        return await procesa_documento(ruta_png, doc_type, mime_type_override="image/png", deadline=deadline, **opciones)
+
+
+async def procesa_tipo(archivo: UploadFile, doc_type: str, deadline: Optional[float] = None, **opciones):
+    """
+    Procesa un archivo subido de cualquier tipo del registro de procesadores.
+    Las imágenes y los PDF que se envían tal cual se leen por bloques del
+    archivo temporal del upload; el resto se lee completo para prepararlo.
+    La revisión de la capa de texto usa un hilo: en un PDF escaneado apenas
+    hay texto que recorrer.
+    """
+    tipo = procesadores.tipo(doc_type)
+    if tipo is not None and tipo.es_pdf:
+        if estrategia_pdf(doc_type) != "pdf":
+            return await procesa_pdf(await archivo.read(), doc_type, deadline, **opciones)
+        # Solo un PDF con capa de texto se lee completo para la extracción
+        # local; uno escaneado se envía tal cual desde el archivo del upload
+        if texto_pdf.aplica(doc_type):
+            if await ejecutores.en_hilo(_tiene_texto, archivo.file):
+                return await procesa_pdf(await archivo.read(), doc_type, deadline, **opciones)
+            metricas.registrar_extraccion_local(doc_type, texto_pdf.SIN_TEXTO)
+    return await procesa_documento(archivo, doc_type, deadline=deadline, **opciones)
+
+
+def _tiene_texto(archivo) -> bool:
+    try:
+        with herramientas.abrir_pdf(archivo) as documento:
+            return texto_pdf.tiene_texto(documento)
+    except Exception:
+        # Un PDF ilegible lo reporta Document AI
+        return False
+
+
+async def _procesa_elemento_lote(indice: int, doc_type: str, nombre: Optional[str], contenido: bytes,
+                                 semaforo: asyncio.Semaphore, timeout_cliente: Optional[float],
+                                 opciones: Dict[str, Any]) -> Dict[str, Any]:
+    """Procesa un elemento del lote; cualquier fallo queda contenido en su resultado."""
+    elemento = {"indice": indice, "doc_type": doc_type, "archivo": nombre}
+
+    tipo = procesadores.tipo(doc_type)
+    if tipo is None:
+        elemento["error"] = f"Tipo de documento no soportado: {doc_type}. Opciones: {list(procesadores.tipos())}"
+        return elemento
+
+    mime_real = preprocesamiento.detectar_mime(contenido)
+    if tipo.es_pdf and mime_real != "application/pdf":
+        elemento["error"] = "El archivo no es un PDF."
+        return elemento
+    if not tipo.es_pdf and not mime_real.startswith("image/"):
+        elemento["error"] = "El archivo no es una imagen."
+        return elemento
+
+    # Los mismos límites que la ruta propia del tipo: tamaño y páginas
+    limite = limite_carga.limite_ruta(tipo.ruta)
+    if len(contenido) > limite:
+        elemento["error"] = limite_carga.CargaExcedida(limite).detail
+        return elemento
+    if tipo.es_pdf:
+        try:
+            await limite_carga.verificar_paginas(contenido, doc_type)
+        except HTTPException as e:
+            elemento["error"] = e.detail
+            return elemento
+
+    # El deadline corre desde que se recibió el lote, incluida la espera en el semáforo
+    deadline = resiliencia.calcular_deadline(doc_type, timeout_cliente)
+
+    async with semaforo:
+        inicio = time.perf_counter()
+        try:
+            if tipo.es_pdf:
+                resultado = await procesa_pdf(contenido, doc_type, deadline, **opciones)
+            else:
+                resultado = await procesa_documento(contenido, doc_type, deadline=deadline, **opciones)
+        except Exception as e:
+            resultado = {"error": f"Error al procesar el documento: {e}"}
+        elemento["duracion_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+
+    if "error" in resultado:
+        elemento["error"] = resultado["error"]
+    else:
+        elemento["resultado"] = resultado
+    return elemento
+
+
+async def procesa_lote(elementos: List[Tuple[str, Optional[str], bytes]],
+                       timeout_cliente: Optional[float] = None, **opciones) -> Dict[str, Any]:
+    """
+    Procesa varios documentos de forma concurrente.
+
+    Args:
+        elementos: Lista de tuplas (doc_type, nombre_archivo, contenido)
+        timeout_cliente: Segundos que el cliente está dispuesto a esperar (opcional)
+        opciones: umbral_confianza / detallado, aplicados a todos los elementos
+
+    Returns:
+        Diccionario con un resultado o error por elemento, en el orden recibido.
+        El tiempo total es aproximadamente el del documento más lento, con a lo
+        sumo LOTE_CONCURRENCIA documentos en curso a la vez.
+    """
+    if len(elementos) > LOTE_MAX_ELEMENTOS:
+        return {"error": f"El lote tiene {len(elementos)} documentos; el máximo es {LOTE_MAX_ELEMENTOS}."}
+
+    semaforo = asyncio.Semaphore(LOTE_CONCURRENCIA)
+    inicio = time.perf_counter()
+    resultados = await asyncio.gather(*(
+        _procesa_elemento_lote(indice, doc_type, nombre, contenido, semaforo, timeout_cliente, opciones)
+        for indice, (doc_type, nombre, contenido) in enumerate(elementos)
+    ))
+
+    return {
+        "total": len(resultados),
+        "exitosos": sum(1 for r in resultados if "error" not in r),
+        "fallidos": sum(1 for r in resultados if "error" in r),
+        "duracion_ms": round((time.perf_counter() - inicio) * 1000, 1),
+        "elementos": resultados,
+    }
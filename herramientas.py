@@ -1,177 +1,179 @@
 import io
+import os
 import json
+import mmap
+import zlib
 import fitz
-import base64
+import struct
+import logging
+import contextlib
 from PIL import Image
-from typing import Dict, Any
-from fastapi import UploadFile
-from typing import Dict, Any, List
-
-def ruta_a_base64(ruta_archivo):
-  """
-  Lee un archivo binario (imagen o PDF) y lo codifica en una cadena Base64.
-
-  Args:
-    ruta_archivo (str): La ruta completa del archivo en tu sistema.
-
-  Returns:
-    str: La cadena Base64 codificada.
-  """
-  try:
-    with open(ruta_archivo, "rb") as archivo:
-
-      contenido_binario = archivo.read()
-      #Codificar el contenido binario a Base64
-      base64_bytes = base64.b64encode(contenido_binario)
-      # Convierte los bytes Base64 a una cadena de texto y la devuelve
-      base64_cadena = base64_bytes.decode('utf-8')
-      return base64_cadena
-  except FileNotFoundError:
-    print(f"Error: El archivo no se encontró en la ruta: {ruta_archivo}")
-    return None
-  
-async def upload_a_base64(archivo_subido: UploadFile) -> str:
-    """
-    Lee el contenido binario de un objeto UploadFile y lo codifica en Base64.
-    """
-    
-    contenido_binario = await archivo_subido.read()
-    base64_bytes = base64.b64encode(contenido_binario)
-    base64_cadena = base64_bytes.decode('utf-8')
+from typing import Dict, Any, List, Optional, Union, BinaryIO
+from concurrent.futures import as_completed
+import ejecutores
+from bitacora import DEPURACION
 
-    # print("Retornando cadena:")
-    # print("Inicio de la cadena Base64:", base64_cadena[:50] + "...") 
-    
-    return base64_cadena
-
-def imprimir_entidades(data_json):
-    """Extrae e imprime la sección 'entities' del JSON de Document AI."""
-    
-    # La información estructurada del documento se encuentra en data_json['document']['entities']    
-    try:
-        # Navegar al nodo 'document' y luego a 'entities'
-        entidades = data_json['document']['entities']
-        
-        
-        print("--- Entidades Extraídas del Documento ---")
-        # Uso json.dumps(..., indent=2) para un formato limpio y legible
-        print(json.dumps(entidades, indent=4))
-        print("----------------------------------------")
-        
-        return entidades
-        
-    except KeyError:
-        # Manejo de error si la estructura no es la esperada (por ejemplo, si 'document' no existe)
-        print("Error: La respuesta de Document AI no contiene el nodo esperado ['document']['entities'].")
-        return None
+logger = logging.getLogger(__name__)
 
+def _volcar(titulo: str, datos: Any):
+    """
+    Escribe un volcado JSON legible en el log, solo si DEPURACION está
+    habilitado. Fuera de ese modo no se serializa nada.
+    """
+    if DEPURACION:
+        logger.debug("%s:\n%s", titulo, json.dumps(datos, indent=2, ensure_ascii=False))
 
-# --- FUNCIÓN PRINCIPAL REVISADA ---
-def obtener_todas_las_entidades(data_json: Dict[str, Any]) -> Dict[str, str]:
-    datos_resumidos = {}
-    
-    try:
-        entidades_raiz = data_json['document']['entities']
-        # Llamar a la función recursiva para iniciar el aplanamiento
-        extraer_entidades_recursivas(entidades_raiz, datos_resumidos)
-        
-    except KeyError:
-        # Manejo error si la estructura JSON no es la esperada
-        return {}
 
-    return datos_resumidos
+# --- Aplanado de entidades ---
 
-def extraer_entidades_recursivamente(entidades: List[Dict[str, Any]], datos_planos: Dict[str, str] = None) -> Dict[str, str]:
+class EntidadPlana:
     """
-    Función recursiva para extraer todas las entidades y sub-entidades anidadas,
-    creando un diccionario plano de tipo: valor.
+    Registro compacto de una entidad extraída. Usa __slots__ para no crear
+    un diccionario por instancia en respuestas con muchas entidades.
     """
-    if datos_planos is None:
-        datos_planos = {}
+    __slots__ = ("tipo", "valor", "confianza", "normalizado")
 
-    for entidad in entidades:
-        nombre_campo = entidad.get('type')
-        valor_campo = entidad.get('mentionText')
-        
-        # 1. Procesar valor principal si existe
-        if nombre_campo and valor_campo:
-            # Usamos el nombre del campo para la clave (ej. 'PASSPORT_NUMBER')
-            datos_planos[nombre_campo] = valor_campo
-        
-        # 2. Búsqueda en propiedades (sub-entidades anidadas)
-        # Las entidades anidadas suelen estar en la lista 'properties'
-        if 'properties' in entidad:
-            # Llamada recursiva a la función para procesar las sub-entidades
-            extraer_entidades_recursivamente(entidad['properties'], datos_planos)
-            
-        # 3. Manejar el caso de las entidades que no tienen mentionText (ej. solo sub-campos)
-        # A veces, la entidad padre no tiene texto, pero sus sub-entidades sí
-        elif nombre_campo and not valor_campo and 'properties' in entidad:
-            extraer_entidades_recursivamente(entidad['properties'], datos_planos)
+    def __init__(self, tipo: str, valor: str, confianza: Optional[float], normalizado: Any):
+        self.tipo = tipo
+        self.valor = valor
+        self.confianza = confianza
+        self.normalizado = normalizado
 
-    return datos_planos
+    def a_dict(self) -> Dict[str, Any]:
+        return {"valor": self.valor, "confianza": self.confianza, "normalizado": self.normalizado}
 
-def extraer_entidades_recursivas(entidades: List[Dict[str, Any]], datos_resumidos: Dict[str, str]):
+def _valor_normalizado(entidad: Dict[str, Any]) -> Any:
     """
-    Función recursiva para extraer todas las entidades, incluidas las sub-entidades (propiedades),
-    y aplanarlas en un único diccionario.
+    Convierte 'normalizedValue' de Document AI a un valor simple: fechas como
+    'AAAA-MM-DD', montos como número, y el texto normalizado en otro caso.
     """
+    normalizado = entidad.get('normalizedValue')
+    if not normalizado:
+        return None
+
+    fecha = normalizado.get('dateValue')
+    if fecha:
+        try:
+            return f"{int(fecha['year']):04d}-{int(fecha['month']):02d}-{int(fecha['day']):02d}"
+        except (KeyError, ValueError, TypeError):
+            return normalizado.get('text')
+
+    monto = normalizado.get('moneyValue')
+    if monto:
+        unidades = int(monto.get('units', 0) or 0)
+        nanos = int(monto.get('nanos', 0) or 0)
+        return round(unidades + nanos / 1e9, 2)
 
-    if datos_planos is None:
-        datos_planos = {}
+    for clave in ('floatValue', 'integerValue', 'booleanValue'):
+        if clave in normalizado:
+            return normalizado[clave]
 
+    return normalizado.get('text')
 
-    for entidad in entidades:
+def extraer_entidades(entidades: List[Dict[str, Any]], umbral_confianza: Optional[float] = None) -> List[EntidadPlana]:
+    """
+    Recorre las entidades y sub-entidades ('properties') con una pila
+    explícita, sin recursión, y devuelve un registro por cada entidad con
+    texto, en el mismo orden que aparecen en la respuesta.
+
+    Args:
+        entidades: Lista 'document.entities' de la respuesta de Document AI
+        umbral_confianza: Si se indica, se descartan las entidades con confianza menor
+    """
+    registros = []
+    pila = list(reversed(entidades))
+    while pila:
+        entidad = pila.pop()
         nombre_campo = entidad.get('type')
         valor_campo = entidad.get('mentionText')
 
         if nombre_campo and valor_campo:
-            # 1. Guardar la entidad (Padre o Hijo)
-            datos_resumidos[nombre_campo] = valor_campo
-        
-        # 2. Verificar y procesar Sub-entidades
-        if 'properties' in entidad and isinstance(entidad['properties'], list):
-            # Llama recursivamente a esta misma función para procesar los hijos
-            extraer_entidades_recursivas(entidad['properties'], datos_resumidos)
+            confianza = entidad.get('confidence')
+            if umbral_confianza is None or (confianza is not None and confianza >= umbral_confianza):
+                registros.append(EntidadPlana(nombre_campo, valor_campo, confianza, _valor_normalizado(entidad)))
+
+        # Las sub-entidades se apilan en orden inverso para visitarlas en orden
+        propiedades = entidad.get('properties')
+        if propiedades:
+            pila.extend(reversed(propiedades))
+
+    return registros
+
+def agrupar_entidades(registros: List[EntidadPlana], detallado: bool = False) -> Dict[str, Any]:
+    """
+    Agrupa los registros por tipo. Un tipo que aparece una sola vez queda
+    como valor simple; uno repetido (ej. varios regímenes de la CSF) queda
+    como lista en lugar de sobrescribirse.
 
-    return datos_planos
+    Con detallado=True cada valor es {'valor', 'confianza', 'normalizado'}.
+    """
+    agrupados: Dict[str, Any] = {}
+    for registro in registros:
+        valor = registro.a_dict() if detallado else registro.valor
+        if registro.tipo not in agrupados:
+            agrupados[registro.tipo] = valor
+        elif isinstance(agrupados[registro.tipo], list):
+            agrupados[registro.tipo].append(valor)
+        else:
+            agrupados[registro.tipo] = [agrupados[registro.tipo], valor]
+    return agrupados
 
-def obtener_datos_completos(data_json: Dict[str, Any]) -> Dict[str, str]:
+def formatear_datos_detallados(datos_detallados: Dict[str, Any], umbral_confianza: Optional[float] = None,
+                               detallado: bool = False) -> Dict[str, Any]:
+    """
+    Convierte un resultado detallado (como el que se guarda en cache) a la
+    forma pedida por el cliente, aplicando el umbral de confianza.
+    """
+    datos = {}
+    for tipo, valor in datos_detallados.items():
+        registros = valor if isinstance(valor, list) else [valor]
+        if umbral_confianza is not None:
+            registros = [
+                r for r in registros
+                if r.get("confianza") is not None and r["confianza"] >= umbral_confianza
+            ]
+        if not registros:
+            continue
+        if not detallado:
+            registros = [r["valor"] for r in registros]
+        datos[tipo] = registros[0] if len(registros) == 1 else registros
+    return datos
+
+def obtener_datos_completos(data_json: Dict[str, Any], umbral_confianza: Optional[float] = None,
+                            detallado: bool = False) -> Dict[str, Any]:
     """
     Función de entrada que toma la respuesta completa de Document AI y 
     devuelve un diccionario plano con todas las entidades.
     """
 
-    datos_resumidos = {}
-
     try:
         # 1. Acceder a la lista de entidades principales
         entidades_raiz = data_json['document']['entities']
         
+        # 2. Aplanar de forma iterativa y agrupar por tipo
+        registros = extraer_entidades(entidades_raiz, umbral_confianza)
+        datos_finales = agrupar_entidades(registros, detallado)
         
-        # 2. Llamar a la función recursiva
-        datos_finales = extraer_entidades_recursivamente(entidades_raiz)
-        #datos_finales = extraer_entidades_recursivas(entidades_raiz, datos_resumidos)
-        
-        # 3. Imprimir el resultado completo
-        print("--- Datos de Pasaporte Completos (Recursivo) ---")
-        print(json.dumps(datos_finales, indent=2))
-        print("------------------------------------------------")
+        # 3. Volcado del resultado completo, solo en modo depuración
+        _volcar("Datos completos del documento", datos_finales)
         
         return datos_finales
         
     except KeyError as e:
-        print(f"Error: No se pudo encontrar el nodo 'document' o 'entities'. Error: {e}")
+        logger.warning("No se pudo encontrar el nodo 'document' o 'entities': %s", e)
         return {}
 
 def inspeccionar_respuesta_sin_base64(data_json: Dict[str, Any]):
     """
-    Imprime el contenido completo del nodo 'document', excluyendo la cadena Base64
-    para que sea legible en la consola.
+    Vuelca al log el contenido completo del nodo 'document', excluyendo la
+    cadena Base64 para que sea legible. Solo actúa en modo depuración.
     """
     
+    if not DEPURACION:
+        return
+
     if 'document' not in data_json:
-        print("Error: El JSON no contiene la clave 'document'.")
+        logger.debug("El JSON no contiene la clave 'document'.")
         return
 
     # Creamos una copia del diccionario para poder modificarlo
@@ -188,25 +190,22 @@ def inspeccionar_respuesta_sin_base64(data_json: Dict[str, Any]):
         document_copy['content_status'] = "Cadena Base64 omitida para legibilidad."
         del document_copy['content']
 
-    # 2. Imprimir el JSON restante con formato
-    print("\n--- Estructura del Documento (Excluyendo Base64) ---")
-    print(json.dumps(document_copy, indent=2))
-    print("----------------------------------------------------\n")
+    # 2. Volcar el JSON restante con formato
+    _volcar("Estructura del documento (excluyendo Base64)", document_copy)
 
 
 
 def imprimir_claves_raiz(data_json: Dict[str, Any]):
-    """Imprime todas las claves del diccionario de respuesta principal."""
+    """Vuelca al log las claves del diccionario de respuesta principal (solo en modo depuración)."""
     
-    print("\n--- CLAVES PRINCIPALES DEL JSON RECIBIDO ---")
+    if not DEPURACION:
+        return
+
     if isinstance(data_json, dict):
-        for key in data_json.keys():
-            # Muestra el tipo de valor para ver si es un diccionario o una lista
-            value_type = type(data_json[key]).__name__
-            print(f"Clave: '{key}' | Tipo: {value_type}")
+        # Muestra el tipo de valor para ver si es un diccionario o una lista
+        _volcar("Claves principales del JSON recibido", {key: type(value).__name__ for key, value in data_json.items()})
     else:
-        print(f"Error: La respuesta no es un diccionario JSON. Tipo recibido: {type(data_json)}")
-    print("-------------------------------------------\n")
+        logger.debug("La respuesta no es un diccionario JSON. Tipo recibido: %s", type(data_json))
 
 
 def mapear_estructura_json(data: Any, nivel=0) -> Dict[str, Any]:
@@ -214,8 +213,6 @@ def mapear_estructura_json(data: Any, nivel=0) -> Dict[str, Any]:
     Genera un mapa recursivo de la estructura JSON.
     Ignora las claves con cadenas muy largas (como OCR o Base64).
     """
-    indentacion = "  " * nivel
-    
     # Si es un diccionario
     if isinstance(data, dict):
         esquema = {}
@@ -256,27 +253,28 @@ def mapear_estructura_json(data: Any, nivel=0) -> Dict[str, Any]:
 def generar_esquema_document_ai(data_json: Dict[str, Any]) -> None:
     """
     Función de inicio que usa el mapa recursivo en el objeto 'document'.
+    Solo actúa en modo depuración.
     """
+    if not DEPURACION:
+        return
+
     if 'document' in data_json:
         esquema_documento = mapear_estructura_json(data_json['document'])
-        
-        print("\n--- MAPA ESTRUCTURAL DEL OBJETO 'document' ---")
-        print(json.dumps(esquema_documento, indent=2))
-        print("---------------------------------------------\n")
+        _volcar("Mapa estructural del objeto 'document'", esquema_documento)
     else:
-        print("Error: La clave 'document' no se encontró en la respuesta JSON.")
-
-import json
-from typing import Dict, Any, List
+        logger.debug("La clave 'document' no se encontró en la respuesta JSON.")
 
 def inspeccionar_estructura_limpia(data_json: Dict[str, Any]):
     """
-    Imprime el contenido completo del nodo 'document', excluyendo la cadena Base64
-    de la imagen para que sea legible en la consola.
+    Vuelca al log el contenido completo del nodo 'document', excluyendo la
+    cadena Base64 de la imagen para que sea legible. Solo actúa en modo depuración.
     """
     
+    if not DEPURACION:
+        return
+
     if 'document' not in data_json:
-        print("Error: El JSON no contiene la clave 'document'.")
+        logger.debug("El JSON no contiene la clave 'document'.")
         return
 
     # 1. Crear una copia profunda del diccionario 'document' para modificarlo sin afectar el original
@@ -306,10 +304,8 @@ def inspeccionar_estructura_limpia(data_json: Dict[str, Any]):
                 # Si quieres, también puedes eliminar completamente la clave 'image':
                 # del page['image'] 
     
-    # 4. Imprimir el JSON restante con formato
-    print("\n--- ESTRUCTURA DEL DOCUMENTO (LIMPIA PARA INSPECCIÓN) ---")
-    print(json.dumps(document_copy, indent=2))
-    print("----------------------------------------------------------\n")
+    # 4. Volcar el JSON restante con formato
+    _volcar("Estructura del documento (limpia para inspección)", document_copy)
 
 def obtener_estructura_limpia_para_fastapi(data_json: Dict[str, Any]) -> Dict[str, Any] | None:
     """
@@ -348,81 +344,322 @@ def obtener_estructura_limpia_para_fastapi(data_json: Dict[str, Any]) -> Dict[st
     # 4. DEVOLVER EL DICCIONARIO LIMPIO
     return document_copy
 
-def unir_paginas_pdf_a_una_imagen(ruta_pdf, ruta_salida, resolucion_dpi=150):
+# --- Rasterización de PDF ---
+
+# Límites para acotar la memoria pico al unir páginas
+MAX_PAGINAS_PDF = int(os.getenv("PDF_MAX_PAGINAS", "20"))
+MAX_PIXELES_LIENZO = int(os.getenv("PDF_MAX_PIXELES", "60000000"))  # ~180 MB en RGB
+# Archivos hasta este tamaño se leen completos al abrirlos; los mayores se
+# mapean en memoria y MuPDF lee del archivo solo las partes que necesita
+TAMANO_LECTURA_COMPLETA = 1024 * 1024
+
+
+class PaginasExcedidas(ValueError):
+    """El PDF tiene más páginas de las que se pueden rasterizar (MAX_PAGINAS_PDF)."""
+
+
+@contextlib.contextmanager
+def abrir_pdf(origen: Union[bytes, str, BinaryIO]):
     """
-    Convierte todas las páginas de un PDF y las une verticalmente en una sola imagen.
+    Abre un PDF con MuPDF sin copiarlo completo al heap: bytes en memoria,
+    una ruta local o un archivo abierto (ej. el SpooledTemporaryFile de un
+    UploadFile, que ya está en disco si supera 1 MB). El archivo se puede
+    seguir leyendo por bloques después; su posición no cambia.
     """
+    if isinstance(origen, (bytes, bytearray, memoryview)):
+        with fitz.open(stream=origen, filetype="pdf") as documento:
+            yield documento
+        return
+    if isinstance(origen, str):
+        with fitz.open(origen, filetype="pdf") as documento:
+            yield documento
+        return
+
+    posicion = origen.tell()
     try:
-        print("Éste es el archivo que fitz quiere abrir", ruta_pdf)
-        documento = fitz.open(ruta_pdf)
-        imagenes_pil = []
-        alto_total = 0
-        ancho_maximo = 0
-
-        # Calcular el factor de zoom a partir de la resolución DPI
-        factor_zoom = resolucion_dpi / 72.0
-        matriz = fitz.Matrix(factor_zoom, factor_zoom)
-        
-        # 1. Renderizar cada página y guardarla temporalmente como objeto PIL Image
-        print(f"Renderizando {documento.page_count} páginas...")
-        for num_pagina in range(documento.page_count):
-            pagina = documento.load_page(num_pagina)
-            pix = pagina.get_pixmap(matrix=matriz)
-            
-            # Convertir el pixmap de PyMuPDF a un objeto Image de Pillow
-            img_data = pix.tobytes("ppm")
-            imagen_pagina = Image.open(io.BytesIO(img_data))
-            
-            imagenes_pil.append(imagen_pagina)
-            
-            # Calcular las dimensiones totales
-            alto_total += imagen_pagina.height
-            ancho_maximo = max(ancho_maximo, imagen_pagina.width)
+        tamano = origen.seek(0, os.SEEK_END)
+        if tamano <= TAMANO_LECTURA_COMPLETA:
+            origen.seek(0)
+            mapa = None
+            datos = origen.read()
+        else:
+            mapa = mmap.mmap(origen.fileno(), 0, access=mmap.ACCESS_READ)
+            datos = memoryview(mapa)
+    finally:
+        origen.seek(posicion)
+    try:
+        with fitz.open(stream=datos, filetype="pdf") as documento:
+            yield documento
+    finally:
+        if mapa is not None:
+            datos.release()
+            mapa.close()
+
 
+def _renderizar_paginas(origen: Union[bytes, str], paginas: List[int], factor_zoom: float,
+                        escala_grises: bool = False) -> List[tuple]:
+    """
+    Renderiza un grupo de páginas a muestras crudas (RGB, o de un canal en
+    escala de grises). Se ejecuta en un proceso del pool, así que abre su
+    propia copia del documento, desde los bytes o desde la ruta del PDF.
+    """
+    if isinstance(origen, str):
+        documento = fitz.open(origen, filetype="pdf")
+    else:
+        documento = fitz.open(stream=origen, filetype="pdf")
+    try:
+        matriz = fitz.Matrix(factor_zoom, factor_zoom)
+        espacio = fitz.csGRAY if escala_grises else fitz.csRGB
+        renderizadas = []
+        for num_pagina in paginas:
+            pix = documento.load_page(num_pagina).get_pixmap(matrix=matriz, colorspace=espacio, alpha=False)
+            renderizadas.append((num_pagina, pix.width, pix.height, pix.stride, pix.samples))
+        return renderizadas
+    finally:
         documento.close()
-        
-        # 2. Crear una nueva imagen vacía (lienzo) con las dimensiones totales
-        imagen_final = Image.new('RGB', (ancho_maximo, alto_total), 'white')
-        
-        # 3. Pegar las imágenes de las páginas en el lienzo
-        posicion_y = 0
-        for imagen in imagenes_pil:
-            # Pegar la imagen de la página en la posición Y actual
-            imagen_final.paste(imagen, (0, posicion_y))
-            # Actualizar la posición Y para la siguiente página
-            posicion_y += imagen.height
-        
-        # 4. Guardar la imagen final
-        imagen_final.save(ruta_salida)
-        print(f"\n✅ Documento unido y guardado en: {ruta_salida} (Resolución: {resolucion_dpi} DPI)")
 
-    except FileNotFoundError:
-        print(f"❌ Error: El archivo PDF '{ruta_pdf}' no fue encontrado.")
-    except Exception as e:
-        print(f"❌ Ocurrió un error inesperado: {e}")
+def _rectangulos_paginas(documento) -> list:
+    """Rectángulos de las páginas del PDF, validando que se pueda rasterizar."""
+    num_paginas = documento.page_count
+    if num_paginas == 0:
+        raise ValueError("El PDF no contiene páginas.")
+    if num_paginas > MAX_PAGINAS_PDF:
+        raise PaginasExcedidas(f"El PDF tiene {num_paginas} páginas; el máximo permitido es {MAX_PAGINAS_PDF}.")
+    return [documento.load_page(n).rect for n in range(num_paginas)]
 
-import base64
-import os
+def _geometria_lienzo(rectangulos: list, resolucion_dpi: int) -> tuple:
+    """
+    Factor de zoom, rectángulo de cada página a esa escala y dimensiones del
+    lienzo unido. Si el lienzo excede MAX_PIXELES_LIENZO se baja la resolución.
+    """
+    # Calcular el factor de zoom a partir de la resolución DPI
+    factor_zoom = resolucion_dpi / 72.0
+
+    # Ajustar la resolución al presupuesto de píxeles antes de renderizar. El
+    # lienzo mide el ancho de la página más ancha por la suma de las alturas,
+    # no la suma de las áreas de las páginas
+    pixeles = max(r.width for r in rectangulos) * sum(r.height for r in rectangulos) * factor_zoom ** 2
+    if pixeles > MAX_PIXELES_LIENZO:
+        factor_zoom *= (MAX_PIXELES_LIENZO / pixeles) ** 0.5
+        logger.info("Resolución reducida a %.0f DPI para respetar el límite de %d píxeles", factor_zoom * 72, MAX_PIXELES_LIENZO)
+
+    # Dimensiones de cada página a la escala final
+    matriz = fitz.Matrix(factor_zoom, factor_zoom)
+    dimensiones = [(r * matriz).irect for r in rectangulos]
+    alto_total = sum(irect.height for irect in dimensiones)
+    ancho_maximo = max(irect.width for irect in dimensiones)
+    return factor_zoom, dimensiones, ancho_maximo, alto_total
+
+def _copiar_en_lienzo(lienzo: bytearray, ancho_lienzo: int, alto_lienzo: int, posicion_y: int,
+                      ancho: int, alto: int, stride: int, muestras: bytes):
+    """Copia las muestras RGB de una página directamente en el lienzo preasignado."""
+    alto = min(alto, alto_lienzo - posicion_y)
+    ancho = min(ancho, ancho_lienzo)
+    if alto <= 0:
+        return
+    fila_lienzo = ancho_lienzo * 3
+    inicio = posicion_y * fila_lienzo
+
+    if ancho == ancho_lienzo and stride == fila_lienzo:
+        # Misma anchura que el lienzo: una sola copia contigua
+        lienzo[inicio:inicio + alto * fila_lienzo] = muestras[:alto * fila_lienzo]
+        return
 
-def archivo_local_a_base64(ruta_archivo: str) -> str:
+    vista = memoryview(muestras)
+    bytes_fila = ancho * 3
+    for fila in range(alto):
+        destino = inicio + fila * fila_lienzo
+        origen = fila * stride
+        lienzo[destino:destino + bytes_fila] = vista[origen:origen + bytes_fila]
+
+def renderizar_pdf_unido(datos_pdf: bytes, resolucion_dpi: int = 150) -> Image.Image:
     """
-    Lee el contenido binario de un archivo local y lo codifica en Base64.
+    Renderiza todas las páginas de un PDF (en bytes) y las apila verticalmente
+    en una sola imagen RGB.
+
+    Las páginas se reparten entre los procesos del pool y sus muestras se
+    copian directo a un lienzo preasignado, sin pasar por PPM ni conservar
+    una imagen PIL por página. Si el lienzo excede MAX_PIXELES_LIENZO se baja
+    la resolución para respetar el presupuesto de memoria.
     """
-    try:
-        # 1. Leer el contenido binario del archivo local
-        # Usamos 'rb' (read binary) para leer los bytes del archivo de imagen
-        with open(ruta_archivo, "rb") as archivo_local:
-            contenido_binario = archivo_local.read()
-            
-        # 2. Codificar el contenido binario a Base64
-        base64_bytes = base64.b64encode(contenido_binario)
-        
-        # 3. Convertir los bytes Base64 a una cadena de texto y devolver
-        base64_cadena = base64_bytes.decode('utf-8')
-        
-        print(f"Archivo {os.path.basename(ruta_archivo)} codificado con éxito.")
-        return base64_cadena
-        
-    except FileNotFoundError:
-        print(f"Error: El archivo '{ruta_archivo}' no fue encontrado.")
-        return "" # O lanza una excepción, como vimos antes
\ No newline at end of file
+    with fitz.open(stream=datos_pdf, filetype="pdf") as documento:
+        rectangulos = _rectangulos_paginas(documento)
+    num_paginas = len(rectangulos)
+    factor_zoom, dimensiones, ancho_maximo, alto_total = _geometria_lienzo(rectangulos, resolucion_dpi)
+    posiciones_y = []
+    posicion = 0
+    for irect in dimensiones:
+        posiciones_y.append(posicion)
+        posicion += irect.height
+
+    # Lienzo blanco preasignado una sola vez
+    lienzo = bytearray(b"\xff") * (ancho_maximo * alto_total * 3)
+
+    logger.debug("Renderizando %d páginas", num_paginas)
+    pool = ejecutores.pool_procesos()
+    if pool is None:
+        for num_pagina, ancho, alto, stride, muestras in _renderizar_paginas(datos_pdf, list(range(num_paginas)), factor_zoom):
+            _copiar_en_lienzo(lienzo, ancho_maximo, alto_total, posiciones_y[num_pagina], ancho, alto, stride, muestras)
+    else:
+        # Siempre en el pool, aun con una sola página: MuPDF retiene el GIL y
+        # en un hilo del servidor frenaría al event loop. Un grupo de páginas
+        # por proceso; cada grupo se copia al lienzo en cuanto termina para no
+        # retener todas las páginas a la vez
+        grupos = [list(range(num_paginas))[i::ejecutores.PROCESOS] for i in range(ejecutores.PROCESOS)]
+        futuros = [pool.submit(_renderizar_paginas, datos_pdf, grupo, factor_zoom) for grupo in grupos if grupo]
+        for futuro in as_completed(futuros):
+            for num_pagina, ancho, alto, stride, muestras in futuro.result():
+                _copiar_en_lienzo(lienzo, ancho_maximo, alto_total, posiciones_y[num_pagina], ancho, alto, stride, muestras)
+
+    return Image.frombuffer("RGB", (ancho_maximo, alto_total), lienzo, "raw", "RGB", 0, 1)
+
+def unir_paginas_pdf_a_png(datos_pdf: bytes, resolucion_dpi: int = 150) -> bytes:
+    """
+    Une todas las páginas de un PDF en memoria y devuelve la imagen como PNG
+    en bytes, sin tocar el disco.
+
+    Es bloqueante: desde código async debe llamarse con ejecutores.en_hilo.
+    """
+    imagen_final = renderizar_pdf_unido(datos_pdf, resolucion_dpi)
+    buffer = io.BytesIO()
+    imagen_final.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+def _bloque_png(tipo: bytes, datos: bytes) -> bytes:
+    return struct.pack(">I", len(datos)) + tipo + datos + struct.pack(">I", zlib.crc32(tipo + datos))
+
+def _paginas_en_orden(ruta_pdf: str, num_paginas: int, factor_zoom: float, escala_grises: bool):
+    """
+    Renderiza las páginas en el pool de procesos y las entrega en orden, con
+    a lo más PROCESOS páginas en curso para no retener el documento completo.
+    """
+    pool = ejecutores.pool_procesos()
+    if pool is None:
+        for num_pagina in range(num_paginas):
+            yield _renderizar_paginas(ruta_pdf, [num_pagina], factor_zoom, escala_grises)[0]
+        return
+    pendientes = []
+    for num_pagina in range(num_paginas):
+        pendientes.append(pool.submit(_renderizar_paginas, ruta_pdf, [num_pagina], factor_zoom, escala_grises))
+        if len(pendientes) >= ejecutores.PROCESOS:
+            yield pendientes.pop(0).result()[0]
+    for futuro in pendientes:
+        yield futuro.result()[0]
+
+def unir_paginas_pdf_a_una_imagen(ruta_pdf: str, ruta_salida: str, resolucion_dpi: int = 150,
+                                  escala_grises: bool = False):
+    """
+    Convierte todas las páginas de un PDF en disco y las une verticalmente en
+    un PNG en disco, sin armar el lienzo en memoria: las filas de cada página
+    se comprimen directo al archivo en cuanto se renderiza. La memoria pico es
+    la de unas cuantas páginas, no la del documento unido. Con escala_grises
+    se renderiza y se guarda con un solo canal.
+
+    Es bloqueante: desde código async debe llamarse con ejecutores.en_hilo.
+
+    Raises:
+        ValueError si el PDF no tiene páginas o excede MAX_PAGINAS_PDF.
+    """
+    with fitz.open(ruta_pdf, filetype="pdf") as documento:
+        rectangulos = _rectangulos_paginas(documento)
+    factor_zoom, dimensiones, ancho_maximo, alto_total = _geometria_lienzo(rectangulos, resolucion_dpi)
+
+    canales = 1 if escala_grises else 3
+    # Cada fila del PNG empieza con su tipo de filtro (0: ninguno)
+    fila_blanca = b"\x00" + b"\xff" * (ancho_maximo * canales)
+    compresor = zlib.compressobj(6)
+    with open(ruta_salida, "wb") as salida:
+        salida.write(b"\x89PNG\r\n\x1a\n")
+        salida.write(_bloque_png(b"IHDR", struct.pack(">IIBBBBB", ancho_maximo, alto_total, 8, 0 if escala_grises else 2, 0, 0, 0)))
+        for num_pagina, ancho, alto, stride, muestras in _paginas_en_orden(ruta_pdf, len(rectangulos), factor_zoom, escala_grises):
+            # Se escriben exactamente las filas que le tocan a la página en el
+            # lienzo; lo que falte a la derecha o abajo queda en blanco
+            ancho_util = min(ancho, ancho_maximo) * canales
+            relleno = b"\xff" * (ancho_maximo * canales - ancho_util)
+            vista = memoryview(muestras)
+            filas = [
+                b"\x00" + vista[fila * stride:fila * stride + ancho_util] + relleno if fila < alto else fila_blanca
+                for fila in range(dimensiones[num_pagina].height)
+            ]
+            comprimido = compresor.compress(b"".join(filas))
+            if comprimido:
+                salida.write(_bloque_png(b"IDAT", comprimido))
+        salida.write(_bloque_png(b"IDAT", compresor.flush()))
+        salida.write(_bloque_png(b"IEND", b""))
+    logger.debug("Documento unido y guardado en %s (resolución: %.0f DPI)", ruta_salida, factor_zoom * 72)
+
+# --- Preparación del PDF antes de enviarlo ---
+
+# Límites del DPI adaptativo y altura buscada (en píxeles) para el texto
+# más pequeño del documento una vez rasterizado
+DPI_MINIMO = int(os.getenv("PDF_DPI_MINIMO", "100"))
+DPI_MAXIMO = int(os.getenv("PDF_DPI_MAXIMO", "200"))
+ALTURA_TEXTO_PX = float(os.getenv("PDF_ALTURA_TEXTO_PX", "18"))
+
+def interpretar_rango_paginas(rango: str) -> List[int]:
+    """
+    Convierte un rango como "1-2,4" (páginas desde 1) en índices desde 0,
+    sin repetir y en el orden en que aparecen.
+    """
+    indices: List[int] = []
+    for parte in rango.split(","):
+        parte = parte.strip()
+        if not parte:
+            continue
+        inicio, _, fin = parte.partition("-")
+        primera = int(inicio)
+        ultima = int(fin) if fin else primera
+        if primera < 1 or ultima < primera:
+            raise ValueError(f"Rango de páginas inválido: {parte!r}")
+        for pagina in range(primera - 1, ultima):
+            if pagina not in indices:
+                indices.append(pagina)
+    return indices
+
+def extraer_paginas_pdf(datos_pdf: bytes, paginas: List[int]) -> bytes:
+    """
+    Devuelve un PDF nuevo solo con `paginas` (índices desde 0). Las que no
+    existen se ignoran; si no queda ninguna se devuelve el PDF original.
+
+    Se reescribe con garbage=3 para descartar las fuentes e imágenes que solo
+    usaban las páginas eliminadas; sin eso el recorte pesa casi lo mismo.
+    """
+    with fitz.open(stream=datos_pdf, filetype="pdf") as documento:
+        existentes = [p for p in paginas if 0 <= p < documento.page_count]
+        if not existentes:
+            return datos_pdf
+        if existentes == list(range(documento.page_count)):
+            return datos_pdf
+        documento.select(existentes)
+        return documento.tobytes(garbage=3, deflate=True)
+
+def dpi_adaptativo(datos_pdf: bytes, resolucion_por_defecto: int = 150) -> int:
+    """
+    Elige el DPI de rasterización a partir de la capa de texto del PDF: el
+    texto pequeño (percentil 10 del tamaño de letra) debe quedar con
+    ALTURA_TEXTO_PX píxeles, dentro de [DPI_MINIMO, DPI_MAXIMO].
+
+    Un PDF escaneado no tiene capa de texto y usa `resolucion_por_defecto`;
+    uno con muy poco texto se queda en DPI_MINIMO.
+    """
+    tamanos: List[float] = []
+    with fitz.open(stream=datos_pdf, filetype="pdf") as documento:
+        area_pulgadas = 0.0
+        for pagina in documento:
+            area_pulgadas += pagina.rect.width * pagina.rect.height / (72 * 72)
+            for bloque in pagina.get_text("dict", flags=0)["blocks"]:
+                for linea in bloque.get("lines", ()):
+                    for span in linea["spans"]:
+                        if span["text"].strip():
+                            tamanos.append(span["size"])
+
+    if not tamanos:
+        return resolucion_por_defecto
+    # Menos de un renglón por cada dos pulgadas cuadradas: casi no hay texto
+    if len(tamanos) / max(area_pulgadas, 1.0) < 0.5:
+        return DPI_MINIMO
+
+    tamanos.sort()
+    tamano_pequeno = tamanos[len(tamanos) // 10]
+    dpi = ALTURA_TEXTO_PX * 72 / max(tamano_pequeno, 1.0)
+    return int(min(max(dpi, DPI_MINIMO), DPI_MAXIMO))
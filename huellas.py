@@ -0,0 +1,144 @@
+import io
+import os
+import logging
+import procesadores
+from typing import Any, Dict, List, Optional, Tuple
+from PIL import Image, ImageOps
+
+# numpy es opcional: sin él no se calculan huellas y el índice queda deshabilitado
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Índice de huellas perceptuales (dHash) para detectar la misma credencial
+# fotografiada dos veces o re-codificada por una app de mensajería, que el
+# hash de bytes del cache no reconoce.
+HABILITADO = np is not None and os.getenv("HUELLAS_HABILITADO", "1").lower() in ("1", "true", "si", "yes")
+# Tipos con índice: los que tienen "huellas": true en el registro de
+# procesadores, o la lista de HUELLAS_TIPOS si se define
+_TIPOS_ENTORNO = os.getenv("HUELLAS_TIPOS")
+TIPOS = {t.strip() for t in _TIPOS_ENTORNO.split(",") if t.strip()} if _TIPOS_ENTORNO is not None else None
+# "marcar" llama a Document AI de todos modos y agrega "_duplicado" a la
+# respuesta; "reutilizar" devuelve el resultado de la imagen parecida. Dos
+# credenciales distintas del mismo formato pueden quedar cerca, así que
+# reutilizar solo conviene con un umbral estricto.
+MODO = os.getenv("HUELLAS_MODO", "marcar")
+# Lado de la cuadrícula del dHash: LADO * LADO bits por huella
+LADO = 16
+# Bits distintos (de LADO * LADO) hasta los que dos imágenes se consideran la misma
+DISTANCIA_MAXIMA = int(os.getenv("HUELLAS_DISTANCIA_MAXIMA", "12"))
+# Huellas recordadas por tipo de documento; al llenarse se reemplaza la más antigua
+MAX_ENTRADAS = int(os.getenv("HUELLAS_MAX_ENTRADAS", "4096"))
+
+_PALABRAS = LADO * LADO // 64
+_BITS_POR_BYTE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8) if np is not None else None
+
+
+def aplica(doc_type: str, mime_type: str) -> bool:
+    if not HABILITADO or not mime_type.startswith("image/"):
+        return False
+    return doc_type in TIPOS if TIPOS is not None else procesadores.obtener(doc_type, "huellas", False)
+
+
+def calcular(contenido: bytes) -> Optional["np.ndarray"]:
+    """
+    dHash de LADO x LADO bits: cada bit indica si un píxel de la miniatura en
+    escala de grises es más claro que su vecino izquierdo. Depende de los
+    gradientes y no del brillo, la compresión o la resolución.
+
+    Es bloqueante (decodifica la imagen): desde código async debe llamarse con
+    ejecutores.en_hilo. Devuelve None si la imagen no se puede decodificar.
+    """
+    try:
+        imagen = Image.open(io.BytesIO(contenido))
+        # En JPEG decodifica directamente a escala reducida, sin la imagen completa
+        imagen.draft("L", (LADO * 8, LADO * 8))
+        imagen = ImageOps.exif_transpose(imagen)
+        miniatura = imagen.convert("L").resize((LADO + 1, LADO), Image.BOX)
+    except Exception as e:
+        logger.debug("No se pudo calcular la huella de la imagen: %s", e)
+        return None
+    pixeles = np.asarray(miniatura, dtype=np.int16)
+    bits = pixeles[:, 1:] > pixeles[:, :-1]
+    return np.packbits(bits).view(np.uint64)
+
+
+def _distancias(huellas: "np.ndarray", huella: "np.ndarray") -> "np.ndarray":
+    """Distancia de Hamming de `huella` contra cada renglón de `huellas`."""
+    diferencia = huellas ^ huella
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(diferencia).sum(axis=1, dtype=np.int32)
+    return _BITS_POR_BYTE[diferencia.view(np.uint8)].sum(axis=1, dtype=np.int32)
+
+
+class IndiceHuellas:
+    """
+    Huellas de un tipo de documento en un arreglo circular de uint64 (32 bytes
+    por huella) junto a la clave de cache de su resultado. La búsqueda
+    compara contra todas a la vez: unas 4096 huellas toman microsegundos.
+    """
+
+    def __init__(self, max_entradas: int = MAX_ENTRADAS):
+        self.max_entradas = max_entradas
+        self._huellas = np.zeros((max_entradas, _PALABRAS), dtype=np.uint64)
+        self._claves: List[Optional[str]] = [None] * max_entradas
+        self._siguiente = 0
+        self._ocupadas = 0
+        self.consultas = 0
+        self.coincidencias = 0
+
+    def buscar(self, huella: "np.ndarray") -> Optional[Tuple[str, int]]:
+        """Clave y distancia de la huella más parecida, si está dentro de DISTANCIA_MAXIMA."""
+        self.consultas += 1
+        if not self._ocupadas:
+            return None
+        distancias = _distancias(self._huellas[:self._ocupadas], huella)
+        indice = int(distancias.argmin())
+        distancia = int(distancias[indice])
+        if distancia > DISTANCIA_MAXIMA:
+            return None
+        self.coincidencias += 1
+        return self._claves[indice], distancia
+
+    def agregar(self, huella: "np.ndarray", clave: str):
+        self._huellas[self._siguiente] = huella
+        self._claves[self._siguiente] = clave
+        self._siguiente = (self._siguiente + 1) % self.max_entradas
+        self._ocupadas = min(self._ocupadas + 1, self.max_entradas)
+
+    def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "entradas": self._ocupadas,
+            "max_entradas": self.max_entradas,
+            "consultas": self.consultas,
+            "coincidencias": self.coincidencias,
+        }
+
+
+# Un índice por tipo de documento, por proceso
+_indices: Dict[str, IndiceHuellas] = {}
+
+
+def buscar(doc_type: str, huella: "np.ndarray") -> Optional[Tuple[str, int]]:
+    indice = _indices.get(doc_type)
+    return indice.buscar(huella) if indice is not None else None
+
+
+def agregar(doc_type: str, huella: "np.ndarray", clave: str):
+    indice = _indices.get(doc_type)
+    if indice is None:
+        indice = _indices[doc_type] = IndiceHuellas()
+    indice.agregar(huella, clave)
+
+
+def estadisticas() -> Optional[Dict[str, Any]]:
+    if not HABILITADO:
+        return None
+    return {
+        "modo": MODO,
+        "distancia_maxima": DISTANCIA_MAXIMA,
+        "tipos": {doc_type: indice.estadisticas() for doc_type, indice in _indices.items()},
+    }
@@ -0,0 +1,210 @@
+import os
+import logging
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Códigos de Document AI que indican saturación o cuota agotada
+CODIGOS_CONGESTION = {429, 503}
+
+
+class LimiteExcedido(Exception):
+    """No hubo capacidad hacia Document AI antes de que venciera la espera máxima."""
+
+
+class CubetaTokens:
+    """
+    Cubeta de tokens: permite ráfagas de hasta `rafaga` peticiones y un ritmo
+    sostenido de `tasa` peticiones por segundo. Una tasa de 0 la deshabilita.
+    """
+
+    def __init__(self, tasa: float, rafaga: float):
+        self.tasa = tasa
+        self.rafaga = max(rafaga, 1.0)
+        self._tokens = self.rafaga
+        self._ultimo = time.monotonic()
+
+    def _rellenar(self):
+        ahora = time.monotonic()
+        self._tokens = min(self.rafaga, self._tokens + (ahora - self._ultimo) * self.tasa)
+        self._ultimo = ahora
+
+    def espera_necesaria(self) -> float:
+        """Segundos hasta que haya un token disponible (0 si ya lo hay)."""
+        if self.tasa <= 0:
+            return 0.0
+        self._rellenar()
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.tasa
+
+    def consumir(self):
+        if self.tasa > 0:
+            self._tokens -= 1
+
+    def estado(self) -> Dict[str, Any]:
+        if self.tasa > 0:
+            self._rellenar()
+        return {"tasa_por_segundo": self.tasa, "rafaga": self.rafaga, "tokens": round(self._tokens, 2)}
+
+
+class LimitadorProcesador:
+    """
+    Limita las llamadas en curso hacia un procesador de Document AI.
+
+    Combina una cubeta de tokens (ritmo de peticiones) con un límite de
+    concurrencia adaptativo AIMD: el límite crece de forma aditiva con cada
+    respuesta exitosa y se reduce a la mitad ante 429/503 o timeouts. Las
+    peticiones que no caben esperan en cola hasta su fecha límite.
+    """
+
+    def __init__(self, nombre: str, cubeta: CubetaTokens, cubeta_compartida: Optional[CubetaTokens] = None,
+                 concurrencia_inicial: float = 8, concurrencia_minima: float = 1, concurrencia_maxima: float = 64,
+                 espera_maxima: float = 30.0, factor_reduccion: float = 0.5, pausa_reduccion: float = 1.0):
+        self.nombre = nombre
+        self.cubeta = cubeta
+        self.cubeta_compartida = cubeta_compartida
+        self.limite = float(concurrencia_inicial)
+        self.concurrencia_minima = concurrencia_minima
+        self.concurrencia_maxima = concurrencia_maxima
+        self.espera_maxima = espera_maxima
+        self.factor_reduccion = factor_reduccion
+        # Evita reducir varias veces por la misma ráfaga de errores concurrentes
+        self.pausa_reduccion = pausa_reduccion
+        self._ultima_reduccion = 0.0
+        self.en_curso = 0
+        self.en_espera = 0
+        self.rechazadas = 0
+        self._condicion = asyncio.Condition()
+
+    def _espera_tokens(self) -> float:
+        espera = self.cubeta.espera_necesaria()
+        if self.cubeta_compartida is not None:
+            espera = max(espera, self.cubeta_compartida.espera_necesaria())
+        return espera
+
+    @asynccontextmanager
+    async def adquirir(self, deadline: Optional[float] = None):
+        """
+        Espera un lugar para llamar al procesador.
+
+        Args:
+            deadline: Instante límite (time.monotonic) para obtener lugar. Por
+                      defecto se usa espera_maxima desde ahora.
+        """
+        limite_espera = time.monotonic() + self.espera_maxima
+        if deadline is not None:
+            limite_espera = min(limite_espera, deadline)
+
+        async with self._condicion:
+            self.en_espera += 1
+            try:
+                while True:
+                    hay_lugar = self.en_curso < int(self.limite)
+                    espera_tokens = self._espera_tokens() if hay_lugar else None
+                    if hay_lugar and espera_tokens == 0:
+                        break
+
+                    restante = limite_espera - time.monotonic()
+                    if restante <= 0:
+                        self.rechazadas += 1
+                        raise LimiteExcedido(
+                            f"sin capacidad para '{self.nombre}' (en curso {self.en_curso}, límite {int(self.limite)})"
+                        )
+                    # Sin lugar libre se espera a que alguien libere; sin
+                    # tokens, a que la cubeta se rellene
+                    timeout = restante if espera_tokens is None else min(restante, espera_tokens)
+                    try:
+                        await asyncio.wait_for(self._condicion.wait(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        pass
+
+                self.cubeta.consumir()
+                if self.cubeta_compartida is not None:
+                    self.cubeta_compartida.consumir()
+                self.en_curso += 1
+            finally:
+                self.en_espera -= 1
+
+        try:
+            yield self
+        finally:
+            async with self._condicion:
+                self.en_curso -= 1
+                self._condicion.notify()
+
+    def registrar_exito(self):
+        """Incremento aditivo: aproximadamente +1 de límite por cada ventana completa."""
+        self.limite = min(self.concurrencia_maxima, self.limite + 1.0 / max(self.limite, 1.0))
+
+    def registrar_congestion(self):
+        """Reducción multiplicativa ante 429/503 o timeouts del procesador."""
+        ahora = time.monotonic()
+        if ahora - self._ultima_reduccion < self.pausa_reduccion:
+            return
+        self._ultima_reduccion = ahora
+        self.limite = max(self.concurrencia_minima, self.limite * self.factor_reduccion)
+        logger.info("Límite de concurrencia para %s reducido a %.1f", self.nombre, self.limite)
+
+    def registrar_respuesta(self, status_code: int):
+        """
+        Solo un 2xx abre el límite. Los demás 4xx (400, 401, 404...) son
+        errores de la petición y no dicen nada de la capacidad del procesador.
+        """
+        if status_code in CODIGOS_CONGESTION:
+            self.registrar_congestion()
+        elif 200 <= status_code < 300:
+            self.registrar_exito()
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            "limite_concurrencia": round(self.limite, 2),
+            "en_curso": self.en_curso,
+            "en_espera": self.en_espera,
+            "rechazadas": self.rechazadas,
+            "cubeta": self.cubeta.estado(),
+        }
+
+
+# Cuota compartida por todos los procesadores del proyecto (0 = sin límite)
+_cubeta_proyecto = CubetaTokens(
+    tasa=float(os.getenv("LIMITE_RPS_PROYECTO", "0")),
+    rafaga=float(os.getenv("LIMITE_RAFAGA_PROYECTO", "20")),
+)
+
+_limitadores: Dict[str, LimitadorProcesador] = {}
+
+
+def obtener_limitador(doc_type: str) -> LimitadorProcesador:
+    """
+    Limitador del procesador de un tipo de documento (se crea al primer uso).
+    Su cubeta de tokens, como la del proyecto, está deshabilitada por defecto
+    (LIMITE_RPS_PROCESADOR=0): la concurrencia adaptativa basta mientras no
+    haya una cuota por procesador que respetar.
+    """
+    limitador = _limitadores.get(doc_type)
+    if limitador is None:
+        limitador = LimitadorProcesador(
+            doc_type,
+            CubetaTokens(
+                tasa=float(os.getenv("LIMITE_RPS_PROCESADOR", "0")),
+                rafaga=float(os.getenv("LIMITE_RAFAGA_PROCESADOR", "10")),
+            ),
+            cubeta_compartida=_cubeta_proyecto,
+            concurrencia_inicial=float(os.getenv("LIMITE_CONCURRENCIA_INICIAL", "8")),
+            concurrencia_maxima=float(os.getenv("LIMITE_CONCURRENCIA_MAXIMA", "64")),
+            espera_maxima=float(os.getenv("LIMITE_ESPERA_MAXIMA", "30")),
+        )
+        _limitadores[doc_type] = limitador
+    return limitador
+
+
+def estado_limitadores() -> Dict[str, Any]:
+    """Límites actuales de cada procesador y de la cuota del proyecto."""
+    return {
+        "proyecto": _cubeta_proyecto.estado(),
+        "procesadores": {doc_type: limitador.estado() for doc_type, limitador in _limitadores.items()},
+    }
@@ -0,0 +1,184 @@
+import os
+import json
+import logging
+import ejecutores
+import herramientas
+import funciones
+import procesadores
+from typing import BinaryIO, Optional, Union
+from fastapi import HTTPException, status
+from herramientas import MAX_PAGINAS_PDF
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+
+# Tamaño máximo del cuerpo por ruta, en MB. Las rutas de documentos toman
+# "limite_mb" del registro de procesadores (también en /procesa/<tipo>/).
+# Se puede sobreescribir con CARGA_MAX_MB_<RUTA> (ej.
+# CARGA_MAX_MB_PROCESA_CSF=25); las rutas que no aparecen usan CARGA_MAX_MB.
+LIMITES_RUTA_MB = {
+    "/procesa_lote/": 60,
+    "/jobs/": 20,
+    "/echo-image/": 25,
+}
+LIMITE_POR_DEFECTO_MB = float(os.getenv("CARGA_MAX_MB", "20"))
+
+# Páginas máximas por tipo de documento PDF. Un PDF enviado tal cual a
+# Document AI está sujeto a las 15 páginas del procesamiento en línea; si se
+# recorta o rasteriza (funciones.estrategia_pdf) aplica el límite de
+# herramientas. "paginas_maximas" del registro o PAGINAS_MAX_<TIPO> lo cambian.
+PAGINAS_DOCUMENT_AI = 15
+
+
+def _clave_entorno(ruta: str) -> str:
+    return ruta.strip("/").upper().replace("/", "_").replace("-", "_")
+
+
+def limite_ruta(ruta: str) -> int:
+    """Bytes máximos del cuerpo de una petición a `ruta`."""
+    valor = os.getenv(f"CARGA_MAX_MB_{_clave_entorno(ruta)}")
+    if valor:
+        return int(float(valor) * MB)
+    tipo = procesadores.tipo_por_ruta(ruta)
+    if tipo is not None and tipo.limite_mb:
+        return int(float(tipo.limite_mb) * MB)
+    return int(LIMITES_RUTA_MB.get(ruta, LIMITE_POR_DEFECTO_MB) * MB)
+
+
+def paginas_maximas(doc_type: str) -> Optional[int]:
+    valor = os.getenv(f"PAGINAS_MAX_{doc_type.upper()}")
+    if valor:
+        return int(valor)
+    tipo = procesadores.tipo(doc_type)
+    if tipo is None or not tipo.es_pdf:
+        return None
+    if tipo.paginas_maximas:
+        return int(tipo.paginas_maximas)
+    return PAGINAS_DOCUMENT_AI if funciones.estrategia_pdf(doc_type) == "pdf" else MAX_PAGINAS_PDF
+
+
+def _formatear_tamano(limite: int) -> str:
+    # Con un decimal; límites muy pequeños (ej. en pruebas) se muestran en KB
+    if limite < MB / 10:
+        return f"{limite / 1024:.1f} KB"
+    return f"{limite / MB:.1f} MB"
+
+
+class CargaExcedida(HTTPException):
+    """
+    El cuerpo supera el límite de la ruta. Es una HTTPException para que
+    FastAPI la propague tal cual desde el parseo del formulario y responda 413.
+    """
+
+    def __init__(self, limite: int):
+        super().__init__(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            detail=f"El archivo excede el tamaño máximo permitido ({_formatear_tamano(limite)}).",
+            headers={"Connection": "close"},
+        )
+
+
+class MiddlewareLimiteCarga:
+    """
+    Middleware ASGI que acota el tamaño del cuerpo de cada petición según su
+    ruta, antes de que el formulario multipart se termine de leer y se vuelque
+    a disco o memoria.
+
+    - Si Content-Length ya excede el límite se responde 413 sin leer el cuerpo.
+    - Si no (ej. chunked) se cuentan los bytes conforme llegan y se corta en
+      cuanto se rebasa el límite.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            await self.app(scope, receive, send)
+            return
+
+        limite = limite_ruta(scope["path"])
+        for nombre, valor in scope.get("headers", ()):
+            if nombre == b"content-length":
+                try:
+                    declarado = int(valor)
+                except ValueError:
+                    break
+                if declarado > limite:
+                    logger.warning("Cuerpo rechazado por Content-Length", extra={
+                        "ruta": scope["path"], "bytes_declarados": declarado, "limite_bytes": limite,
+                    })
+                    await self._rechazar(send, limite)
+                    return
+                break
+
+        recibidos = 0
+        respuesta_iniciada = False
+
+        async def recibir():
+            nonlocal recibidos
+            mensaje = await receive()
+            if mensaje["type"] == "http.request":
+                recibidos += len(mensaje.get("body", b""))
+                if recibidos > limite:
+                    logger.warning("Cuerpo rechazado durante la lectura", extra={
+                        "ruta": scope["path"], "bytes_recibidos": recibidos, "limite_bytes": limite,
+                    })
+                    raise CargaExcedida(limite)
+            return mensaje
+
+        async def enviar(mensaje):
+            nonlocal respuesta_iniciada
+            if mensaje["type"] == "http.response.start":
+                respuesta_iniciada = True
+            await send(mensaje)
+
+        try:
+            await self.app(scope, recibir, enviar)
+        except CargaExcedida:
+            # Solo llega aquí si nadie la convirtió en respuesta (ej. fuera de FastAPI)
+            if respuesta_iniciada:
+                raise
+            await self._rechazar(send, limite)
+
+    @staticmethod
+    async def _rechazar(send, limite: int):
+        error = CargaExcedida(limite)
+        cuerpo = json.dumps({"detail": error.detail}, ensure_ascii=False).encode("utf-8")
+        await send({
+            "type": "http.response.start",
+            "status": error.status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(cuerpo)).encode("ascii")),
+                (b"connection", b"close"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": cuerpo})
+
+
+def _contar_paginas(pdf: Union[bytes, BinaryIO]) -> int:
+    # Un upload grande se mapea en memoria en lugar de leerse completo
+    with herramientas.abrir_pdf(pdf) as documento:
+        return documento.page_count
+
+
+async def verificar_paginas(pdf: Union[bytes, BinaryIO], doc_type: str):
+    """
+    Rechaza con 413 un PDF con más páginas de las permitidas para su tipo,
+    antes de rasterizarlo o enviarlo a Document AI. Un PDF ilegible se deja
+    pasar: el error lo reporta la etapa que lo procesa.
+    """
+    maximo = paginas_maximas(doc_type)
+    if maximo is None:
+        return
+    try:
+        paginas = await ejecutores.en_hilo(_contar_paginas, pdf)
+    except Exception:
+        return
+    if paginas > maximo:
+        raise HTTPException(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            detail=f"El PDF tiene {paginas} páginas; el máximo para {doc_type} es {maximo}.",
+        )
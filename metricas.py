@@ -0,0 +1,187 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import AsyncIterator, List, Optional
+
+# Métricas Prometheus y trazas OpenTelemetry opcionales: sin los paquetes
+# instalados todas las funciones de este módulo son no-ops
+try:
+    import prometheus_client
+    from prometheus_client import Counter, Gauge, Histogram
+except ImportError:
+    prometheus_client = None
+
+try:
+    from opentelemetry import trace
+except ImportError:
+    trace = None
+
+OTEL_HABILITADO = trace is not None and os.getenv("OTEL_HABILITADO", "0").lower() in ("1", "true", "si", "yes")
+_tracer = trace.get_tracer("rad") if OTEL_HABILITADO else None
+
+# Etapas instrumentadas de una extracción
+CACHE = "cache"
+PREPROCESAMIENTO = "preprocesamiento"
+RASTERIZACION = "rasterizacion"
+SELECCION_PAGINAS = "seleccion_paginas"
+TEXTO_PDF = "texto_pdf"
+HUELLA = "huella"
+CALIDAD = "calidad"
+TOKEN = "token"
+CODIFICACION = "codificacion"
+ESPERA_LIMITADOR = "espera_limitador"
+LLAMADA = "llamada"
+DECODIFICACION = "decodificacion"
+APLANADO = "aplanado"
+
+_BUCKETS_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60)
+# De 1 KB a 64 MB en potencias de 4
+_BUCKETS_BYTES = tuple(1024 * 4 ** n for n in range(9))
+
+if prometheus_client is not None:
+    ETAPA_SEGUNDOS = Histogram(
+        "rad_etapa_segundos", "Duración de cada etapa de la extracción.",
+        ["etapa", "doc_type"], buckets=_BUCKETS_SEGUNDOS,
+    )
+    DOCUMENTO_BYTES = Histogram(
+        "rad_documento_bytes", "Tamaño del documento recibido y del enviado a Document AI.",
+        ["doc_type", "fase"], buckets=_BUCKETS_BYTES,
+    )
+    RESPUESTA_BYTES = Histogram(
+        "rad_respuesta_bytes", "Tamaño de la respuesta de Document AI.",
+        ["doc_type"], buckets=_BUCKETS_BYTES,
+    )
+    RESPUESTAS_UPSTREAM = Counter(
+        "rad_upstream_respuestas", "Respuestas de Document AI por código HTTP ('error' si no hubo respuesta).",
+        ["doc_type", "codigo"],
+    )
+    CACHE_CONSULTAS = Counter(
+        "rad_cache_consultas", "Consultas al cache de resultados por resultado (hit, similar, miss, coalesced).",
+        ["doc_type", "resultado"],
+    )
+    EXTRACCION_LOCAL = Counter(
+        "rad_extraccion_local", "Intentos de extracción desde la capa de texto del PDF (local, sin_texto, invalido).",
+        ["doc_type", "resultado"],
+    )
+    RECHAZOS_CALIDAD = Counter(
+        "rad_rechazos_calidad", "Imágenes rechazadas antes de Document AI, por problema de calidad.",
+        ["doc_type", "problema"],
+    )
+    MARCAS_CALIDAD = Counter(
+        "rad_marcas_calidad", "Imágenes enviadas a Document AI con problemas de calidad (CALIDAD_MODO=marcar), por problema.",
+        ["doc_type", "problema"],
+    )
+    # livesum: con gunicorn en modo multiproceso se suma el valor de los workers vivos
+    EN_VUELO = Gauge(
+        "rad_documentos_en_vuelo", "Documentos en proceso en este momento.",
+        ["doc_type"], multiprocess_mode="livesum",
+    )
+    UPSTREAM_EN_VUELO = Gauge(
+        "rad_upstream_en_vuelo", "Llamadas a Document AI en curso.",
+        ["doc_type"], multiprocess_mode="livesum",
+    )
+
+
+def observar(nombre: str, doc_type: str, segundos: float):
+    """Registra la duración de una etapa medida por fuera de `etapa()`."""
+    if prometheus_client is not None:
+        ETAPA_SEGUNDOS.labels(nombre, doc_type).observe(segundos)
+
+
+@contextmanager
+def etapa(nombre: str, doc_type: str):
+    """Mide una etapa en el histograma por tipo de documento y, si está habilitado, abre un span."""
+    inicio = time.perf_counter()
+    try:
+        if _tracer is not None:
+            with _tracer.start_as_current_span(f"rad.{nombre}", attributes={"rad.doc_type": doc_type}):
+                yield
+        else:
+            yield
+    finally:
+        observar(nombre, doc_type, time.perf_counter() - inicio)
+
+
+@contextmanager
+def en_vuelo(doc_type: str, upstream: bool = False):
+    """Cuenta en el gauge correspondiente las operaciones en curso."""
+    if prometheus_client is None:
+        yield
+        return
+    gauge = (UPSTREAM_EN_VUELO if upstream else EN_VUELO).labels(doc_type)
+    gauge.inc()
+    try:
+        yield
+    finally:
+        gauge.dec()
+
+
+async def medir_flujo(flujo: AsyncIterator[bytes], nombre: str, doc_type: str) -> AsyncIterator[bytes]:
+    """
+    Envuelve un generador de cuerpo y acumula solo el tiempo que tarda en
+    producir cada bloque (lectura y Base64), sin contar el envío por la red.
+    """
+    acumulado = 0.0
+    try:
+        while True:
+            inicio = time.perf_counter()
+            try:
+                bloque = await flujo.__anext__()
+            except StopAsyncIteration:
+                acumulado += time.perf_counter() - inicio
+                break
+            acumulado += time.perf_counter() - inicio
+            yield bloque
+    finally:
+        observar(nombre, doc_type, acumulado)
+
+
+def registrar_documento(doc_type: str, fase: str, tamano: int):
+    if prometheus_client is not None:
+        DOCUMENTO_BYTES.labels(doc_type, fase).observe(tamano)
+
+
+def registrar_respuesta(doc_type: str, codigo: Optional[int], tamano: Optional[int] = None):
+    if prometheus_client is not None:
+        RESPUESTAS_UPSTREAM.labels(doc_type, str(codigo) if codigo is not None else "error").inc()
+        if tamano is not None:
+            RESPUESTA_BYTES.labels(doc_type).observe(tamano)
+
+
+def registrar_cache(doc_type: str, resultado: str):
+    if prometheus_client is not None:
+        CACHE_CONSULTAS.labels(doc_type, resultado).inc()
+
+
+def registrar_extraccion_local(doc_type: str, resultado: str):
+    if prometheus_client is not None:
+        EXTRACCION_LOCAL.labels(doc_type, resultado).inc()
+
+
+def registrar_rechazo_calidad(doc_type: str, problemas: List[str]):
+    if prometheus_client is not None:
+        for problema in problemas:
+            RECHAZOS_CALIDAD.labels(doc_type, problema).inc()
+
+
+def registrar_marca_calidad(doc_type: str, problemas: List[str]):
+    if prometheus_client is not None:
+        for problema in problemas:
+            MARCAS_CALIDAD.labels(doc_type, problema).inc()
+
+
+def exportar() -> Optional[tuple]:
+    """
+    Cuerpo y Content-Type de la exposición Prometheus, o None si
+    prometheus_client no está instalado. Con PROMETHEUS_MULTIPROC_DIR
+    definido se agregan las métricas de todos los workers de gunicorn.
+    """
+    if prometheus_client is None:
+        return None
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registro = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registro)
+    else:
+        registro = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registro), prometheus_client.CONTENT_TYPE_LATEST
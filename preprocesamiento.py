@@ -0,0 +1,129 @@
+import io
+import logging
+import os
+import procesadores
+from typing import Dict, Any, Tuple
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Firmas de los formatos que Document AI acepta
+_FIRMAS_MIME = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"%PDF", "application/pdf"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"II*\x00", "image/tiff"),
+    (b"MM\x00*", "image/tiff"),
+    (b"BM", "image/bmp"),
+)
+
+# El perfil de preprocesamiento de cada tipo de documento viene del
+# registro de procesadores ("preprocesamiento"; sin él no se preprocesa):
+#   max_lado: lado mayor máximo en píxeles (None = sin reescalar). No aplica
+#     a las páginas unidas de un PDF (CSF): su lado mayor crece con el número
+#     de páginas y reducirlo estrecha el texto hasta hacerlo ilegible; su
+#     tamaño ya lo acotan el DPI y herramientas.MAX_PIXELES_LIENZO.
+#   escala_grises: convertir a escala de grises (solo si el procesador lo tolera)
+#   formato: formato de re-codificación ("JPEG" o "PNG")
+#   calidad: calidad JPEG
+
+
+def perfil_preprocesamiento(doc_type: str):
+    return procesadores.obtener(doc_type, "preprocesamiento")
+
+
+PREPROCESAMIENTO_HABILITADO = os.getenv("PREPROCESAMIENTO_HABILITADO", "1").lower() in ("1", "true", "si", "yes")
+
+
+def detectar_mime(contenido: bytes, por_defecto: str = "application/octet-stream") -> str:
+    """Detecta el tipo MIME real a partir de los primeros bytes del archivo."""
+    for firma, mime in _FIRMAS_MIME:
+        if contenido.startswith(firma):
+            return mime
+    if contenido[:4] == b"RIFF" and contenido[8:12] == b"WEBP":
+        return "image/webp"
+    return por_defecto
+
+
+def _ya_preprocesada(imagen: Image.Image, perfil: Dict[str, Any]) -> bool:
+    """PNG sin EXIF, dentro de max_lado y en el espacio de color del perfil."""
+    if imagen.format != "PNG" or perfil["formato"] != "PNG" or "exif" in imagen.info:
+        return False
+    if perfil["max_lado"] and max(imagen.size) > perfil["max_lado"]:
+        return False
+    return imagen.mode == "L" if perfil["escala_grises"] else imagen.mode in ("RGB", "L")
+
+
+def preprocesar_imagen(contenido: bytes, doc_type: str) -> Tuple[bytes, str, Dict[str, Any]]:
+    """
+    Prepara una imagen para Document AI según el perfil de su tipo de documento:
+    corrige la orientación EXIF, reduce la resolución, convierte a escala de
+    grises si aplica y re-codifica a un formato compacto.
+
+    Es bloqueante (decodifica la imagen): desde código async debe llamarse con
+    ejecutores.en_hilo.
+
+    Returns:
+        Tupla (contenido, mime_type, resumen). Si la imagen no se puede
+        mejorar se devuelve el contenido original con su MIME real.
+    """
+    mime_original = detectar_mime(contenido)
+    perfil = perfil_preprocesamiento(doc_type)
+    resumen = {"bytes_originales": len(contenido), "bytes_finales": len(contenido), "aplicado": False}
+
+    if not PREPROCESAMIENTO_HABILITADO or perfil is None or not mime_original.startswith("image/"):
+        return contenido, mime_original, resumen
+
+    try:
+        imagen = Image.open(io.BytesIO(contenido))
+        # Un PNG que ya tiene la forma final (ej. el que genera el respaldo
+        # con archivos temporales de funciones.procesa_pdf) no se decodifica;
+        # Image.open solo leyó la cabecera
+        if _ya_preprocesada(imagen, perfil):
+            return contenido, mime_original, resumen
+        imagen.load()
+    except Exception as e:
+        logger.warning("No se pudo decodificar la imagen para preprocesarla: %s", e)
+        return contenido, mime_original, resumen
+
+    dimensiones_originales = imagen.size
+    orientacion_exif = imagen.getexif().get(0x0112, 1)
+
+    # 1. Corregir orientación según EXIF (fotos de celular)
+    imagen = ImageOps.exif_transpose(imagen)
+
+    # 2. Reducir al lado mayor máximo del perfil
+    if perfil["max_lado"] and max(imagen.size) > perfil["max_lado"]:
+        imagen.thumbnail((perfil["max_lado"], perfil["max_lado"]), Image.LANCZOS)
+
+    # 3. Espacio de color
+    if perfil["escala_grises"]:
+        imagen = imagen.convert("L")
+    elif imagen.mode not in ("RGB", "L"):
+        imagen = imagen.convert("RGB")
+
+    # 4. Re-codificar
+    buffer = io.BytesIO()
+    if perfil["formato"] == "JPEG":
+        imagen.save(buffer, format="JPEG", quality=perfil["calidad"], optimize=True)
+        mime_final = "image/jpeg"
+    else:
+        imagen.save(buffer, format="PNG")
+        mime_final = "image/png"
+    procesado = buffer.getvalue()
+
+    # Si la re-codificación no ahorra nada y no hubo cambios de orientación o
+    # tamaño, se envía el original
+    sin_cambios = orientacion_exif == 1 and imagen.size == dimensiones_originales
+    if len(procesado) >= len(contenido) and sin_cambios:
+        return contenido, mime_original, resumen
+
+    resumen.update({
+        "bytes_finales": len(procesado),
+        "aplicado": True,
+        "dimensiones_originales": dimensiones_originales,
+        "dimensiones_finales": imagen.size,
+    })
+    return procesado, mime_final, resumen
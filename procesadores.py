@@ -0,0 +1,263 @@
+import os
+import json
+import random
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Registro declarativo de tipos de documento: ruta, validación de la
+# entrada, preprocesamiento y versiones del procesador de Document AI con su
+# peso de tráfico. Se lee de PROCESADORES_ARCHIVO y se recarga en caliente
+# cuando el archivo cambia, sin reiniciar workers ni perder caches y
+# conexiones. Con varios workers cada uno detecta el cambio por su cuenta.
+ARCHIVO = os.getenv("PROCESADORES_ARCHIVO") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "procesadores.json")
+# Cada cuánto se revisa si el archivo cambió; 0 deshabilita la recarga automática
+RECARGA_SEGUNDOS = float(os.getenv("PROCESADORES_RECARGA_SEGUNDOS", "5"))
+
+# URL base de Document AI. DOCUMENT_AI_URL_BASE permite apuntar a otro
+# servidor (ej. el simulador local de simulador/) y ENDPOINT_<TIPO>
+# reemplaza la URL completa de la versión estable de un tipo de documento.
+DOCUMENT_AI_URL_BASE = os.getenv("DOCUMENT_AI_URL_BASE", "https://us-documentai.googleapis.com").rstrip("/")
+
+ENTRADAS = ("imagen", "pdf")
+# Cómo se envía a Document AI un tipo de documento PDF (ver funciones.preparar_pdf)
+ESTRATEGIAS_PDF = ("pdf", "paginas", "imagen", "imagen_adaptativa")
+# Ruta genérica que atiende cualquier tipo registrado: /procesa/<tipo>/
+PREFIJO_RUTA_GENERICA = "/procesa/"
+# Rutas fijas de app.py (y de la documentación de FastAPI) que un tipo de
+# documento no puede ocupar, ni con su ruta propia ni con la de por defecto
+# (/procesa_<nombre>/); un tipo "lote" taparía el endpoint de lotes.
+RUTAS_RESERVADAS = frozenset({
+    "/health", "/estadisticas", "/metrics", "/echo-image", "/procesadores", "/procesadores/recargar",
+    "/procesa_lote", "/jobs", "/docs", "/docs/oauth2-redirect", "/redoc", "/openapi.json",
+})
+PREFIJOS_RESERVADOS = (PREFIJO_RUTA_GENERICA, "/jobs/")
+# procesa_<nombre> es también el nombre de la ruta del tipo en FastAPI
+NOMBRES_RESERVADOS = frozenset({"lote", "documento"})
+
+
+class ConfiguracionInvalida(ValueError):
+    """El archivo de procesadores no se pudo leer o no es válido."""
+
+
+class Version:
+    """
+    Versión de un procesador con su peso de tráfico. La primera versión del
+    tipo es la estable y usa el nombre del tipo para su circuito, limitador
+    y métricas; las demás se identifican como "<tipo>@<version>", así la
+    latencia de un canario se compara lado a lado con la estable.
+    """
+
+    def __init__(self, doc_type: str, nombre: str, url: str, peso: float, estable: bool):
+        self.nombre = nombre
+        self.url = url
+        self.peso = peso
+        self.procesador = doc_type if estable else f"{doc_type}@{nombre}"
+
+    def resumen(self) -> Dict[str, Any]:
+        return {"nombre": self.nombre, "procesador": self.procesador, "url": self.url, "peso": self.peso}
+
+
+class TipoDocumento:
+    """Configuración de un tipo de documento tal como viene en el archivo, ya validada."""
+
+    def __init__(self, nombre: str, datos: Dict[str, Any]):
+        self.nombre = nombre
+        self.ruta = datos.get("ruta") or f"/procesa_{nombre}/"
+        self.resumen = datos.get("resumen") or nombre
+        self.entrada = datos.get("entrada", "imagen")
+        self.campo = datos.get("campo") or ("pdf_file" if self.entrada == "pdf" else "image")
+        self.mime_respaldo = datos.get("mime_respaldo") or ("application/pdf" if self.entrada == "pdf" else "image/png")
+        self.limite_mb = datos.get("limite_mb")
+        self.paginas_maximas = datos.get("paginas_maximas")
+        self.presupuesto_segundos = datos.get("presupuesto_segundos")
+        self.preprocesamiento = datos.get("preprocesamiento")
+        self.pdf = {"estrategia": "pdf", "paginas": "1", "dpi": 150, **(datos.get("pdf") or {})}
+        # Umbrales de calidad_imagen; sin ellos la foto no se revisa
+        self.calidad = datos.get("calidad")
+        # Índice de casi duplicados de huellas (solo imágenes)
+        self.huellas = bool(datos.get("huellas", False))
+        # Respuesta sintética de simulador/sinteticas/ que devuelve el simulador
+        self.respuesta_simulada = datos.get("respuesta_simulada") or nombre
+
+        if self.entrada not in ENTRADAS:
+            raise ConfiguracionInvalida(f"{nombre}: entrada {self.entrada!r} no es válida. Opciones: {list(ENTRADAS)}")
+        if nombre in NOMBRES_RESERVADOS:
+            raise ConfiguracionInvalida(f"{nombre}: el nombre está reservado. Reservados: {sorted(NOMBRES_RESERVADOS)}")
+        if not self.ruta.startswith("/") or self.ruta.startswith(PREFIJOS_RESERVADOS):
+            raise ConfiguracionInvalida(f"{nombre}: ruta {self.ruta!r} no es válida.")
+        if self.ruta.rstrip("/") in RUTAS_RESERVADAS:
+            raise ConfiguracionInvalida(f"{nombre}: la ruta {self.ruta!r} es de la app.")
+        if self.pdf["estrategia"] not in ESTRATEGIAS_PDF:
+            raise ConfiguracionInvalida(
+                f"{nombre}: estrategia PDF {self.pdf['estrategia']!r} no es válida. Opciones: {list(ESTRATEGIAS_PDF)}"
+            )
+        if self.calidad is not None:
+            faltantes = {"lado_minimo", "nitidez_minima"} - set(self.calidad)
+            if faltantes:
+                raise ConfiguracionInvalida(f"{nombre}: a 'calidad' le falta {sorted(faltantes)}.")
+            proporcion = self.calidad.get("proporcion")
+            if proporcion is not None and (len(proporcion) != 2 or proporcion[0] > proporcion[1]):
+                raise ConfiguracionInvalida(f"{nombre}: 'calidad.proporcion' debe ser [mínima, máxima].")
+            self.calidad = {
+                "lado_minimo": float(self.calidad["lado_minimo"]),
+                "nitidez_minima": float(self.calidad["nitidez_minima"]),
+                "proporcion": tuple(proporcion) if proporcion is not None else None,
+                "horizontal": bool(self.calidad.get("horizontal", False)),
+            }
+
+        versiones = datos.get("versiones") or []
+        if not versiones:
+            raise ConfiguracionInvalida(f"{nombre}: debe tener al menos una versión.")
+        self.versiones: List[Version] = []
+        for indice, version in enumerate(versiones):
+            url = version.get("url") or (DOCUMENT_AI_URL_BASE + version["ruta"] if version.get("ruta") else None)
+            if indice == 0:
+                url = os.getenv(f"ENDPOINT_{nombre.upper()}") or url
+            if not url:
+                raise ConfiguracionInvalida(f"{nombre}: la versión {indice + 1} no tiene 'url' ni 'ruta'.")
+            peso = float(version.get("peso", 100))
+            if peso < 0:
+                raise ConfiguracionInvalida(f"{nombre}: el peso de una versión no puede ser negativo.")
+            self.versiones.append(Version(nombre, version.get("nombre") or f"v{indice + 1}", url, peso, indice == 0))
+        if len({v.nombre for v in self.versiones}) != len(self.versiones):
+            raise ConfiguracionInvalida(f"{nombre}: hay versiones con el mismo nombre.")
+        if sum(v.peso for v in self.versiones) <= 0:
+            raise ConfiguracionInvalida(f"{nombre}: al menos una versión debe tener peso mayor a 0.")
+        self._pesos = [v.peso for v in self.versiones]
+
+    @property
+    def es_pdf(self) -> bool:
+        return self.entrada == "pdf"
+
+    def elegir_version(self) -> Version:
+        """Versión para una petición, al azar según los pesos configurados."""
+        if len(self.versiones) == 1:
+            return self.versiones[0]
+        return random.choices(self.versiones, weights=self._pesos)[0]
+
+    def descripcion(self) -> Dict[str, Any]:
+        return {
+            "ruta": self.ruta,
+            "resumen": self.resumen,
+            "entrada": self.entrada,
+            "campo": self.campo,
+            "limite_mb": self.limite_mb,
+            "versiones": [v.resumen() for v in self.versiones],
+        }
+
+
+def _leer(archivo: str) -> Dict[str, TipoDocumento]:
+    try:
+        with open(archivo, "r", encoding="utf-8") as entrada:
+            datos = json.load(entrada)
+        tipos = {nombre.lower(): TipoDocumento(nombre.lower(), config) for nombre, config in datos["tipos"].items()}
+    except ConfiguracionInvalida:
+        raise
+    except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+        raise ConfiguracionInvalida(f"No se pudo leer {archivo}: {e}") from e
+
+    rutas = [tipo.ruta for tipo in tipos.values()]
+    if len(set(rutas)) != len(rutas):
+        raise ConfiguracionInvalida(f"{archivo}: dos tipos de documento usan la misma ruta.")
+    return tipos
+
+
+# Estado actual del registro. Se reemplaza completo en cada recarga, así una
+# petición en curso nunca ve una mezcla de la configuración vieja y la nueva.
+_tipos: Dict[str, TipoDocumento] = _leer(ARCHIVO)
+_por_ruta: Dict[str, TipoDocumento] = {tipo.ruta: tipo for tipo in _tipos.values()}
+_modificado = os.path.getmtime(ARCHIVO)
+_oyentes: List[Callable[[Dict[str, TipoDocumento]], None]] = []
+_tarea: Optional[asyncio.Task] = None
+
+
+def tipo(doc_type: str) -> Optional[TipoDocumento]:
+    return _tipos.get(doc_type)
+
+
+def obtener(doc_type: str, campo: str, por_defecto: Any = None) -> Any:
+    """Valor de un campo de la configuración vigente del tipo (ej. "calidad"), o por_defecto."""
+    encontrado = _tipos.get(doc_type)
+    return getattr(encontrado, campo, por_defecto) if encontrado is not None else por_defecto
+
+
+def tipos() -> Dict[str, TipoDocumento]:
+    return dict(_tipos)
+
+
+def tipo_por_ruta(ruta: str) -> Optional[TipoDocumento]:
+    """Tipo de documento que atiende `ruta`, ya sea su ruta propia o /procesa/<tipo>/."""
+    encontrado = _por_ruta.get(ruta)
+    if encontrado is None and ruta.startswith(PREFIJO_RUTA_GENERICA):
+        encontrado = _tipos.get(ruta[len(PREFIJO_RUTA_GENERICA):].strip("/"))
+    return encontrado
+
+
+def al_recargar(funcion: Callable[[Dict[str, TipoDocumento]], None]):
+    """Registra una función que recibe los tipos nuevos después de cada recarga."""
+    _oyentes.append(funcion)
+
+
+def recargar(forzar: bool = False) -> bool:
+    """
+    Vuelve a leer el archivo si cambió desde la última carga (o siempre, con
+    forzar). Una configuración inválida no reemplaza a la vigente.
+
+    Raises:
+        ConfiguracionInvalida con el motivo, si el archivo no es válido.
+    """
+    global _tipos, _por_ruta, _modificado
+    modificado = os.path.getmtime(ARCHIVO)
+    if not forzar and modificado == _modificado:
+        return False
+    try:
+        nuevos = _leer(ARCHIVO)
+    finally:
+        # Un archivo inválido no se vuelve a intentar hasta que cambie otra vez
+        _modificado = modificado
+    _tipos, _por_ruta = nuevos, {t.ruta: t for t in nuevos.values()}
+    logger.info("Registro de procesadores recargado", extra={"tipos": sorted(nuevos)})
+    for oyente in _oyentes:
+        try:
+            oyente(nuevos)
+        except Exception:
+            logger.exception("Error al aplicar la recarga del registro de procesadores")
+    return True
+
+
+async def _vigilar():
+    while True:
+        await asyncio.sleep(RECARGA_SEGUNDOS)
+        try:
+            recargar()
+        except (OSError, ConfiguracionInvalida) as e:
+            logger.error("No se aplicó la recarga del registro de procesadores: %s", e)
+
+
+def iniciar():
+    """Inicia la revisión periódica del archivo (si RECARGA_SEGUNDOS > 0)."""
+    global _tarea
+    if RECARGA_SEGUNDOS > 0 and _tarea is None:
+        _tarea = asyncio.get_running_loop().create_task(_vigilar())
+
+
+async def detener():
+    global _tarea
+    if _tarea is not None:
+        _tarea.cancel()
+        try:
+            await _tarea
+        except asyncio.CancelledError:
+            pass
+        _tarea = None
+
+
+def estado() -> Dict[str, Any]:
+    return {
+        "archivo": ARCHIVO,
+        "recarga_segundos": RECARGA_SEGUNDOS,
+        "tipos": {nombre: t.descripcion() for nombre, t in _tipos.items()},
+    }
@@ -0,0 +1,255 @@
+import os
+import logging
+import time
+import random
+import asyncio
+import httpx
+import metricas
+import procesadores
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Estados HTTP de Document AI que vale la pena reintentar
+CODIGOS_REINTENTABLES = {429, 500, 502, 503, 504}
+
+# Presupuesto de latencia total (segundos) por tipo de documento, cuando el
+# cliente no envía su propio límite. Viene del registro de procesadores
+# ("presupuesto_segundos") y se puede sobreescribir con PRESUPUESTO_<TIPO>
+# (ej. PRESUPUESTO_CSF=30).
+PRESUPUESTO_POR_DEFECTO = 60.0
+
+MAX_REINTENTOS = int(os.getenv("REINTENTOS_MAXIMOS", "2"))
+BACKOFF_BASE = float(os.getenv("REINTENTOS_BACKOFF_BASE", "0.25"))
+BACKOFF_MAXIMO = float(os.getenv("REINTENTOS_BACKOFF_MAXIMO", "4"))
+
+# Peticiones de cobertura ("hedging"): si un intento supera el p95 observado
+# se lanza un segundo en paralelo y se usa el primero que responda bien
+COBERTURA_HABILITADA = os.getenv("COBERTURA_HABILITADA", "0").lower() in ("1", "true", "si", "yes")
+COBERTURA_MIN_MUESTRAS = int(os.getenv("COBERTURA_MIN_MUESTRAS", "20"))
+
+
+class DeadlineExcedido(Exception):
+    """Se agotó el tiempo disponible para la petición."""
+
+
+def presupuesto(doc_type: str) -> float:
+    """Presupuesto de latencia en segundos para un tipo de documento."""
+    valor = os.getenv(f"PRESUPUESTO_{doc_type.upper()}")
+    if valor:
+        return float(valor)
+    tipo = procesadores.tipo(doc_type)
+    if tipo is not None and tipo.presupuesto_segundos:
+        return float(tipo.presupuesto_segundos)
+    return PRESUPUESTO_POR_DEFECTO
+
+
+def calcular_deadline(doc_type: str, timeout_cliente: Optional[float] = None) -> float:
+    """
+    Instante límite (time.monotonic) de una petición: el menor entre el
+    presupuesto del tipo de documento y el timeout enviado por el cliente.
+    """
+    segundos = presupuesto(doc_type)
+    if timeout_cliente is not None and timeout_cliente > 0:
+        segundos = min(segundos, timeout_cliente)
+    return time.monotonic() + segundos
+
+
+class Plazo:
+    """
+    Deadline que se puede extender. Lo usa la llamada compartida de la
+    coalescencia (vuelo_unico): dura hasta el deadline más lejano de las
+    peticiones que la esperan, no el presupuesto completo del tipo.
+    """
+
+    def __init__(self, limite: float):
+        self.limite = limite
+
+    def extender(self, limite: float):
+        self.limite = max(self.limite, limite)
+
+
+def limite(deadline: Union[float, Plazo]) -> float:
+    """Instante límite (time.monotonic) de un deadline fijo o de un Plazo."""
+    return deadline.limite if isinstance(deadline, Plazo) else deadline
+
+
+def tiempo_restante(deadline: Union[float, Plazo]) -> float:
+    return limite(deadline) - time.monotonic()
+
+
+class HistorialLatencias:
+    """Ventana deslizante de latencias exitosas por tipo de documento."""
+
+    def __init__(self, tamano: int = 200):
+        self._muestras: Dict[str, deque] = {}
+        self._tamano = tamano
+
+    def registrar(self, doc_type: str, segundos: float):
+        self._muestras.setdefault(doc_type, deque(maxlen=self._tamano)).append(segundos)
+
+    def percentil(self, doc_type: str, percentil: float) -> Optional[float]:
+        muestras = self._muestras.get(doc_type)
+        if not muestras or len(muestras) < COBERTURA_MIN_MUESTRAS:
+            return None
+        ordenadas = sorted(muestras)
+        return ordenadas[min(len(ordenadas) - 1, int(len(ordenadas) * percentil))]
+
+    def estado(self) -> Dict[str, Any]:
+        return {
+            doc_type: {
+                "muestras": len(muestras),
+                "p50": self.percentil(doc_type, 0.50),
+                "p95": self.percentil(doc_type, 0.95),
+            }
+            for doc_type, muestras in self._muestras.items()
+        }
+
+
+historial = HistorialLatencias()
+
+
+async def _intento(client: httpx.AsyncClient, url: str, headers: Dict[str, str], cuerpo: Any,
+                   doc_type: str, limitador_procesador, circuito_procesador,
+                   deadline: Union[float, Plazo]) -> httpx.Response:
+    """Un intento individual: pasa por el circuito y el limitador, acotado por el deadline."""
+    # Un circuito abierto falla de inmediato, sin esperar lugar en el limitador
+    circuito_procesador.verificar()
+    try:
+        inicio_espera = time.perf_counter()
+        async with limitador_procesador.adquirir(limite(deadline)):
+            metricas.observar(metricas.ESPERA_LIMITADOR, doc_type, time.perf_counter() - inicio_espera)
+            restante = tiempo_restante(deadline)
+            if restante <= 0:
+                raise DeadlineExcedido("sin tiempo para llamar a Document AI")
+
+            # X-Server-Timeout: Google deja de procesar cuando el cliente ya no espera
+            headers = {**headers, "X-Server-Timeout": f"{restante:.1f}"}
+            inicio = time.monotonic()
+            try:
+                with metricas.en_vuelo(doc_type, upstream=True), metricas.etapa(metricas.LLAMADA, doc_type):
+                    # El timeout de httpx es por fase (conexión, escritura, lectura),
+                    # así que el intento completo se acota además con wait_for
+                    try:
+                        response = await asyncio.wait_for(
+                            client.post(url=url, headers=headers, content=cuerpo, timeout=restante),
+                            timeout=restante
+                        )
+                    except asyncio.TimeoutError:
+                        raise httpx.ReadTimeout(f"Document AI no respondió en {restante:.1f}s") from None
+            except httpx.TimeoutException:
+                limitador_procesador.registrar_congestion()
+                raise
+            limitador_procesador.registrar_respuesta(response.status_code)
+            metricas.registrar_respuesta(doc_type, response.status_code, len(response.content))
+    except httpx.TransportError:
+        metricas.registrar_respuesta(doc_type, None)
+        circuito_procesador.registrar_fallo()
+        raise
+    except BaseException:
+        # Cancelación (cobertura perdedora), deadline o limitador: sin veredicto
+        circuito_procesador.liberar_prueba()
+        raise
+
+    circuito_procesador.registrar_resultado(response.status_code)
+    if response.status_code < 400:
+        historial.registrar(doc_type, time.monotonic() - inicio)
+    return response
+
+
+async def _intento_con_cobertura(client, url, headers, fabrica_cuerpo, doc_type, limitador_procesador,
+                                 circuito_procesador, deadline: Union[float, Plazo]) -> httpx.Response:
+    """
+    Lanza un intento y, si tarda más que el p95 observado, un segundo en
+    paralelo. Devuelve la primera respuesta que no sea reintentable.
+    """
+    def lanzar():
+        return asyncio.ensure_future(
+            _intento(client, url, headers, fabrica_cuerpo(), doc_type, limitador_procesador, circuito_procesador, deadline)
+        )
+
+    umbral = historial.percentil(doc_type, 0.95) if COBERTURA_HABILITADA else None
+    if umbral is None or umbral >= tiempo_restante(deadline):
+        return await _intento(client, url, headers, fabrica_cuerpo(), doc_type, limitador_procesador, circuito_procesador, deadline)
+
+    primero = lanzar()
+    terminados, _ = await asyncio.wait({primero}, timeout=umbral)
+    if terminados:
+        return primero.result()
+
+    logger.info("Intento para %s supera p95 (%.2fs); se lanza petición de cobertura.", doc_type, umbral)
+    pendientes = {primero, lanzar()}
+    ultimo = None
+    try:
+        while pendientes:
+            terminados, pendientes = await asyncio.wait(pendientes, return_when=asyncio.FIRST_COMPLETED)
+            for tarea in terminados:
+                ultimo = tarea
+                if tarea.exception() is None and tarea.result().status_code not in CODIGOS_REINTENTABLES:
+                    return tarea.result()
+        # Ambos fallaron: se propaga el resultado del último
+        return ultimo.result()
+    finally:
+        for tarea in pendientes:
+            tarea.cancel()
+
+
+def _espera_backoff(intento: int, response: Optional[httpx.Response]) -> float:
+    """Backoff exponencial con jitter completo; respeta Retry-After si viene."""
+    espera = random.uniform(0, min(BACKOFF_MAXIMO, BACKOFF_BASE * (2 ** intento)))
+    if response is not None:
+        try:
+            espera = max(espera, float(response.headers.get("Retry-After", 0)))
+        except ValueError:
+            pass
+    return espera
+
+
+async def post_resiliente(client: httpx.AsyncClient, url: str, headers: Dict[str, str],
+                          cuerpo: Union[bytes, Callable[[], Any]], doc_type: str,
+                          limitador_procesador, circuito_procesador, deadline: Union[float, Plazo]) -> httpx.Response:
+    """
+    POST a Document AI con reintentos acotados, backoff con jitter, cobertura
+    opcional y un deadline que se respeta de extremo a extremo.
+
+    Args:
+        cuerpo: bytes del cuerpo o una función que lo genera de nuevo en cada intento
+        deadline: instante límite (time.monotonic) de toda la operación, o un
+                  Plazo que puede extenderse mientras se reintenta
+
+    Returns:
+        La última respuesta recibida (exitosa o no reintentable, o la última
+        reintentable si se agotaron los reintentos).
+
+    Raises:
+        circuito.CircuitoAbierto si el procesador está marcado como caído, o
+        DeadlineExcedido, limitador.LimiteExcedido o httpx.TransportError si
+        no se obtuvo ninguna respuesta.
+    """
+    fabrica_cuerpo = cuerpo if callable(cuerpo) else (lambda: cuerpo)
+    intento = 0
+    while True:
+        response = None
+        try:
+            response = await _intento_con_cobertura(
+                client, url, headers, fabrica_cuerpo, doc_type, limitador_procesador, circuito_procesador, deadline
+            )
+            if response.status_code not in CODIGOS_REINTENTABLES or intento >= MAX_REINTENTOS:
+                return response
+            motivo = f"HTTP {response.status_code}"
+        except httpx.TransportError as e:
+            if intento >= MAX_REINTENTOS or tiempo_restante(deadline) <= 0:
+                raise
+            motivo = f"{type(e).__name__}"
+
+        espera = _espera_backoff(intento, response)
+        if tiempo_restante(deadline) <= espera:
+            # No alcanza el tiempo para otro intento
+            if response is not None:
+                return response
+            raise DeadlineExcedido(f"sin tiempo para reintentar tras {motivo}")
+
+        intento += 1
+        logger.info("Reintento %d/%d para %s en %.2fs (%s).", intento, MAX_REINTENTOS, doc_type, espera, motivo)
+        await asyncio.sleep(espera)
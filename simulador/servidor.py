@@ -0,0 +1,223 @@
+"""
+Simulador local de Document AI para pruebas de carga y benchmarks.
+
+Atiende el mismo endpoint ':process' que Google y devuelve las respuestas
+de entidades de simulador/sinteticas/<tipo>.json, con latencia, tasa de
+error y cuota (429) configurables. Los procesadores que atiende son las
+versiones del registro de procesadores (procesadores.json); un tipo sin
+respuesta sintética recibe un documento sin entidades.
+
+Las respuestas sintéticas están escritas a mano con datos ficticios: imitan
+la forma de una respuesta de Document AI (entidades anidadas, confianza,
+valores normalizados), pero no son capturas del procesador real. Sirven
+para medir la ruta de la app, no para validar nombres de campos ni
+esquemas; eso se hace contra respuestas capturadas (ver
+tests/test_texto_pdf.py, RESPUESTAS_CAPTURADAS).
+
+Uso:
+    uvicorn simulador.servidor:app --port 8081
+
+y en la app:
+    DOCUMENT_AI_URL_BASE=http://127.0.0.1:8081 DOCUMENT_AI_TOKEN_ESTATICO=local uvicorn app:app
+
+Configuración (variables de entorno, o en caliente con PUT /_config):
+    SIMULADOR_LATENCIA_MS      latencia base por petición (300)
+    SIMULADOR_JITTER_MS        variación uniforme +/- sobre la latencia (100)
+    SIMULADOR_MS_POR_MB        latencia adicional por MB del documento (40)
+    SIMULADOR_TASA_ERROR       fracción de peticiones que fallan con 500/503 (0)
+    SIMULADOR_RPS              cuota de peticiones por segundo; excedida -> 429 (0 = sin límite)
+    SIMULADOR_CONCURRENCIA     peticiones simultáneas; excedida -> 429 (0 = sin límite)
+    SIMULADOR_TOKEN            si se define, el Bearer token debe coincidir
+    SIMULADOR_SEMILLA          semilla del generador aleatorio, para corridas reproducibles
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+from collections import Counter
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+import procesadores
+
+logger = logging.getLogger(__name__)
+
+DIRECTORIO_RESPUESTAS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sinteticas")
+# Documento para los tipos del registro sin respuesta sintética
+RESPUESTA_GENERICA = {"document": {"entities": []}}
+
+CONFIGURACION: Dict[str, Any] = {
+    "latencia_ms": float(os.getenv("SIMULADOR_LATENCIA_MS", "300")),
+    "jitter_ms": float(os.getenv("SIMULADOR_JITTER_MS", "100")),
+    "ms_por_mb": float(os.getenv("SIMULADOR_MS_POR_MB", "40")),
+    "tasa_error": float(os.getenv("SIMULADOR_TASA_ERROR", "0")),
+    "rps": float(os.getenv("SIMULADOR_RPS", "0")),
+    "concurrencia": int(os.getenv("SIMULADOR_CONCURRENCIA", "0")),
+    "token": os.getenv("SIMULADOR_TOKEN") or None,
+}
+
+_aleatorio = random.Random(int(os.getenv("SIMULADOR_SEMILLA", "0")))
+_respuestas: Dict[str, Dict[str, Any]] = {}
+_conteo_codigos: Counter = Counter()
+# Documentos recibidos y sus bytes (ya decodificados), por tipo MIME
+_documentos: Counter = Counter()
+_bytes_documentos: Counter = Counter()
+_en_curso = 0
+_cuota = {"tokens": CONFIGURACION["rps"], "actualizado": time.monotonic()}
+
+
+def _cargar_respuestas():
+    for nombre in os.listdir(DIRECTORIO_RESPUESTAS):
+        if nombre.endswith(".json"):
+            with open(os.path.join(DIRECTORIO_RESPUESTAS, nombre), "r", encoding="utf-8") as archivo:
+                _respuestas[nombre[:-5]] = json.load(archivo)
+
+
+_cargar_respuestas()
+
+app = FastAPI(title="Simulador Document AI", version="0.0.0")
+
+
+def _error_google(codigo: int, estado: str, mensaje: str, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    """Error con la misma forma que devuelve la API de Google."""
+    _conteo_codigos[codigo] += 1
+    return JSONResponse(
+        status_code=codigo,
+        content={"error": {"code": codigo, "message": mensaje, "status": estado}},
+        headers=headers,
+    )
+
+
+def _hay_cuota() -> bool:
+    """Cubeta de tokens con ráfaga de 1 s sobre SIMULADOR_RPS."""
+    rps = CONFIGURACION["rps"]
+    if rps <= 0:
+        return True
+    ahora = time.monotonic()
+    _cuota["tokens"] = min(rps, _cuota["tokens"] + (ahora - _cuota["actualizado"]) * rps)
+    _cuota["actualizado"] = ahora
+    if _cuota["tokens"] >= 1:
+        _cuota["tokens"] -= 1
+        return True
+    return False
+
+
+def _procesadores() -> Dict[str, str]:
+    """Ruta ':process' de cada versión del registro -> respuesta sintética de su tipo."""
+    try:
+        # Solo relee el archivo si cambió
+        procesadores.recargar()
+    except procesadores.ConfiguracionInvalida as e:
+        logger.error("Registro de procesadores inválido, se sigue con el anterior: %s", e)
+    return {
+        urlsplit(version.url).path: tipo.respuesta_simulada
+        for tipo in procesadores.tipos().values()
+        for version in tipo.versiones
+    }
+
+
+def _tipo_procesador(ruta: str) -> Optional[str]:
+    return _procesadores().get(f"/v1/{ruta}")
+
+
+@app.post("/v1/{ruta:path}")
+async def procesar(ruta: str, request: Request):
+    global _en_curso
+
+    if not ruta.endswith(":process"):
+        return _error_google(404, "NOT_FOUND", f"Método no soportado: {ruta}")
+    doc_type = _tipo_procesador(ruta)
+    if doc_type is None:
+        return _error_google(404, "NOT_FOUND", "Processor not found.")
+
+    autorizacion = request.headers.get("authorization", "")
+    if not autorizacion.startswith("Bearer ") or (
+        CONFIGURACION["token"] and autorizacion[len("Bearer "):] != CONFIGURACION["token"]
+    ):
+        return _error_google(401, "UNAUTHENTICATED", "Request had invalid authentication credentials.")
+
+    # Se lee el cuerpo completo, igual que el servidor real, antes de decidir
+    cuerpo = await request.body()
+    try:
+        peticion = json.loads(cuerpo)
+        contenido = peticion["rawDocument"]["content"]
+    except (ValueError, KeyError, TypeError):
+        return _error_google(400, "INVALID_ARGUMENT", "Invalid rawDocument.")
+    mime_type = peticion["rawDocument"].get("mimeType") or "desconocido"
+    _documentos[mime_type] += 1
+    _bytes_documentos[mime_type] += len(contenido) * 3 // 4 - contenido[-2:].count("=")
+
+    if not _hay_cuota():
+        return _error_google(429, "RESOURCE_EXHAUSTED", "Quota exceeded for online processing requests.",
+                             headers={"Retry-After": "1"})
+    if CONFIGURACION["concurrencia"] and _en_curso >= CONFIGURACION["concurrencia"]:
+        return _error_google(429, "RESOURCE_EXHAUSTED", "Too many concurrent requests.")
+
+    _en_curso += 1
+    try:
+        megabytes = len(contenido) * 3 / 4 / (1024 * 1024)
+        latencia = CONFIGURACION["latencia_ms"] + CONFIGURACION["ms_por_mb"] * megabytes
+        latencia += _aleatorio.uniform(-CONFIGURACION["jitter_ms"], CONFIGURACION["jitter_ms"])
+        latencia = max(latencia, 0) / 1000
+
+        # X-Server-Timeout: si la respuesta no alcanza, se corta como lo haría Google
+        try:
+            limite = float(request.headers.get("x-server-timeout", "inf"))
+        except ValueError:
+            limite = float("inf")
+        if latencia > limite:
+            await asyncio.sleep(limite)
+            return _error_google(504, "DEADLINE_EXCEEDED", "Deadline exceeded.")
+        await asyncio.sleep(latencia)
+
+        if _aleatorio.random() < CONFIGURACION["tasa_error"]:
+            if _aleatorio.random() < 0.5:
+                return _error_google(500, "INTERNAL", "Internal error encountered.")
+            return _error_google(503, "UNAVAILABLE", "The service is currently unavailable.")
+    finally:
+        _en_curso -= 1
+
+    documento = dict(_respuestas.get(doc_type, RESPUESTA_GENERICA)["document"])
+    # Sin fieldMask la respuesta real incluye el texto OCR y la imagen de la
+    # página, que es del orden del documento enviado
+    if "entities" not in (peticion.get("fieldMask") or ""):
+        documento["text"] = "\n".join(e.get("mentionText", "") for e in documento.get("entities", [])) * 20
+        documento["pages"] = [{"pageNumber": 1, "image": {"mimeType": peticion["rawDocument"].get("mimeType"),
+                                                          "content": contenido}}]
+    _conteo_codigos[200] += 1
+    return Response(content=json.dumps({"document": documento}, ensure_ascii=False), media_type="application/json")
+
+
+@app.get("/_config")
+async def obtener_configuracion():
+    return CONFIGURACION
+
+
+@app.put("/_config")
+async def cambiar_configuracion(cambios: Dict[str, Any]):
+    """Ajusta latencia, errores o cuota sin reiniciar el simulador."""
+    desconocidas = set(cambios) - set(CONFIGURACION)
+    if desconocidas:
+        return JSONResponse(status_code=400, content={"error": f"Claves desconocidas: {sorted(desconocidas)}"})
+    CONFIGURACION.update(cambios)
+    return CONFIGURACION
+
+
+@app.get("/_estadisticas")
+async def estadisticas():
+    return {
+        "en_curso": _en_curso,
+        "codigos": dict(_conteo_codigos),
+        "documentos": dict(_documentos),
+        "bytes_documentos": dict(_bytes_documentos),
+    }
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
@@ -0,0 +1,70 @@
+import os
+import time
+import asyncio
+
+import cache_resultados
+from cache_resultados import CacheResultados
+
+SHA = "a" * 64
+
+
+def test_lru_descarta_la_entrada_menos_usada():
+    async def escenario():
+        cache = CacheResultados(max_entradas=2)
+        await cache.guardar("a", {"valor": 1})
+        await cache.guardar("b", {"valor": 2})
+        # Leer "a" la vuelve la más reciente; la siguiente escritura descarta "b"
+        assert await cache.obtener("a") == {"valor": 1}
+        await cache.guardar("c", {"valor": 3})
+        return [await cache.obtener(clave) for clave in ("a", "b", "c")]
+
+    assert asyncio.run(escenario()) == [{"valor": 1}, None, {"valor": 3}]
+
+
+def test_entrada_expira_con_el_ttl(monkeypatch):
+    ahora = time.time()
+    monkeypatch.setattr(cache_resultados.time, "time", lambda: ahora)
+
+    async def escenario():
+        cache = CacheResultados(ttl_segundos=60)
+        await cache.guardar("a", {"valor": 1})
+        assert await cache.obtener("a") == {"valor": 1}
+        monkeypatch.setattr(cache_resultados.time, "time", lambda: ahora + 61)
+        return await cache.obtener("a"), cache.estadisticas()
+
+    valor, estadisticas = asyncio.run(escenario())
+    assert valor is None
+    assert estadisticas["entradas_memoria"] == 0
+
+
+def test_disco_sobrevive_a_un_cache_nuevo(tmp_path):
+    async def escenario():
+        await CacheResultados(directorio=str(tmp_path)).guardar("a", {"nombre": "JUAN"})
+        # Otro proceso (o un reinicio) empieza con la memoria vacía
+        nuevo = CacheResultados(directorio=str(tmp_path))
+        return await nuevo.obtener("a"), nuevo.estadisticas()
+
+    valor, estadisticas = asyncio.run(escenario())
+    assert valor == {"nombre": "JUAN"}
+    assert estadisticas["entradas_memoria"] == 1
+    assert os.listdir(tmp_path) == ["a.json"]
+
+
+def test_disco_expirado_se_borra(tmp_path, monkeypatch):
+    ahora = time.time()
+
+    async def escenario():
+        await CacheResultados(ttl_segundos=60, directorio=str(tmp_path)).guardar("a", {"valor": 1})
+        monkeypatch.setattr(cache_resultados.time, "time", lambda: ahora + 120)
+        return await CacheResultados(directorio=str(tmp_path)).obtener("a")
+
+    assert asyncio.run(escenario()) is None
+    assert os.listdir(tmp_path) == []
+
+
+def test_clave_cambia_con_la_version_del_procesador():
+    estable = cache_resultados.construir_clave("ine", "https://documentai/processors/1:process", SHA)
+    canario = cache_resultados.construir_clave("ine", "https://documentai/processors/2:process", SHA)
+    assert estable != canario
+    assert estable == cache_resultados.construir_clave("ine", "https://documentai/processors/1:process", SHA)
+    assert cache_resultados.construir_clave("cedula", "https://documentai/processors/1:process", SHA) != estable
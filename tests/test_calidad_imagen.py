@@ -0,0 +1,108 @@
+import io
+import random
+
+import pytest
+
+pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+from PIL import ImageDraw, ImageFilter  # noqa: E402
+
+import calidad_imagen  # noqa: E402
+
+pytestmark = pytest.mark.skipif(not calidad_imagen.HABILITADO, reason="CALIDAD_HABILITADA=0")
+
+
+def _credencial(ancho: int = 1600, alto: int = 1000, fondo: int = 235, tinta: int = 25) -> Image.Image:
+    """Tarjeta en horizontal con renglones de texto nítido."""
+    aleatorio = random.Random(7)
+    imagen = Image.new("L", (ancho, alto), fondo)
+    dibujo = ImageDraw.Draw(imagen)
+    escala = ancho / 1600
+    for renglon in range(int(60 * escala), alto - int(60 * escala), max(int(40 * escala), 8)):
+        x = int(80 * escala)
+        while x < ancho - int(120 * escala):
+            largo = aleatorio.randint(int(20 * escala), int(90 * escala))
+            dibujo.rectangle((x, renglon, x + largo, renglon + max(int(14 * escala), 2)), fill=tinta)
+            x += largo + int(18 * escala)
+    return imagen
+
+
+def _jpeg(imagen: Image.Image) -> bytes:
+    buffer = io.BytesIO()
+    imagen.convert("RGB").save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def _codigos(imagen: Image.Image, doc_type: str = "ine"):
+    return [p["codigo"] for p in calidad_imagen.evaluar(_jpeg(imagen), doc_type)["problemas"]]
+
+
+def test_acepta_foto_nitida_y_bien_expuesta():
+    evaluacion = calidad_imagen.evaluar(_jpeg(_credencial()), "ine")
+    assert evaluacion["problemas"] == []
+    assert calidad_imagen.mensaje_error(evaluacion) is None
+
+
+def test_rechaza_foto_borrosa():
+    assert "borrosa" in _codigos(_credencial().filter(ImageFilter.GaussianBlur(10)))
+
+
+def test_rechaza_poco_contraste():
+    assert "contraste" in _codigos(_credencial(fondo=140, tinta=120))
+
+
+def test_rechaza_imagen_pequena():
+    assert "resolucion" in _codigos(_credencial(640, 400))
+
+
+def test_rechaza_vertical_si_el_perfil_pide_horizontal(monkeypatch):
+    perfil = calidad_imagen.perfil
+    monkeypatch.setattr(calidad_imagen, "perfil", lambda doc_type: {**perfil(doc_type), "horizontal": True})
+    assert "orientacion" in _codigos(_credencial().rotate(90, expand=True))
+
+
+def test_ine_en_vertical_pasa_por_defecto():
+    assert "orientacion" not in _codigos(_credencial().rotate(90, expand=True))
+
+
+def test_imagen_ilegible_no_se_rechaza():
+    assert calidad_imagen.evaluar(b"no es una imagen", "ine")["problemas"] == []
+
+
+def test_mensaje_error_junta_los_problemas():
+    evaluacion = calidad_imagen.evaluar(_jpeg(_credencial(640, 400).filter(ImageFilter.GaussianBlur(10))), "ine")
+    mensaje = calidad_imagen.mensaje_error(evaluacion)
+    assert mensaje.startswith("La imagen no tiene la calidad suficiente")
+    assert "borrosa" in mensaje and "pequeña" in mensaje
+
+
+def _procesa_borrosa(monkeypatch, modo: str):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("httpx")
+    import asyncio
+    import cache_resultados
+    import funciones
+    llamadas = []
+
+    async def llamar_document_ai(doc_type, version, fuente, mime_type, deadline):
+        llamadas.append(doc_type)
+        return {"nombre": {"valor": "JUAN", "confianza": 0.9}}
+
+    monkeypatch.setattr(calidad_imagen, "MODO", modo)
+    monkeypatch.setattr(cache_resultados, "cache", None)
+    monkeypatch.setattr(funciones, "_llamar_document_ai", llamar_document_ai)
+    contenido = _jpeg(_credencial().filter(ImageFilter.GaussianBlur(10)))
+    return asyncio.run(funciones.procesa_documento(contenido, "ine", "image/jpeg")), llamadas
+
+
+def test_modo_marcar_llama_a_document_ai_y_anota_la_respuesta(monkeypatch):
+    resultado, llamadas = _procesa_borrosa(monkeypatch, "marcar")
+    assert llamadas == ["ine"]
+    assert resultado["nombre"] == "JUAN"
+    assert resultado["_calidad"]["problemas"] == ["borrosa"]
+
+
+def test_modo_rechazar_no_llama_a_document_ai(monkeypatch):
+    resultado, llamadas = _procesa_borrosa(monkeypatch, "rechazar")
+    assert llamadas == []
+    assert resultado["error"].startswith("La imagen no tiene la calidad suficiente")
@@ -0,0 +1,209 @@
+import io
+import os
+import asyncio
+import tempfile
+
+import pytest
+
+for _modulo in ("fastapi", "fitz", "PIL", "httpx"):
+    pytest.importorskip(_modulo)
+
+import fitz  # noqa: E402
+from PIL import Image  # noqa: E402
+from fastapi import UploadFile  # noqa: E402
+
+import funciones  # noqa: E402
+import herramientas  # noqa: E402
+import limite_carga  # noqa: E402
+import texto_pdf  # noqa: E402
+
+
+class ArchivoContado:
+    """Archivo que cuenta los bytes leídos con read()."""
+
+    def __init__(self, archivo):
+        self._archivo = archivo
+        self.leidos = 0
+
+    def read(self, cantidad=-1):
+        datos = self._archivo.read(cantidad)
+        self.leidos += len(datos)
+        return datos
+
+    def __getattr__(self, nombre):
+        return getattr(self._archivo, nombre)
+
+
+def _pdf_escaneado(paginas: int = 2) -> bytes:
+    """PDF con una imagen incompresible por página y sin capa de texto."""
+    documento = fitz.open()
+    for indice in range(paginas):
+        imagen = Image.frombytes("RGB", (700, 700), os.urandom(700 * 700 * 3))
+        buffer = io.BytesIO()
+        imagen.save(buffer, format="PNG")
+        pagina = documento.new_page()
+        pagina.insert_image(pagina.rect, stream=buffer.getvalue())
+    return documento.tobytes()
+
+
+def _pdf_con_texto() -> bytes:
+    documento = fitz.open()
+    pagina = documento.new_page()
+    for renglon in range(20):
+        pagina.insert_text((72, 72 + renglon * 20), f"Renglón {renglon} con texto de la cédula profesional")
+    return documento.tobytes()
+
+
+def _upload(contenido: bytes) -> ArchivoContado:
+    spool = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    spool.write(contenido)
+    spool.seek(0)
+    return ArchivoContado(spool)
+
+
+@pytest.fixture(scope="module")
+def escaneado() -> bytes:
+    contenido = _pdf_escaneado()
+    assert len(contenido) > herramientas.TAMANO_LECTURA_COMPLETA
+    return contenido
+
+
+def test_contar_paginas_no_lee_el_upload_completo(escaneado):
+    archivo = _upload(escaneado)
+    assert limite_carga._contar_paginas(archivo) == 2
+    assert archivo.leidos == 0
+    assert archivo.tell() == 0
+
+
+def test_pdf_escaneado_se_envia_desde_el_upload(escaneado, monkeypatch):
+    enviados = []
+
+    async def procesa_documento(archivo, doc_type, **_):
+        enviados.append(archivo)
+        return {}
+
+    monkeypatch.setattr(texto_pdf, "HABILITADO", True)
+    monkeypatch.setattr(funciones, "procesa_documento", procesa_documento)
+    archivo = _upload(escaneado)
+    upload = UploadFile(archivo, size=len(escaneado), filename="cedula.pdf")
+
+    asyncio.run(funciones.procesa_tipo(upload, "cedula"))
+    assert enviados == [upload]
+    assert archivo.leidos == 0
+
+
+def test_pdf_con_texto_se_lee_para_la_extraccion_local(monkeypatch):
+    recibidos = []
+
+    async def procesa_pdf(contenido, doc_type, deadline=None, **_):
+        recibidos.append(contenido)
+        return {}
+
+    monkeypatch.setattr(texto_pdf, "HABILITADO", True)
+    monkeypatch.setattr(funciones, "procesa_pdf", procesa_pdf)
+    contenido = _pdf_con_texto()
+    upload = UploadFile(_upload(contenido), size=len(contenido), filename="cedula.pdf")
+
+    asyncio.run(funciones.procesa_tipo(upload, "cedula"))
+    assert recibidos == [contenido]
+
+
+def test_pdf_que_no_se_puede_rasterizar_responde_413(monkeypatch):
+    from fastapi.testclient import TestClient
+    import app
+
+    monkeypatch.setenv("ESTRATEGIA_CSF", "imagen")
+    monkeypatch.setattr(herramientas, "MAX_PAGINAS_PDF", 1)
+    contenido = _pdf_escaneado(2)
+    with pytest.raises(herramientas.PaginasExcedidas):
+        asyncio.run(funciones.procesa_pdf(contenido, "csf"))
+
+    cliente = TestClient(app.app)
+    respuesta = cliente.post("/procesa_csf/", files={"pdf_file": ("csf.pdf", contenido, "application/pdf")})
+    assert respuesta.status_code == 413
+    assert "páginas" in respuesta.json()["detail"]
+
+
+def _pdf_anchos_mixtos() -> bytes:
+    """Carta vertical seguida de una página apaisada más ancha, con texto."""
+    documento = fitz.open()
+    for ancho, alto in ((612, 792), (842, 595)):
+        pagina = documento.new_page(width=ancho, height=alto)
+        for renglon in range(10):
+            pagina.insert_text((40, 60 + renglon * 40), f"Renglón {renglon} de la página de {ancho} puntos")
+    return documento.tobytes()
+
+
+@pytest.mark.parametrize("escala_grises", [False, True])
+def test_png_en_disco_coincide_con_el_lienzo_en_memoria(tmp_path, escala_grises):
+    contenido = _pdf_anchos_mixtos()
+    ruta_pdf = tmp_path / "documento.pdf"
+    ruta_pdf.write_bytes(contenido)
+    ruta_png = tmp_path / "unido.png"
+
+    herramientas.unir_paginas_pdf_a_una_imagen(str(ruta_pdf), str(ruta_png), 72, escala_grises)
+    en_memoria = herramientas.renderizar_pdf_unido(contenido, 72)
+    with Image.open(ruta_png) as en_disco:
+        assert en_disco.mode == ("L" if escala_grises else "RGB")
+        assert en_disco.size == en_memoria.size
+        if not escala_grises:
+            assert en_disco.tobytes() == en_memoria.tobytes()
+
+
+def test_pdf_grande_se_rasteriza_con_temporales(tmp_path, monkeypatch):
+    recibidos = []
+
+    async def procesa_documento(archivo, doc_type, mime_type_override=None, deadline=None, **opciones):
+        with Image.open(archivo) as imagen:
+            recibidos.append((os.path.dirname(archivo), imagen.mode, mime_type_override))
+        return {}
+
+    monkeypatch.setenv("ESTRATEGIA_CSF", "imagen")
+    monkeypatch.setattr(texto_pdf, "HABILITADO", False)
+    monkeypatch.setattr(funciones, "UMBRAL_ARCHIVO_TEMPORAL", 1)
+    monkeypatch.setattr(funciones, "TEMP_DIR_ROOT", str(tmp_path))
+    monkeypatch.setattr(funciones, "procesa_documento", procesa_documento)
+
+    asyncio.run(funciones.procesa_pdf(_pdf_anchos_mixtos(), "csf"))
+    [(directorio, modo, mime_type)] = recibidos
+    # El perfil de la CSF pide escala de grises; los temporales se borran al terminar
+    assert os.path.dirname(directorio) == str(tmp_path)
+    assert (modo, mime_type) == ("L", "image/png")
+    assert os.listdir(tmp_path) == []
+
+
+def test_presupuesto_de_pixeles_usa_el_lienzo_real(monkeypatch):
+    # Una tira angosta y muy alta más una página ancha y baja: la suma de
+    # áreas queda muy por debajo del lienzo (ancho máximo x alto total)
+    documento = fitz.open()
+    documento.new_page(width=100, height=2000)
+    documento.new_page(width=2000, height=100)
+    monkeypatch.setattr(herramientas, "MAX_PIXELES_LIENZO", 1_000_000)
+
+    imagen = herramientas.renderizar_pdf_unido(documento.tobytes(), 72)
+    assert imagen.width * imagen.height <= 1_000_000 * 1.01
+
+
+def test_lote_aplica_limites_de_paginas_y_tamano_por_elemento(monkeypatch):
+    llamadas = []
+
+    async def procesa_pdf(contenido, doc_type, deadline=None, **opciones):
+        llamadas.append(doc_type)
+        return {}
+
+    monkeypatch.setenv("PAGINAS_MAX_CSF", "1")
+    monkeypatch.setenv("CARGA_MAX_MB_PROCESA_CEDULA", str(100 / limite_carga.MB))
+    monkeypatch.setattr(funciones, "procesa_pdf", procesa_pdf)
+    dos_paginas = _pdf_anchos_mixtos()
+    una_pagina = _pdf_con_texto()
+
+    lote = asyncio.run(funciones.procesa_lote([
+        ("csf", "csf.pdf", dos_paginas),
+        ("cedula", "cedula.pdf", una_pagina),
+        ("csf", "csf_corta.pdf", una_pagina),
+    ]))
+    errores = [elemento.get("error") for elemento in lote["elementos"]]
+    assert "2 páginas" in errores[0]
+    assert "tamaño máximo" in errores[1]
+    assert errores[2] is None
+    assert llamadas == ["csf"]
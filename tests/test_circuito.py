@@ -0,0 +1,83 @@
+import pytest
+
+import circuito
+
+
+class Reloj:
+    def __init__(self):
+        self.ahora = 1000.0
+
+    def __call__(self):
+        return self.ahora
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    reloj = Reloj()
+    monkeypatch.setattr(circuito.time, "monotonic", reloj)
+    return reloj
+
+
+def test_se_abre_tras_fallos_consecutivos_y_rechaza_de_inmediato(reloj):
+    prueba = circuito.Circuito("prueba", umbral_fallos=3, tiempo_apertura=30)
+    for _ in range(2):
+        prueba.registrar_resultado(503)
+    # Una respuesta correcta reinicia la cuenta
+    prueba.registrar_resultado(200)
+    for _ in range(2):
+        prueba.registrar_resultado(500)
+    assert prueba.estado == circuito.CERRADO
+
+    prueba.registrar_resultado(502)
+    assert prueba.estado == circuito.ABIERTO
+    reloj.ahora += 10
+    with pytest.raises(circuito.CircuitoAbierto) as error:
+        prueba.rechazar_si_abierto()
+    assert error.value.reintentar_en == pytest.approx(20)
+    assert prueba.rechazadas == 1
+
+
+def test_los_4xx_no_cuentan_como_fallo(reloj):
+    prueba = circuito.Circuito("prueba", umbral_fallos=2)
+    for _ in range(5):
+        prueba.registrar_resultado(400)
+        prueba.registrar_resultado(429)
+    assert prueba.estado == circuito.CERRADO
+
+
+def test_semiabierto_deja_pasar_una_prueba_y_se_cierra_si_funciona(reloj):
+    prueba = circuito.Circuito("prueba", umbral_fallos=1, tiempo_apertura=30, max_pruebas=1)
+    prueba.registrar_fallo()
+    reloj.ahora += 31
+
+    prueba.verificar()
+    assert prueba.estado == circuito.SEMIABIERTO
+    # Mientras la prueba está en curso, las demás se rechazan
+    with pytest.raises(circuito.CircuitoAbierto):
+        prueba.verificar()
+
+    prueba.registrar_resultado(200)
+    assert prueba.estado == circuito.CERRADO
+    prueba.verificar()
+
+
+def test_prueba_fallida_vuelve_a_abrir(reloj):
+    prueba = circuito.Circuito("prueba", umbral_fallos=1, tiempo_apertura=30)
+    prueba.registrar_fallo()
+    reloj.ahora += 31
+    prueba.verificar()
+    prueba.registrar_resultado(503)
+    assert prueba.estado == circuito.ABIERTO
+    assert prueba.aperturas == 2
+    with pytest.raises(circuito.CircuitoAbierto):
+        prueba.verificar()
+
+
+def test_prueba_cancelada_libera_su_lugar(reloj):
+    prueba = circuito.Circuito("prueba", umbral_fallos=1, tiempo_apertura=30)
+    prueba.registrar_fallo()
+    reloj.ahora += 31
+    prueba.verificar()
+    prueba.liberar_prueba()
+    prueba.verificar()
+    assert prueba.pruebas_en_curso == 1
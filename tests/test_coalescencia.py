@@ -0,0 +1,170 @@
+import gc
+import os
+import time
+import asyncio
+import logging
+import tempfile
+
+import pytest
+
+for _modulo in ("fastapi", "fitz", "PIL", "httpx"):
+    pytest.importorskip(_modulo)
+
+import cache_resultados  # noqa: E402
+import cuerpo_documento  # noqa: E402
+import funciones  # noqa: E402
+import procesadores  # noqa: E402
+import resiliencia  # noqa: E402
+from vuelo_unico import VueloUnico  # noqa: E402
+
+GRANDE = cuerpo_documento.TAMANO_COPIA_MEMORIA * 2
+
+
+def _pdf_falso(tamano: int) -> bytes:
+    return b"%PDF-1.7\n" + os.urandom(tamano)
+
+
+def test_vuelo_unico_comparte_una_sola_ejecucion():
+    llamadas = 0
+
+    async def operacion(plazo):
+        nonlocal llamadas
+        llamadas += 1
+        await asyncio.sleep(0.05)
+        return "resultado"
+
+    async def escenario():
+        vuelo = VueloUnico()
+        return await asyncio.gather(*(vuelo.ejecutar("clave", operacion, time.monotonic() + 5) for _ in range(5)))
+
+    resultados = asyncio.run(escenario())
+    assert llamadas == 1
+    assert [r for r, _ in resultados] == ["resultado"] * 5
+    assert sorted(c for _, c in resultados) == [False, True, True, True, True]
+
+
+def test_fuente_independiente_sobrevive_al_borrado_del_archivo(tmp_path):
+    contenido = _pdf_falso(GRANDE)
+    ruta = tmp_path / "temporal.png"
+    ruta.write_bytes(contenido)
+
+    original = cuerpo_documento.FuenteDocumento(str(ruta))
+    copia = original.independiente()
+    original.cerrar()
+    os.remove(ruta)
+    try:
+        assert copia.tamano() == len(contenido)
+        assert copia.a_bytes() == contenido
+        assert copia.leer(5, 10) == contenido[5:15]
+    finally:
+        copia.cerrar()
+
+
+def test_fuente_independiente_sobrevive_al_cierre_del_upload():
+    contenido = _pdf_falso(GRANDE)
+    for tamano in (len(contenido), 1024):
+        datos = contenido[:tamano]
+        upload = tempfile.SpooledTemporaryFile(max_size=cuerpo_documento.TAMANO_COPIA_MEMORIA)
+        upload.write(datos)
+        copia = cuerpo_documento.FuenteDocumento(upload).independiente()
+        upload.close()
+        try:
+            assert copia.a_bytes() == datos
+        finally:
+            copia.cerrar()
+
+
+def test_seguidor_no_depende_del_archivo_ni_del_deadline_del_lider(tmp_path, monkeypatch):
+    contenido = _pdf_falso(GRANDE)
+    ruta = tmp_path / "lider.pdf"
+    ruta.write_bytes(contenido)
+    deadlines = []
+
+    async def llamar_document_ai(doc_type, version, fuente, mime_type, deadline):
+        deadlines.append(deadline)
+        await asyncio.sleep(0.3)
+        return {"bytes_leidos": {"valor": len(fuente.a_bytes()), "confianza": 1.0}}
+
+    monkeypatch.setattr(cache_resultados, "cache", None)
+    monkeypatch.setattr(funciones, "_llamar_document_ai", llamar_document_ai)
+    version = procesadores.tipo("cedula").versiones[0]
+
+    async def escenario():
+        fuente_lider = cuerpo_documento.FuenteDocumento(str(ruta))
+        limite_lider = time.monotonic() + 0.1
+        lider = asyncio.create_task(funciones._procesa_fuente(
+            fuente_lider, "cedula", version, "application/pdf", "application/pdf", limite_lider
+        ))
+        await asyncio.sleep(0.05)
+        seguidor = asyncio.create_task(funciones._procesa_fuente(
+            cuerpo_documento.FuenteDocumento(contenido), "cedula", version,
+            "application/pdf", "application/pdf", time.monotonic() + 5
+        ))
+        resultado_lider = await lider
+        # El líder ya respondió: su archivo se cierra y se borra como lo haría
+        # el upload o el flujo con archivos temporales
+        fuente_lider.cerrar()
+        os.remove(ruta)
+        return limite_lider, resultado_lider, await seguidor
+
+    limite_lider, resultado_lider, resultado_seguidor = asyncio.run(escenario())
+    assert "Tiempo límite agotado" in resultado_lider["error"]
+    assert resultado_seguidor["_cache"] == "coalesced"
+    assert resultado_seguidor["bytes_leidos"]["valor"] == len(contenido)
+    # El plazo de la llamada compartida se extendió al deadline del seguidor
+    assert len(deadlines) == 1 and resiliencia.limite(deadlines[0]) > limite_lider + 1
+
+
+def test_lider_que_agota_su_tiempo_cancela_la_llamada_sin_esperas(monkeypatch):
+    eventos = []
+
+    async def llamar_document_ai(doc_type, version, fuente, mime_type, deadline):
+        eventos.append(("inicio", round(resiliencia.tiempo_restante(deadline), 1)))
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            eventos.append(("cancelada", None))
+            raise
+        return {"campo": {"valor": "x", "confianza": 1.0}}
+
+    monkeypatch.setattr(cache_resultados, "cache", None)
+    monkeypatch.setattr(funciones, "_llamar_document_ai", llamar_document_ai)
+    version = procesadores.tipo("cedula").versiones[0]
+
+    async def escenario():
+        resultado = await funciones._procesa_fuente(
+            cuerpo_documento.FuenteDocumento(_pdf_falso(1024)), "cedula", version,
+            "application/pdf", "application/pdf", time.monotonic() + 0.2
+        )
+        await asyncio.sleep(0.05)
+        return resultado
+
+    resultado = asyncio.run(escenario())
+    assert "Tiempo límite agotado" in resultado["error"]
+    # La llamada usó el deadline del cliente, no el presupuesto del tipo, y
+    # se canceló en cuanto nadie la esperaba
+    assert eventos == [("inicio", 0.2), ("cancelada", None)]
+    assert funciones._vuelo_unico.en_vuelo() == 0
+
+
+def test_error_sin_peticiones_esperando_se_recupera(caplog):
+    async def operacion(plazo):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            raise RuntimeError("falló al cancelar")
+
+    async def escenario():
+        vuelo = VueloUnico()
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(vuelo.ejecutar("clave", operacion, time.monotonic() + 0.05), timeout=0.05)
+        await asyncio.sleep(0.01)
+        gc.collect()
+        return vuelo
+
+    with caplog.at_level(logging.WARNING):
+        vuelo = asyncio.run(escenario())
+        gc.collect()
+    assert vuelo.en_vuelo() == 0
+    assert "never retrieved" not in caplog.text
+    assert "falló al cancelar" in caplog.text
@@ -0,0 +1,71 @@
+import pytest
+
+pytest.importorskip("fitz")
+pytest.importorskip("fastapi")
+
+import herramientas  # noqa: E402
+
+RESPUESTA = {
+    "document": {
+        "entities": [
+            {"type": "rfc", "mentionText": "GODE561231GR8", "confidence": 0.99},
+            {
+                "type": "domicilio", "mentionText": "CALLE 1", "confidence": 0.8,
+                "properties": [
+                    {"type": "codigo_postal", "mentionText": "06700", "confidence": 0.95},
+                    {"type": "colonia", "mentionText": "ROMA NORTE", "confidence": 0.4},
+                ],
+            },
+            {"type": "regimen", "mentionText": "Sueldos y Salarios", "confidence": 0.9},
+            {"type": "regimen", "mentionText": "Actividad Empresarial", "confidence": 0.7},
+            {
+                "type": "fecha_inicio_operaciones", "mentionText": "01 DE MARZO DE 2015", "confidence": 0.9,
+                "normalizedValue": {"text": "2015-03-01", "dateValue": {"year": 2015, "month": 3, "day": 1}},
+            },
+            {
+                "type": "ingreso", "mentionText": "$1,234.50", "confidence": 0.9,
+                "normalizedValue": {"moneyValue": {"units": "1234", "nanos": 500000000}},
+            },
+            # Sin texto: no genera registro, pero sus propiedades sí
+            {"type": "tabla", "properties": [{"type": "celda", "mentionText": "A1", "confidence": 0.9}]},
+        ]
+    }
+}
+
+
+def test_aplana_subentidades_en_orden_y_conserva_repetidos():
+    registros = herramientas.extraer_entidades(RESPUESTA["document"]["entities"])
+    assert [r.tipo for r in registros] == [
+        "rfc", "domicilio", "codigo_postal", "colonia", "regimen", "regimen",
+        "fecha_inicio_operaciones", "ingreso", "celda",
+    ]
+    datos = herramientas.obtener_datos_completos(RESPUESTA)
+    assert datos["codigo_postal"] == "06700"
+    assert datos["regimen"] == ["Sueldos y Salarios", "Actividad Empresarial"]
+
+
+def test_valores_normalizados_y_confianza():
+    datos = herramientas.obtener_datos_completos(RESPUESTA, detallado=True)
+    assert datos["fecha_inicio_operaciones"]["normalizado"] == "2015-03-01"
+    assert datos["ingreso"]["normalizado"] == 1234.5
+    assert datos["rfc"] == {"valor": "GODE561231GR8", "confianza": 0.99, "normalizado": None}
+
+
+def test_umbral_de_confianza():
+    datos = herramientas.obtener_datos_completos(RESPUESTA, umbral_confianza=0.85)
+    assert "colonia" not in datos and "domicilio" not in datos
+    assert datos["regimen"] == "Sueldos y Salarios"
+
+    # El cache guarda la forma detallada y el umbral se aplica al responder
+    detallados = herramientas.obtener_datos_completos(RESPUESTA, detallado=True)
+    assert herramientas.formatear_datos_detallados(detallados, umbral_confianza=0.85) == datos
+
+
+def test_anidamiento_profundo_sin_recursion():
+    entidad = {"type": "hoja", "mentionText": "x", "confidence": 1.0}
+    for nivel in range(5000):
+        entidad = {"type": f"nivel{nivel}", "mentionText": "n", "confidence": 1.0, "properties": [entidad]}
+    registros = herramientas.extraer_entidades([entidad])
+    assert len(registros) == 5001
+    assert registros[-1].tipo == "hoja"
+
@@ -0,0 +1,74 @@
+import io
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+from PIL import ImageDraw  # noqa: E402
+
+import huellas  # noqa: E402
+
+
+def _credencial(semilla: int, ancho: int = 1600, alto: int = 1000) -> Image.Image:
+    """Tarjeta con bloques de distinto tono colocados al azar según la semilla."""
+    aleatorio = random.Random(semilla)
+    imagen = Image.new("RGB", (ancho, alto), (230, 230, 225))
+    dibujo = ImageDraw.Draw(imagen)
+    for _ in range(60):
+        x, y = aleatorio.randrange(ancho - 200), aleatorio.randrange(alto - 100)
+        tono = aleatorio.randrange(20, 200)
+        dibujo.rectangle((x, y, x + aleatorio.randrange(40, 200), y + aleatorio.randrange(20, 100)),
+                         fill=(tono, tono, tono))
+    return imagen
+
+
+def _codificar(imagen: Image.Image, formato: str = "JPEG", **opciones) -> bytes:
+    buffer = io.BytesIO()
+    imagen.save(buffer, format=formato, **opciones)
+    return buffer.getvalue()
+
+
+def _distancia(a: bytes, b: bytes) -> int:
+    indice = huellas.IndiceHuellas(max_entradas=1)
+    indice.agregar(huellas.calcular(a), "a")
+    distancias = huellas._distancias(indice._huellas, huellas.calcular(b))
+    return int(distancias[0])
+
+
+def test_misma_foto_recodificada_queda_cerca():
+    original = _credencial(1)
+    # Reenviada por una app de mensajería: más chica, más comprimida y en PNG
+    reenviada = original.resize((800, 500))
+    assert _distancia(_codificar(original, quality=95), _codificar(reenviada, quality=40)) <= huellas.DISTANCIA_MAXIMA
+    assert _distancia(_codificar(original), _codificar(original, "PNG")) <= huellas.DISTANCIA_MAXIMA
+
+
+def test_credenciales_distintas_quedan_lejos():
+    assert _distancia(_codificar(_credencial(1)), _codificar(_credencial(2))) > huellas.DISTANCIA_MAXIMA
+
+
+def test_huella_tiene_lado_por_lado_bits():
+    huella = huellas.calcular(_codificar(_credencial(1)))
+    assert huella.dtype == np.uint64
+    assert huella.size * 64 == huellas.LADO * huellas.LADO
+
+
+def test_imagen_ilegible_no_tiene_huella():
+    assert huellas.calcular(b"no es una imagen") is None
+
+
+def test_indice_devuelve_la_clave_mas_parecida_y_descarta_la_mas_antigua():
+    fotos = [huellas.calcular(_codificar(_credencial(semilla))) for semilla in range(3)]
+    indice = huellas.IndiceHuellas(max_entradas=2)
+    assert indice.buscar(fotos[0]) is None
+
+    indice.agregar(fotos[0], "clave0")
+    indice.agregar(fotos[1], "clave1")
+    assert indice.buscar(fotos[1]) == ("clave1", 0)
+
+    # Lleno: la tercera reemplaza a la primera
+    indice.agregar(fotos[2], "clave2")
+    assert indice.buscar(fotos[0]) is None
+    assert indice.buscar(fotos[2]) == ("clave2", 0)
+    assert indice.estadisticas()["entradas"] == 2
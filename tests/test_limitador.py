@@ -0,0 +1,65 @@
+import time
+import asyncio
+
+import pytest
+
+import limitador
+
+
+def _limitador(**opciones) -> limitador.LimitadorProcesador:
+    return limitador.LimitadorProcesador("prueba", limitador.CubetaTokens(tasa=0, rafaga=1), **opciones)
+
+
+def test_solo_2xx_abre_el_limite():
+    limitador_prueba = _limitador(concurrencia_inicial=4, pausa_reduccion=0)
+    for codigo in (400, 401, 403, 404, 500):
+        limitador_prueba.registrar_respuesta(codigo)
+    assert limitador_prueba.limite == 4
+
+    limitador_prueba.registrar_respuesta(200)
+    assert limitador_prueba.limite == pytest.approx(4.25)
+
+
+def test_429_y_503_reducen_el_limite_a_la_mitad():
+    limitador_prueba = _limitador(concurrencia_inicial=8, pausa_reduccion=0)
+    limitador_prueba.registrar_respuesta(429)
+    assert limitador_prueba.limite == 4
+    limitador_prueba.registrar_respuesta(503)
+    assert limitador_prueba.limite == 2
+
+
+def test_rechaza_al_vencer_la_espera_sin_lugar():
+    limitador_prueba = _limitador(concurrencia_inicial=1, espera_maxima=0.05)
+
+    async def escenario():
+        async with limitador_prueba.adquirir():
+            with pytest.raises(limitador.LimiteExcedido):
+                async with limitador_prueba.adquirir():
+                    pass
+        # Al liberar el lugar la siguiente petición entra sin esperar
+        async with limitador_prueba.adquirir():
+            assert limitador_prueba.en_curso == 1
+
+    asyncio.run(escenario())
+    assert limitador_prueba.rechazadas == 1
+
+
+def test_cubeta_de_tokens_marca_el_ritmo():
+    cubeta = limitador.CubetaTokens(tasa=10, rafaga=2)
+    for _ in range(2):
+        assert cubeta.espera_necesaria() == 0
+        cubeta.consumir()
+    assert cubeta.espera_necesaria() == pytest.approx(0.1, abs=0.02)
+    assert limitador.CubetaTokens(tasa=0, rafaga=1).espera_necesaria() == 0
+
+
+def test_cubeta_por_procesador_deshabilitada_por_defecto(monkeypatch):
+    monkeypatch.delenv("LIMITE_RPS_PROCESADOR", raising=False)
+    monkeypatch.setattr(limitador, "_limitadores", {})
+    cubeta = limitador.obtener_limitador("prueba").cubeta
+    assert cubeta.tasa == 0
+    inicio = time.monotonic()
+    for _ in range(100):
+        assert cubeta.espera_necesaria() == 0
+        cubeta.consumir()
+    assert time.monotonic() - inicio < 1
@@ -0,0 +1,74 @@
+import json
+import asyncio
+
+import pytest
+
+for _modulo in ("fastapi", "httpx"):
+    pytest.importorskip(_modulo)
+
+import limite_carga  # noqa: E402
+
+LIMITE = 1000
+
+
+async def _eco(scope, receive, send):
+    """App ASGI que lee el cuerpo completo y responde cuántos bytes recibió."""
+    cuerpo = b""
+    while True:
+        mensaje = await receive()
+        cuerpo += mensaje.get("body", b"")
+        if not mensaje.get("more_body"):
+            break
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": str(len(cuerpo)).encode()})
+
+
+def _peticion(bloques, content_length=None):
+    """Envía `bloques` como cuerpo a /prueba/ y devuelve (estado, cuerpo, bloques leídos)."""
+    cabeceras = [] if content_length is None else [(b"content-length", str(content_length).encode())]
+    scope = {"type": "http", "method": "POST", "path": "/prueba/", "headers": cabeceras}
+    pendientes = list(bloques)
+    respuesta = {}
+
+    async def recibir():
+        bloque = pendientes.pop(0)
+        return {"type": "http.request", "body": bloque, "more_body": bool(pendientes)}
+
+    async def enviar(mensaje):
+        if mensaje["type"] == "http.response.start":
+            respuesta["estado"] = mensaje["status"]
+        else:
+            respuesta["cuerpo"] = mensaje["body"]
+
+    asyncio.run(limite_carga.MiddlewareLimiteCarga(_eco)(scope, recibir, enviar))
+    return respuesta["estado"], respuesta["cuerpo"], len(bloques) - len(pendientes)
+
+
+@pytest.fixture(autouse=True)
+def limite(monkeypatch):
+    monkeypatch.setenv("CARGA_MAX_MB_PRUEBA", str(LIMITE / limite_carga.MB))
+
+
+def test_content_length_excedido_responde_413_sin_leer_el_cuerpo():
+    estado, cuerpo, leidos = _peticion([b"x" * (LIMITE + 1)], content_length=LIMITE + 1)
+    assert estado == 413
+    assert leidos == 0
+    assert "(1.0 KB)" in json.loads(cuerpo)["detail"]
+
+
+def test_chunked_excedido_responde_413_al_rebasar_el_limite():
+    estado, _, leidos = _peticion([b"x" * 600, b"x" * 600, b"x" * 600])
+    assert estado == 413
+    assert leidos == 2
+
+
+def test_cuerpo_justo_en_el_limite_pasa():
+    estado, cuerpo, _ = _peticion([b"x" * 500, b"x" * 500])
+    assert (estado, cuerpo) == (200, b"1000")
+    estado, cuerpo, _ = _peticion([b"x" * LIMITE], content_length=LIMITE)
+    assert (estado, cuerpo) == (200, b"1000")
+
+
+def test_limite_menor_a_un_mega_se_muestra_con_decimales():
+    assert "(0.5 MB)" in limite_carga.CargaExcedida(limite_carga.MB // 2).detail
+    assert "(20.0 MB)" in limite_carga.CargaExcedida(20 * limite_carga.MB).detail
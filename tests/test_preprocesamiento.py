@@ -0,0 +1,45 @@
+import io
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+import preprocesamiento  # noqa: E402
+
+
+def _png(ancho: int, alto: int, modo: str = "RGB") -> bytes:
+    buffer = io.BytesIO()
+    Image.new(modo, (ancho, alto), "white").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _dimensiones(contenido: bytes):
+    return Image.open(io.BytesIO(contenido)).size
+
+
+def test_csf_de_cinco_paginas_conserva_su_ancho():
+    # 5 páginas carta a 150 DPI unidas en vertical
+    contenido, mime, _ = preprocesamiento.preprocesar_imagen(_png(1275, 8250), "csf")
+    assert mime == "image/png"
+    assert _dimensiones(contenido) == (1275, 8250)
+
+
+def test_ine_se_reduce_al_lado_mayor_del_perfil():
+    contenido, mime, resumen = preprocesamiento.preprocesar_imagen(_png(3200, 2000), "ine")
+    assert mime == "image/jpeg"
+    assert resumen["aplicado"]
+    assert max(_dimensiones(contenido)) == 1600
+
+
+def test_tipo_sin_perfil_se_envia_sin_cambios():
+    original = _png(800, 600)
+    contenido, mime, resumen = preprocesamiento.preprocesar_imagen(original, "cedula")
+    assert contenido is original
+    assert mime == "image/png"
+    assert not resumen["aplicado"]
+
+
+def test_detectar_mime_por_firma():
+    assert preprocesamiento.detectar_mime(b"%PDF-1.7 ...") == "application/pdf"
+    assert preprocesamiento.detectar_mime(b"\xff\xd8\xff\xe0") == "image/jpeg"
+    assert preprocesamiento.detectar_mime(b"otra cosa") == "application/octet-stream"
@@ -0,0 +1,104 @@
+import json
+import base64
+
+import pytest
+
+import procesadores
+import calidad_imagen
+import huellas
+
+
+@pytest.fixture
+def registro_con_licencia(tmp_path, monkeypatch):
+    """Registro vigente más un tipo "licencia" que solo existe en el archivo."""
+    with open(procesadores.ARCHIVO, "r", encoding="utf-8") as archivo:
+        datos = json.load(archivo)
+    datos["tipos"]["licencia"] = {
+        "ruta": "/procesa_licencia/",
+        "calidad": {"lado_minimo": 900, "nitidez_minima": 40, "proporcion": [1.3, 2.0], "horizontal": True},
+        "huellas": True,
+        "respuesta_simulada": "ine",
+        "versiones": [{"nombre": "v1", "ruta": "/v1/projects/1/locations/us/processors/aaaabbbbccccdddd:process"}],
+    }
+    archivo = tmp_path / "procesadores.json"
+    archivo.write_text(json.dumps(datos), encoding="utf-8")
+    monkeypatch.setattr(procesadores, "ARCHIVO", str(archivo))
+    procesadores.recargar(forzar=True)
+    yield
+    monkeypatch.undo()
+    procesadores.recargar(forzar=True)
+
+
+def test_obtener_lee_campos_del_tipo():
+    assert procesadores.obtener("ine", "calidad")["horizontal"] is False
+    assert procesadores.obtener("csf", "calidad") is None
+    assert procesadores.obtener("no_existe", "huellas", False) is False
+
+
+def test_tipo_nuevo_hereda_revision_de_calidad_y_huellas(registro_con_licencia, monkeypatch):
+    monkeypatch.setattr(calidad_imagen, "HABILITADO", True)
+    monkeypatch.setattr(huellas, "HABILITADO", True)
+    monkeypatch.setattr(huellas, "TIPOS", None)
+    assert calidad_imagen.perfil("licencia")["proporcion"] == (1.3, 2.0)
+    assert calidad_imagen.aplica("licencia", "image/jpeg")
+    assert not calidad_imagen.aplica("csf", "image/jpeg")
+    assert huellas.aplica("licencia", "image/jpeg")
+    assert not huellas.aplica("cedula", "image/jpeg")
+
+
+def test_calidad_invalida_no_reemplaza_el_registro():
+    with pytest.raises(procesadores.ConfiguracionInvalida):
+        procesadores.TipoDocumento("x", {"calidad": {"lado_minimo": 800}})
+
+
+def test_simulador_atiende_los_procesadores_del_registro(registro_con_licencia):
+    pytest.importorskip("fastapi")
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+    from simulador import servidor
+
+    sin_latencia = {"latencia_ms": 0, "jitter_ms": 0, "ms_por_mb": 0}
+    anterior = {k: servidor.CONFIGURACION[k] for k in sin_latencia}
+    servidor.CONFIGURACION.update(sin_latencia)
+    try:
+        cliente = TestClient(servidor.app)
+        cuerpo = {"rawDocument": {"content": base64.b64encode(b"x" * 30).decode(), "mimeType": "image/jpeg"},
+                  "fieldMask": "entities"}
+        cabeceras = {"Authorization": "Bearer local"}
+        respuesta = cliente.post("/v1/projects/1/locations/us/processors/aaaabbbbccccdddd:process",
+                                 json=cuerpo, headers=cabeceras)
+        assert respuesta.status_code == 200
+        assert respuesta.json()["document"]["entities"]
+        desconocido = cliente.post("/v1/projects/1/locations/us/processors/0000000000000000:process",
+                                   json=cuerpo, headers=cabeceras)
+        assert desconocido.status_code == 404
+    finally:
+        servidor.CONFIGURACION.update(anterior)
+
+
+@pytest.mark.parametrize("nombre, datos", [
+    ("lote", {}),
+    ("documento", {}),
+    ("licencia", {"ruta": "/procesa_lote/"}),
+    ("licencia", {"ruta": "/jobs/licencia"}),
+    ("licencia", {"ruta": "/health"}),
+])
+def test_nombres_y_rutas_de_la_app_estan_reservados(nombre, datos):
+    datos = {**datos, "versiones": [{"url": "http://localhost/v1:process"}]}
+    with pytest.raises(procesadores.ConfiguracionInvalida):
+        procesadores.TipoDocumento(nombre, datos)
+
+
+def test_rutas_quedan_en_el_mismo_orden_tras_recargar(registro_con_licencia):
+    pytest.importorskip("fastapi")
+    import app
+
+    rutas = [r.path for r in app.app.router.routes]
+    documentos = [tipo.ruta for tipo in procesadores.tipos().values()]
+    assert rutas[-len(documentos):] == documentos
+    fijas = rutas[:-len(documentos)]
+    assert all(r.rstrip("/") in procesadores.RUTAS_RESERVADAS or r.startswith(procesadores.PREFIJOS_RESERVADOS)
+               for r in fijas)
+
+    procesadores.recargar(forzar=True)
+    assert [r.path for r in app.app.router.routes] == rutas
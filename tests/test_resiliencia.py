@@ -0,0 +1,97 @@
+import time
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+import circuito  # noqa: E402
+import limitador  # noqa: E402
+import resiliencia  # noqa: E402
+
+URL = "https://documentai.prueba/v1/processors/1:process"
+
+
+@pytest.fixture(autouse=True)
+def sin_backoff(monkeypatch):
+    monkeypatch.setattr(resiliencia, "BACKOFF_BASE", 0.001)
+    monkeypatch.setattr(resiliencia, "historial", resiliencia.HistorialLatencias())
+
+
+def _post(respuestas, segundos: float = 5.0, peticiones=None):
+    """
+    Llama a post_resiliente contra un transporte simulado. `respuestas` es una
+    lista de (segundos de espera, código, cabeceras) que se sirve en orden; la
+    última se repite.
+    """
+    peticiones = [] if peticiones is None else peticiones
+
+    async def manejar(peticion):
+        espera, codigo, cabeceras = respuestas[min(len(peticiones), len(respuestas) - 1)]
+        peticiones.append(peticion)
+        await asyncio.sleep(espera)
+        return httpx.Response(codigo, headers=cabeceras, json={})
+
+    async def escenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(manejar)) as cliente:
+            return await resiliencia.post_resiliente(
+                cliente, URL, {}, b"{}", "prueba",
+                limitador.LimitadorProcesador("prueba", limitador.CubetaTokens(tasa=0, rafaga=1)),
+                circuito.Circuito("prueba", umbral_fallos=100),
+                time.monotonic() + segundos,
+            )
+
+    inicio = time.monotonic()
+    return asyncio.run(escenario()), peticiones, time.monotonic() - inicio
+
+
+def test_reintenta_error_reintentable_hasta_una_respuesta_buena():
+    respuesta, peticiones, _ = _post([(0, 503, {}), (0, 200, {})])
+    assert respuesta.status_code == 200
+    assert len(peticiones) == 2
+    assert float(peticiones[0].headers["X-Server-Timeout"]) <= 5.0
+
+
+def test_no_reintenta_error_del_cliente():
+    respuesta, peticiones, _ = _post([(0, 400, {}), (0, 200, {})])
+    assert respuesta.status_code == 400
+    assert len(peticiones) == 1
+
+
+def test_devuelve_la_ultima_respuesta_al_agotar_los_reintentos():
+    respuesta, peticiones, _ = _post([(0, 503, {})])
+    assert respuesta.status_code == 503
+    assert len(peticiones) == resiliencia.MAX_REINTENTOS + 1
+
+
+def test_respeta_retry_after():
+    respuesta, peticiones, segundos = _post([(0, 429, {"Retry-After": "0.3"}), (0, 200, {})])
+    assert respuesta.status_code == 200
+    assert segundos >= 0.3
+
+
+def test_no_reintenta_si_retry_after_excede_el_deadline():
+    respuesta, peticiones, segundos = _post([(0, 429, {"Retry-After": "10"}), (0, 200, {})], segundos=1)
+    assert respuesta.status_code == 429
+    assert len(peticiones) == 1
+    assert segundos < 0.5
+
+
+def test_intento_lento_se_corta_en_el_deadline():
+    peticiones = []
+    inicio = time.monotonic()
+    with pytest.raises(httpx.TimeoutException):
+        _post([(2, 200, {})], segundos=0.3, peticiones=peticiones)
+    assert len(peticiones) == 1
+    assert time.monotonic() - inicio < 1
+
+
+def test_cobertura_usa_la_primera_respuesta(monkeypatch):
+    monkeypatch.setattr(resiliencia, "COBERTURA_HABILITADA", True)
+    monkeypatch.setattr(resiliencia, "COBERTURA_MIN_MUESTRAS", 1)
+    resiliencia.historial.registrar("prueba", 0.1)
+
+    respuesta, peticiones, segundos = _post([(2, 200, {}), (0, 200, {})])
+    assert respuesta.status_code == 200
+    assert len(peticiones) == 2
+    assert segundos < 1
@@ -0,0 +1,147 @@
+import os
+import json
+import asyncio
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+
+import texto_pdf  # noqa: E402
+
+RFC = "GODE561231GR8"
+CURP = "GODE561231HDFRRN09"
+
+
+def _pdf(renglones) -> bytes:
+    """PDF generado digitalmente: un renglón de texto por línea."""
+    documento = fitz.open()
+    pagina = documento.new_page()
+    for indice, renglon in enumerate(renglones):
+        pagina.insert_text((50, 60 + indice * 20), renglon)
+    return documento.tobytes()
+
+
+def _csf(rfc: str = RFC) -> bytes:
+    return _pdf([
+        "CONSTANCIA DE SITUACIÓN FISCAL",
+        f"RFC: {rfc}",
+        f"CURP: {CURP}",
+        "Nombre (s): EMILIO",
+        "Primer Apellido: GOMEZ",
+        "Segundo Apellido: DIAZ",
+        "Fecha inicio de operaciones: 01 DE MARZO DE 2015",
+        "Estatus en el padrón: ACTIVO",
+        "Código Postal: 06700",
+        "Régimen de Sueldos y Salarios e Ingresos Asimilados a Salarios 01/03/2015",
+    ])
+
+
+def _cedula() -> bytes:
+    return _pdf([
+        "SECRETARÍA DE EDUCACIÓN PÚBLICA - DIRECCIÓN GENERAL DE PROFESIONES",
+        "Nombre: EMILIO GOMEZ DIAZ",
+        f"CURP: {CURP}",
+        "Número de cédula: 12345678",
+        "Profesión: LICENCIATURA EN DERECHO",
+        "Institución: UNIVERSIDAD NACIONAL AUTÓNOMA DE MÉXICO",
+        "Fecha de expedición: 15/07/2010",
+        "Tipo: C1",
+    ])
+
+
+def _escaneado() -> bytes:
+    documento = fitz.open()
+    pagina = documento.new_page()
+    pagina.draw_rect(fitz.Rect(50, 50, 300, 200), color=(0, 0, 0), fill=(0.5, 0.5, 0.5))
+    return documento.tobytes()
+
+
+def test_extrae_csf_de_la_capa_de_texto():
+    entidades, motivo = texto_pdf.extraer(_csf(), "csf")
+    assert motivo is None
+    assert entidades["rfc"]["valor"] == RFC
+    assert entidades["curp"]["valor"] == CURP
+    assert entidades["nombre"]["valor"] == "EMILIO"
+    assert entidades["codigo_postal"]["valor"] == "06700"
+    assert entidades["fecha_inicio_operaciones"]["normalizado"] == "2015-03-01"
+    assert entidades["regimen"]["valor"].startswith("Régimen de Sueldos")
+    assert entidades["rfc"]["confianza"] == 1.0
+
+
+def test_extrae_cedula_de_la_capa_de_texto():
+    entidades, motivo = texto_pdf.extraer(_cedula(), "cedula")
+    assert motivo is None
+    assert entidades["numero_cedula"]["valor"] == "12345678"
+    assert entidades["nombre"]["valor"] == "EMILIO GOMEZ DIAZ"
+    assert entidades["fecha_expedicion"]["normalizado"] == "2010-07-15"
+    assert entidades["tipo"]["valor"] == "C1"
+
+
+def test_rechaza_rfc_con_digito_verificador_incorrecto():
+    assert texto_pdf.rfc_valido(RFC)
+    assert not texto_pdf.rfc_valido(RFC[:-1] + "9")
+    entidades, motivo = texto_pdf.extraer(_csf(RFC[:-1] + "9"), "csf")
+    assert entidades is None
+    assert motivo.startswith(texto_pdf.INVALIDO) and "RFC inválido" in motivo
+
+
+def test_pdf_sin_capa_de_texto():
+    entidades, motivo = texto_pdf.extraer(_escaneado(), "csf")
+    assert entidades is None
+    assert motivo == texto_pdf.SIN_TEXTO
+
+
+@pytest.mark.parametrize("contenido", [_escaneado(), _csf(RFC[:-1] + "9")], ids=["sin_texto", "rfc_invalido"])
+def test_sin_extraccion_local_se_recurre_a_document_ai(monkeypatch, contenido):
+    pytest.importorskip("fastapi")
+    import funciones
+
+    enviados = []
+
+    async def procesa_documento(archivo, doc_type, **_):
+        enviados.append((archivo, doc_type))
+        return {"rfc": "de Document AI"}
+
+    monkeypatch.setattr(texto_pdf, "HABILITADO", True)
+    monkeypatch.setenv("ESTRATEGIA_CSF", "pdf")
+    monkeypatch.setattr(funciones, "procesa_documento", procesa_documento)
+    resultado = asyncio.run(funciones.procesa_pdf(contenido, "csf"))
+    assert resultado == {"rfc": "de Document AI"}
+    assert enviados == [(contenido, "csf")]
+
+
+def test_extraccion_local_no_llama_a_document_ai(monkeypatch):
+    pytest.importorskip("fastapi")
+    import funciones
+
+    async def procesa_documento(*_, **__):
+        raise AssertionError("no debe llamarse a Document AI")
+
+    monkeypatch.setattr(texto_pdf, "HABILITADO", True)
+    monkeypatch.setattr(funciones, "procesa_documento", procesa_documento)
+    resultado = asyncio.run(funciones.procesa_pdf(_csf(), "csf"))
+    assert resultado["_cache"] == "local"
+    assert resultado["rfc"] == RFC
+
+
+@pytest.mark.parametrize("doc_type", ["csf", "cedula"])
+def test_campos_coinciden_con_respuesta_capturada(doc_type):
+    """
+    RESPUESTAS_CAPTURADAS apunta a un directorio con <tipo>.pdf y la respuesta
+    real de su procesador, <tipo>.json (sin datos personales). La extracción
+    local debe devolver los mismos campos que Document AI para ese PDF.
+    """
+    directorio = os.getenv("RESPUESTAS_CAPTURADAS")
+    rutas = [os.path.join(directorio or "", f"{doc_type}.{extension}") for extension in ("pdf", "json")]
+    if not directorio or not all(os.path.exists(ruta) for ruta in rutas):
+        pytest.skip("sin respuesta capturada del procesador real (RESPUESTAS_CAPTURADAS)")
+    pytest.importorskip("fastapi")
+    import herramientas
+
+    with open(rutas[0], "rb") as archivo:
+        entidades, motivo = texto_pdf.extraer(archivo.read(), doc_type)
+    with open(rutas[1], "r", encoding="utf-8") as archivo:
+        esperadas = herramientas.obtener_datos_completos(json.load(archivo))
+    assert motivo is None
+    assert sorted(entidades) == sorted(esperadas)
+    assert set(esperadas) <= set(texto_pdf.campos(doc_type))
@@ -0,0 +1,119 @@
+import time
+import asyncio
+
+import pytest
+
+for _modulo in ("fastapi", "fitz", "PIL", "httpx"):
+    pytest.importorskip(_modulo)
+
+import circuito  # noqa: E402
+import funciones  # noqa: E402
+import trabajos  # noqa: E402
+
+
+@pytest.mark.parametrize("url", [
+    "http://ejemplo.com/callback",
+    "https://127.0.0.1/callback",
+    "https://10.0.0.8/callback",
+    "https://169.254.169.254/latest/meta-data",
+    "https://[::1]/callback",
+    "https://[::ffff:192.168.0.1]/callback",
+    "ftp://ejemplo.com/callback",
+])
+def test_callback_rechazado(url):
+    with pytest.raises(trabajos.CallbackInvalido):
+        trabajos.validar_callback(url)
+
+
+def test_callback_publico_aceptado():
+    assert trabajos.validar_callback("https://hooks.ejemplo.com/rad?x=1").host == "hooks.ejemplo.com"
+
+
+def test_callback_fuera_de_la_lista_permitida(monkeypatch):
+    monkeypatch.setattr(trabajos, "CALLBACK_HOSTS_PERMITIDOS", ["*.ejemplo.com", "otro.mx"])
+    trabajos.validar_callback("https://hooks.ejemplo.com/rad")
+    trabajos.validar_callback("https://otro.mx/rad")
+    with pytest.raises(trabajos.CallbackInvalido):
+        trabajos.validar_callback("https://ejemplo.com.atacante.net/rad")
+
+
+def test_callback_que_resuelve_a_red_interna():
+    url = trabajos.validar_callback("https://localhost/callback")
+    with pytest.raises(trabajos.CallbackInvalido):
+        asyncio.run(trabajos._resolver_callback(url))
+
+
+@pytest.fixture
+def cola(tmp_path):
+    return trabajos.ColaTrabajos(str(tmp_path / "trabajos.db"), trabajadores=0)
+
+
+def _procesar_siguiente(cola):
+    async def escenario():
+        fila = await asyncio.to_thread(cola._reclamar_siguiente)
+        assert fila is not None
+        await cola._procesar(fila)
+        return await cola.obtener(fila["id"])
+    return asyncio.run(escenario())
+
+
+def test_circuito_abierto_reencola_el_trabajo(cola, monkeypatch):
+    async def procesa_documento(contenido, doc_type):
+        raise circuito.CircuitoAbierto("ine", 20)
+
+    monkeypatch.setattr(funciones, "procesa_documento", procesa_documento)
+    asyncio.run(cola.encolar("ine", b"\xff\xd8\xff imagen"))
+
+    antes = time.time()
+    trabajo = _procesar_siguiente(cola)
+    assert trabajo["estado"] == "pendiente"
+    assert trabajo["intentos"] == 1
+    # No se vuelve a tomar antes de la espera indicada por el circuito
+    assert cola._reclamar_siguiente() is None
+    with cola._conectar() as conexion:
+        disponible = conexion.execute("SELECT disponible FROM trabajos").fetchone()[0]
+    assert disponible >= antes + 20
+
+
+def test_saturacion_agota_los_intentos_y_falla(cola, monkeypatch):
+    async def procesa_documento(contenido, doc_type):
+        return {"error": "Document AI saturado, intente más tarde", "reintentable": True}
+
+    monkeypatch.setattr(funciones, "procesa_documento", procesa_documento)
+    monkeypatch.setattr(trabajos, "TRABAJOS_INTENTOS_MAXIMOS", 2)
+    id_trabajo = asyncio.run(cola.encolar("ine", b"\xff\xd8\xff imagen"))
+
+    assert _procesar_siguiente(cola)["estado"] == "pendiente"
+    with cola._conectar() as conexion:
+        conexion.execute("UPDATE trabajos SET disponible = 0 WHERE id = ?", (id_trabajo,))
+    trabajo = _procesar_siguiente(cola)
+    assert trabajo["estado"] == "fallido"
+    assert "saturado" in trabajo["error"]
+
+
+def test_error_definitivo_no_se_reintenta(cola, monkeypatch):
+    async def procesa_documento(contenido, doc_type):
+        return {"error": "Error de Document AI: 400"}
+
+    monkeypatch.setattr(funciones, "procesa_documento", procesa_documento)
+    asyncio.run(cola.encolar("ine", b"\xff\xd8\xff imagen"))
+    trabajo = _procesar_siguiente(cola)
+    assert trabajo["estado"] == "fallido"
+    assert trabajo["intentos"] == 0
+
+
+def test_jobs_rechaza_contenido_que_no_corresponde_al_tipo():
+    from fastapi.testclient import TestClient
+    import app
+
+    cliente = TestClient(app.app)
+    # Content-Type de imagen, pero el contenido es un PDF
+    respuesta = cliente.post("/jobs/", data={"doc_type": "ine"},
+                             files={"archivo": ("ine.jpg", b"%PDF-1.7 ...", "image/jpeg")})
+    assert respuesta.status_code == 400
+    assert "no es una imagen" in respuesta.json()["detail"]
+
+    respuesta = cliente.post("/jobs/", data={"doc_type": "ine", "callback_url": "https://127.0.0.1/x"},
+                             files={"archivo": ("ine.jpg", b"\xff\xd8\xff imagen", "image/jpeg")})
+    assert respuesta.status_code == 400
+    assert "red interna" in respuesta.json()["detail"]
@@ -0,0 +1,309 @@
+import os
+import re
+import logging
+import datetime
+import fitz
+from typing import Any, Dict, List, Optional, Tuple
+from herramientas import EntidadPlana, agrupar_entidades
+
+logger = logging.getLogger(__name__)
+
+# Extracción local de CSFs y cédulas generadas digitalmente a partir de la
+# capa de texto del PDF, sin llamar a Document AI. Si el PDF no tiene texto
+# o los campos no pasan la validación, funciones recurre a Document AI.
+# Es opcional (EXTRACCION_LOCAL=1): los nombres de campo de las plantillas
+# deben coincidir con los tipos de entidad de cada procesador entrenado, y
+# eso solo se comprueba contra respuestas reales capturadas (ver
+# tests/test_texto_pdf.py, RESPUESTAS_CAPTURADAS).
+HABILITADO = os.getenv("EXTRACCION_LOCAL", "0").lower() in ("1", "true", "si", "yes")
+# Caracteres visibles mínimos para considerar que el PDF tiene capa de texto
+CARACTERES_MINIMOS = int(os.getenv("EXTRACCION_LOCAL_CARACTERES_MINIMOS", "100"))
+# Tolerancia vertical (puntos) para juntar en un renglón palabras de celdas distintas
+TOLERANCIA_RENGLON = 3.0
+
+SIN_TEXTO = "sin_texto"
+INVALIDO = "invalido"
+
+_MESES = {
+    "ENERO": 1, "FEBRERO": 2, "MARZO": 3, "ABRIL": 4, "MAYO": 5, "JUNIO": 6, "JULIO": 7,
+    "AGOSTO": 8, "SEPTIEMBRE": 9, "SETIEMBRE": 9, "OCTUBRE": 10, "NOVIEMBRE": 11, "DICIEMBRE": 12,
+}
+_FECHA_TEXTO = re.compile(r"(\d{1,2})\s+DE\s+([A-Z]+)\s+DE\s+(\d{4})")
+_FECHA_NUMERICA = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})")
+
+_RFC = re.compile(r"[A-ZÑ&]{3,4}\d{6}[A-Z\d]{3}")
+_CURP = re.compile(r"[A-Z][AEIOUX][A-Z]{2}\d{6}[HMX][A-Z]{2}[B-DF-HJ-NP-TV-Z]{3}[A-Z\d]\d")
+_DICCIONARIO_RFC = "0123456789ABCDEFGHIJKLMN&OPQRSTUVWXYZ Ñ"
+
+
+def _fecha_iso(texto: str) -> Optional[str]:
+    """'01 DE MARZO DE 2015' o '01/03/2015' -> '2015-03-01'; None si no es una fecha válida."""
+    texto = texto.upper()
+    coincidencia = _FECHA_TEXTO.search(texto)
+    if coincidencia:
+        dia, mes, anio = int(coincidencia[1]), _MESES.get(coincidencia[2]), int(coincidencia[3])
+    else:
+        coincidencia = _FECHA_NUMERICA.search(texto)
+        if not coincidencia:
+            return None
+        dia, mes, anio = int(coincidencia[1]), int(coincidencia[2]), int(coincidencia[3])
+    try:
+        return datetime.date(anio, mes, dia).isoformat() if mes else None
+    except ValueError:
+        return None
+
+
+def _fecha_aammdd_valida(texto: str) -> bool:
+    try:
+        datetime.datetime.strptime(texto, "%y%m%d")
+        return True
+    except ValueError:
+        return False
+
+
+def rfc_valido(rfc: str) -> bool:
+    """Estructura, fecha y dígito verificador (módulo 11) de un RFC de persona física o moral."""
+    if not _RFC.fullmatch(rfc) or not _fecha_aammdd_valida(rfc[-9:-3]):
+        return False
+    # Las personas morales (12 caracteres) se completan con un espacio al inicio
+    rfc13 = rfc if len(rfc) == 13 else " " + rfc
+    suma = sum(_DICCIONARIO_RFC.index(c) * (13 - i) for i, c in enumerate(rfc13[:12]))
+    digito = 11 - suma % 11
+    esperado = "0" if digito == 11 else "A" if digito == 10 else str(digito)
+    return rfc[-1] == esperado
+
+
+def curp_valida(curp: str) -> bool:
+    """Estructura y fecha de nacimiento de una CURP."""
+    return bool(_CURP.fullmatch(curp)) and _fecha_aammdd_valida(curp[4:10])
+
+
+# Plantilla por tipo de documento:
+#   etiquetas: campo -> expresión de la etiqueta; el valor es el texto que la
+#              sigue en el mismo renglón hasta la siguiente etiqueta
+#   valores: campo -> expresión que debe cumplir el valor (se toma la coincidencia)
+#   filas: campo -> (expresión del renglón, campos de sus grupos) para tablas
+#          con renglones repetidos, como los regímenes de la CSF
+#   fechas: campos cuyo valor normalizado es una fecha AAAA-MM-DD
+#   requeridos: cada grupo debe tener al menos uno de sus campos
+#   validar: función que recibe los campos encontrados y devuelve el motivo
+#            del rechazo, o None si son coherentes
+PLANTILLAS: Dict[str, Dict[str, Any]] = {}
+
+
+def _validar_csf(campos: Dict[str, List[str]]) -> Optional[str]:
+    rfc = campos["rfc"][0]
+    if not rfc_valido(rfc):
+        return f"RFC inválido: {rfc}"
+    if "curp" in campos:
+        curp = campos["curp"][0]
+        if not curp_valida(curp):
+            return f"CURP inválida: {curp}"
+        # Persona física: el RFC y la CURP comparten la fecha de nacimiento
+        if len(rfc) != 13 or rfc[4:10] != curp[4:10]:
+            return "El RFC no corresponde a la CURP."
+    return None
+
+
+def _validar_cedula(campos: Dict[str, List[str]]) -> Optional[str]:
+    if "curp" in campos and not curp_valida(campos["curp"][0]):
+        return f"CURP inválida: {campos['curp'][0]}"
+    return None
+
+
+PLANTILLAS["csf"] = {
+    "etiquetas": {
+        "rfc": r"RFC\s*:",
+        "curp": r"CURP\s*:",
+        "nombre": r"Nombre\s*\(s\)\s*:",
+        "primer_apellido": r"Primer\s+Apellido\s*:",
+        "segundo_apellido": r"Segundo\s+Apellido\s*:",
+        "razon_social": r"(?:Denominaci[óo]n\s*/\s*)?Raz[óo]n\s+Social\s*:",
+        "regimen_capital": r"R[ée]gimen\s+Capital\s*:",
+        "nombre_comercial": r"Nombre\s+Comercial\s*:",
+        "fecha_inicio_operaciones": r"Fecha\s+(?:de\s+)?inicio\s+de\s+operaciones\s*:",
+        "estatus_padron": r"Estatus\s+en\s+el\s+padr[óo]n\s*:",
+        "fecha_ultimo_cambio": r"Fecha\s+de\s+[úu]ltimo\s+cambio\s+de\s+estado\s*:",
+        "codigo_postal": r"C[óo]digo\s+Postal\s*:",
+        "tipo_vialidad": r"Tipo\s+de\s+Vialidad\s*:",
+        "nombre_vialidad": r"Nombre\s+de\s+(?:la\s+)?Vialidad\s*:",
+        "numero_exterior": r"N[úu]mero\s+Exterior\s*:",
+        "numero_interior": r"N[úu]mero\s+Interior\s*:",
+        "colonia": r"Nombre\s+de\s+la\s+Colonia\s*:",
+        "localidad": r"Nombre\s+de\s+la\s+Localidad\s*:",
+        "municipio": r"Nombre\s+del\s+Municipio\s+o\s+Demarcaci[óo]n\s+Territorial\s*:",
+        "entidad_federativa": r"Nombre\s+de\s+la\s+Entidad\s+Federativa\s*:",
+        "entre_calle": r"Entre\s+Calle\s*:",
+        "y_calle": r"Y\s+Calle\s*:",
+    },
+    "valores": {
+        "rfc": _RFC,
+        "curp": _CURP,
+        "codigo_postal": re.compile(r"\d{5}"),
+    },
+    "filas": {
+        "regimen": (
+            re.compile(r"^(R[ée]gimen\s.+?)\s+(\d{2}/\d{2}/\d{4})(?:\s+\d{2}/\d{2}/\d{4})?$", re.IGNORECASE),
+            ("regimen", "fecha_inicio_regimen"),
+        ),
+        "actividad_economica": (
+            re.compile(r"^\d{1,2}\s+(.+?)\s+(\d{1,3})\s+\d{2}/\d{2}/\d{4}(?:\s+\d{2}/\d{2}/\d{4})?$"),
+            ("actividad_economica", "porcentaje"),
+        ),
+    },
+    "fechas": {"fecha_inicio_operaciones", "fecha_ultimo_cambio", "fecha_inicio_regimen"},
+    "requeridos": (("rfc",), ("nombre", "razon_social")),
+    "validar": _validar_csf,
+}
+
+PLANTILLAS["cedula"] = {
+    "etiquetas": {
+        "nombre": r"Nombre(?:\s+\(s\))?\s*:",
+        "curp": r"CURP\s*:",
+        "numero_cedula": r"(?:N[úu]mero\s+de\s+c[ée]dula|No\.?\s+de\s+c[ée]dula|C[ée]dula\s+profesional|C[ée]dula)\s*:",
+        "profesion": r"(?:Profesi[óo]n|Carrera|T[íi]tulo)\s*:",
+        "institucion": r"Instituci[óo]n(?:\s+educativa)?\s*:",
+        "fecha_expedicion": r"Fecha\s+de\s+expedici[óo]n\s*:",
+        "tipo": r"Tipo(?:\s+de\s+c[ée]dula)?\s*:",
+    },
+    "valores": {
+        "curp": _CURP,
+        "numero_cedula": re.compile(r"\d{7,8}"),
+        "tipo": re.compile(r"[A-Z]\d"),
+    },
+    "filas": {},
+    "fechas": {"fecha_expedicion"},
+    "requeridos": (("numero_cedula",), ("nombre",)),
+    "validar": _validar_cedula,
+}
+
+_ETIQUETAS_COMPILADAS: Dict[str, re.Pattern] = {
+    doc_type: re.compile(
+        "|".join(f"(?P<{campo}>{patron})" for campo, patron in plantilla["etiquetas"].items()),
+        re.IGNORECASE,
+    )
+    for doc_type, plantilla in PLANTILLAS.items()
+}
+
+
+def _renglones(documento: "fitz.Document") -> List[str]:
+    """
+    Reconstruye los renglones visuales a partir de las palabras: las celdas
+    de una tabla son bloques distintos para MuPDF, pero la etiqueta y su
+    valor comparten la misma altura en la página.
+    """
+    renglones: List[str] = []
+    for pagina in documento:
+        palabras = sorted(pagina.get_text("words"), key=lambda p: (round(p[3]), p[0]))
+        actual: List[tuple] = []
+        for palabra in palabras:
+            if actual and abs(palabra[3] - actual[0][3]) > TOLERANCIA_RENGLON:
+                renglones.append(" ".join(p[4] for p in sorted(actual, key=lambda p: p[0])))
+                actual = []
+            actual.append(palabra)
+        if actual:
+            renglones.append(" ".join(p[4] for p in sorted(actual, key=lambda p: p[0])))
+    return renglones
+
+
+def _campos_por_etiqueta(renglones: List[str], doc_type: str) -> Dict[str, List[str]]:
+    plantilla = PLANTILLAS[doc_type]
+    etiquetas = _ETIQUETAS_COMPILADAS[doc_type]
+    campos: Dict[str, List[str]] = {}
+
+    for renglon in renglones:
+        encontradas = list(etiquetas.finditer(renglon))
+        for indice, etiqueta in enumerate(encontradas):
+            fin = encontradas[indice + 1].start() if indice + 1 < len(encontradas) else len(renglon)
+            valor = renglon[etiqueta.end():fin].strip()
+            campo = etiqueta.lastgroup
+            patron = plantilla["valores"].get(campo)
+            if patron is not None:
+                coincidencia = patron.search(valor.upper())
+                valor = coincidencia[0] if coincidencia else ""
+            # La primera aparición es la del encabezado; las repeticiones (ej.
+            # pie de página) se ignoran
+            if valor and campo not in campos:
+                campos[campo] = [valor]
+
+        for campo_fila, (patron, nombres) in plantilla["filas"].items():
+            coincidencia = patron.match(renglon)
+            if coincidencia:
+                for nombre, valor in zip(nombres, coincidencia.groups()):
+                    campos.setdefault(nombre, []).append(valor.strip())
+    return campos
+
+
+def _registros(campos: Dict[str, List[str]], doc_type: str) -> List[EntidadPlana]:
+    """Convierte los campos a registros con la misma forma que el aplanado de Document AI."""
+    fechas = PLANTILLAS[doc_type]["fechas"]
+    registros = []
+    for campo, valores in campos.items():
+        for valor in valores:
+            normalizado: Any = _fecha_iso(valor) if campo in fechas else None
+            if campo == "porcentaje":
+                normalizado = float(valor)
+            # Texto tomado tal cual de la capa del PDF: no hay incertidumbre de OCR
+            registros.append(EntidadPlana(campo, valor, 1.0, normalizado))
+    return registros
+
+
+def aplica(doc_type: str) -> bool:
+    return HABILITADO and doc_type in PLANTILLAS
+
+
+def campos(doc_type: str) -> List[str]:
+    """Nombres de campo que la plantilla de `doc_type` puede devolver."""
+    plantilla = PLANTILLAS[doc_type]
+    nombres = list(plantilla["etiquetas"])
+    for _, grupos in plantilla["filas"].values():
+        nombres.extend(grupos)
+    return nombres
+
+
+def tiene_texto(documento: "fitz.Document") -> bool:
+    """
+    Revisión rápida de si el PDF tiene capa de texto, sin reconstruir
+    renglones: se detiene en cuanto junta CARACTERES_MINIMOS. Un PDF
+    escaneado no tiene texto y se envía a Document AI sin leerlo completo.
+    """
+    caracteres = 0
+    for pagina in documento:
+        caracteres += len("".join(pagina.get_text("text").split()))
+        if caracteres >= CARACTERES_MINIMOS:
+            return True
+    return False
+
+
+def extraer(datos_pdf: bytes, doc_type: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Extrae los campos de la plantilla de `doc_type` de la capa de texto del PDF.
+
+    Es bloqueante y MuPDF retiene el GIL: desde código async debe llamarse con
+    ejecutores.en_proceso.
+
+    Returns:
+        Tupla (entidades, motivo). Si la extracción es válida, entidades tiene
+        la forma detallada de herramientas.agrupar_entidades y motivo es None.
+        Si no, entidades es None y motivo es SIN_TEXTO o INVALIDO seguido del
+        detalle, para registrar por qué se recurre a Document AI.
+    """
+    plantilla = PLANTILLAS[doc_type]
+    try:
+        with fitz.open(stream=datos_pdf, filetype="pdf") as documento:
+            renglones = _renglones(documento)
+    except Exception as e:
+        return None, f"{INVALIDO}: PDF ilegible ({e})"
+
+    if sum(len(renglon.replace(" ", "")) for renglon in renglones) < CARACTERES_MINIMOS:
+        return None, SIN_TEXTO
+
+    campos = _campos_por_etiqueta(renglones, doc_type)
+    for grupo in plantilla["requeridos"]:
+        if not any(campo in campos for campo in grupo):
+            return None, f"{INVALIDO}: falta {' o '.join(grupo)}"
+    rechazo = plantilla["validar"](campos)
+    if rechazo:
+        return None, f"{INVALIDO}: {rechazo}"
+
+    return agrupar_entidades(_registros(campos, doc_type), detallado=True), None
@@ -0,0 +1,399 @@
+import os
+import logging
+import json
+import time
+import uuid
+import socket
+import asyncio
+import sqlite3
+import tempfile
+import ipaddress
+import httpx
+import bitacora
+import circuito
+import funciones
+import procesadores
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List
+
+logger = logging.getLogger(__name__)
+
+TRABAJOS_DB = os.getenv("TRABAJOS_DB") or os.path.join(tempfile.gettempdir(), "document_ai_trabajos.db")
+TRABAJOS_TRABAJADORES = int(os.getenv("TRABAJOS_TRABAJADORES", "2"))
+# Segundos que se conservan los trabajos terminados antes de purgarlos
+TRABAJOS_RETENCION_SEGUNDOS = float(os.getenv("TRABAJOS_RETENCION_SEGUNDOS", "86400"))
+# Un trabajo 'procesando' sin cambios por más de este tiempo se considera
+# abandonado (worker caído) y vuelve a la cola
+TRABAJOS_TIEMPO_MAXIMO = float(os.getenv("TRABAJOS_TIEMPO_MAXIMO", "600"))
+# Cada cuánto revisan la cola los trabajadores ociosos (otros workers pueden encolar)
+INTERVALO_SONDEO = 1.0
+# Un trabajo rechazado por saturación (circuito abierto o limitador) vuelve a
+# la cola con espera exponencial, hasta este número de intentos
+TRABAJOS_INTENTOS_MAXIMOS = int(os.getenv("TRABAJOS_INTENTOS_MAXIMOS", "5"))
+TRABAJOS_REINTENTO_BASE = float(os.getenv("TRABAJOS_REINTENTO_BASE", "5"))
+TRABAJOS_REINTENTO_MAXIMO = float(os.getenv("TRABAJOS_REINTENTO_MAXIMO", "300"))
+
+# Los callbacks llevan los datos extraídos: solo se envían por https, a
+# direcciones públicas y, si se configura, solo a estos hosts ("*.ejemplo.com"
+# incluye sus subdominios)
+CALLBACK_HOSTS_PERMITIDOS = [
+    h.strip().lower() for h in os.getenv("CALLBACK_HOSTS_PERMITIDOS", "").split(",") if h.strip()
+]
+CALLBACK_TIMEOUT = float(os.getenv("CALLBACK_TIMEOUT", "10"))
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS trabajos (
+    id TEXT PRIMARY KEY,
+    doc_type TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    contenido BLOB,
+    callback_url TEXT,
+    resultado TEXT,
+    error TEXT,
+    creado REAL NOT NULL,
+    actualizado REAL NOT NULL,
+    intentos INTEGER NOT NULL DEFAULT 0,
+    disponible REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_trabajos_estado ON trabajos (estado, creado);
+"""
+# Columnas agregadas después de la primera versión del esquema
+_COLUMNAS_NUEVAS = {
+    "intentos": "INTEGER NOT NULL DEFAULT 0",
+    "disponible": "REAL NOT NULL DEFAULT 0",
+}
+
+
+class CallbackInvalido(ValueError):
+    """La URL de callback no es https, no está permitida o apunta a una red interna."""
+
+
+def _direccion_publica(direccion: str) -> bool:
+    ip = ipaddress.ip_address(direccion.split("%", 1)[0])
+    if getattr(ip, "ipv4_mapped", None) is not None:
+        ip = ip.ipv4_mapped
+    return ip.is_global and not ip.is_multicast
+
+
+def _host_permitido(host: str) -> bool:
+    if not CALLBACK_HOSTS_PERMITIDOS:
+        return True
+    for patron in CALLBACK_HOSTS_PERMITIDOS:
+        if patron.startswith("*.") and host.endswith(patron[1:]):
+            return True
+        if host == patron:
+            return True
+    return False
+
+
+def validar_callback(callback_url: str) -> httpx.URL:
+    """
+    Revisa la URL de callback antes de encolar: https, host permitido y, si
+    el host es una IP, que sea pública. Los nombres se resuelven y revisan
+    otra vez al notificar.
+
+    Raises:
+        CallbackInvalido con el motivo.
+    """
+    try:
+        url = httpx.URL(callback_url)
+    except httpx.InvalidURL as e:
+        raise CallbackInvalido(f"URL de callback inválida: {e}") from e
+    if url.scheme != "https" or not url.host:
+        raise CallbackInvalido("La URL de callback debe ser https.")
+    host = url.host.lower()
+    if not _host_permitido(host):
+        raise CallbackInvalido(f"El host de callback {host} no está permitido.")
+    try:
+        publica = _direccion_publica(host)
+    except ValueError:
+        publica = True  # es un nombre; se revisa al resolverlo
+    if not publica:
+        raise CallbackInvalido("La URL de callback apunta a una red interna.")
+    return url
+
+
+async def _resolver_callback(url: httpx.URL) -> str:
+    """
+    Resuelve el host del callback y devuelve la dirección a la que se
+    conecta. Todas las direcciones deben ser públicas: la conexión va a la IP
+    revisada, así que un DNS que cambie después no lleva a una red interna.
+    """
+    infos = await asyncio.get_running_loop().getaddrinfo(url.host, url.port or 443, type=socket.SOCK_STREAM)
+    direcciones = [info[4][0] for info in infos]
+    if not direcciones or not all(_direccion_publica(d) for d in direcciones):
+        raise CallbackInvalido(f"El host de callback {url.host} resuelve a una red interna.")
+    return direcciones[0]
+
+
+class ColaTrabajos:
+    """
+    Cola durable de trabajos en SQLite con un pool de trabajadores asyncio.
+
+    Los documentos se guardan en la base al recibirse, así que sobreviven a
+    reinicios. Varios procesos (workers de gunicorn) pueden compartir el mismo
+    archivo: cada trabajo se reclama con una transacción inmediata, de modo
+    que solo un trabajador lo procesa. Todas las operaciones de SQLite corren
+    en hilos para no bloquear el event loop.
+    """
+
+    def __init__(self, ruta: str = TRABAJOS_DB, trabajadores: int = TRABAJOS_TRABAJADORES):
+        self.ruta = ruta
+        self.trabajadores = trabajadores
+        self._tareas: List[asyncio.Task] = []
+        self._hay_trabajo = asyncio.Event()
+        # Cliente propio para callbacks: sin redirecciones, sin proxies del
+        # entorno y separado del pool de conexiones hacia Document AI
+        self._cliente_callbacks: Optional[httpx.AsyncClient] = None
+        self._crear_esquema()
+
+    @contextmanager
+    def _conectar(self):
+        # Modo autocommit; las transacciones explícitas usan BEGIN IMMEDIATE
+        conexion = sqlite3.connect(self.ruta, timeout=30, isolation_level=None)
+        try:
+            conexion.execute("PRAGMA journal_mode=WAL")
+            conexion.row_factory = sqlite3.Row
+            yield conexion
+        finally:
+            conexion.close()
+
+    def _crear_esquema(self):
+        directorio = os.path.dirname(self.ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        with self._conectar() as conexion:
+            conexion.executescript(_ESQUEMA)
+            existentes = {fila["name"] for fila in conexion.execute("PRAGMA table_info(trabajos)")}
+            for columna, definicion in _COLUMNAS_NUEVAS.items():
+                if columna not in existentes:
+                    try:
+                        conexion.execute(f"ALTER TABLE trabajos ADD COLUMN {columna} {definicion}")
+                    except sqlite3.OperationalError:
+                        # Otro worker la agregó al mismo tiempo
+                        pass
+
+    # --- Operaciones bloqueantes (se ejecutan con asyncio.to_thread) ---
+
+    def _insertar(self, id_trabajo: str, doc_type: str, contenido: bytes, callback_url: Optional[str]):
+        ahora = time.time()
+        with self._conectar() as conexion:
+            conexion.execute(
+                "INSERT INTO trabajos (id, doc_type, estado, contenido, callback_url, creado, actualizado) "
+                "VALUES (?, ?, 'pendiente', ?, ?, ?, ?)",
+                (id_trabajo, doc_type, contenido, callback_url, ahora, ahora)
+            )
+
+    def _reclamar_siguiente(self) -> Optional[sqlite3.Row]:
+        with self._conectar() as conexion:
+            conexion.execute("BEGIN IMMEDIATE")
+            try:
+                fila = conexion.execute(
+                    "SELECT id, doc_type, contenido, callback_url, intentos FROM trabajos "
+                    "WHERE estado = 'pendiente' AND disponible <= ? ORDER BY creado LIMIT 1",
+                    (time.time(),)
+                ).fetchone()
+                if fila is not None:
+                    conexion.execute(
+                        "UPDATE trabajos SET estado = 'procesando', actualizado = ? WHERE id = ?",
+                        (time.time(), fila["id"])
+                    )
+                conexion.execute("COMMIT")
+            except Exception:
+                conexion.execute("ROLLBACK")
+                raise
+            return fila
+
+    def _terminar(self, id_trabajo: str, resultado: Optional[Dict[str, Any]], error: Optional[str]):
+        # El contenido del documento ya no se necesita una vez procesado
+        with self._conectar() as conexion:
+            conexion.execute(
+                "UPDATE trabajos SET estado = ?, resultado = ?, error = ?, contenido = NULL, actualizado = ? "
+                "WHERE id = ?",
+                (
+                    "fallido" if error else "completado",
+                    json.dumps(resultado, ensure_ascii=False) if resultado is not None else None,
+                    error,
+                    time.time(),
+                    id_trabajo,
+                )
+            )
+
+    def _reintentar(self, id_trabajo: str, espera: float, error: str):
+        # Vuelve a la cola conservando el documento; el error queda como referencia
+        ahora = time.time()
+        with self._conectar() as conexion:
+            conexion.execute(
+                "UPDATE trabajos SET estado = 'pendiente', intentos = intentos + 1, disponible = ?, error = ?, "
+                "actualizado = ? WHERE id = ?",
+                (ahora + espera, error, ahora, id_trabajo)
+            )
+
+    def _leer(self, id_trabajo: str) -> Optional[Dict[str, Any]]:
+        with self._conectar() as conexion:
+            fila = conexion.execute(
+                "SELECT id, doc_type, estado, resultado, error, intentos, creado, actualizado FROM trabajos "
+                "WHERE id = ?",
+                (id_trabajo,)
+            ).fetchone()
+        if fila is None:
+            return None
+        trabajo = dict(fila)
+        trabajo["resultado"] = json.loads(trabajo["resultado"]) if trabajo["resultado"] else None
+        return trabajo
+
+    def _recuperar_interrumpidos(self):
+        # Trabajos que quedaron a medias por un worker caído vuelven a la cola.
+        # Solo los abandonados: otro worker puede estar procesando los recientes.
+        limite = time.time() - TRABAJOS_TIEMPO_MAXIMO
+        with self._conectar() as conexion:
+            conexion.execute(
+                "UPDATE trabajos SET estado = 'pendiente' WHERE estado = 'procesando' AND actualizado < ?",
+                (limite,)
+            )
+
+    def _purgar(self):
+        self._recuperar_interrumpidos()
+        limite = time.time() - TRABAJOS_RETENCION_SEGUNDOS
+        with self._conectar() as conexion:
+            conexion.execute(
+                "DELETE FROM trabajos WHERE estado IN ('completado', 'fallido') AND actualizado < ?",
+                (limite,)
+            )
+
+    def _contar(self) -> Dict[str, int]:
+        with self._conectar() as conexion:
+            filas = conexion.execute("SELECT estado, COUNT(*) AS total FROM trabajos GROUP BY estado").fetchall()
+        return {fila["estado"]: fila["total"] for fila in filas}
+
+    # --- API pública ---
+
+    async def encolar(self, doc_type: str, contenido: bytes, callback_url: Optional[str] = None) -> str:
+        """
+        Guarda el documento en la cola y devuelve el id del trabajo.
+
+        Raises:
+            CallbackInvalido si callback_url no pasa validar_callback.
+        """
+        if callback_url:
+            validar_callback(callback_url)
+        id_trabajo = uuid.uuid4().hex
+        await asyncio.to_thread(self._insertar, id_trabajo, doc_type, contenido, callback_url)
+        self._hay_trabajo.set()
+        return id_trabajo
+
+    async def obtener(self, id_trabajo: str) -> Optional[Dict[str, Any]]:
+        """Estado y, si ya terminó, resultado de un trabajo."""
+        return await asyncio.to_thread(self._leer, id_trabajo)
+
+    async def estadisticas(self) -> Dict[str, Any]:
+        return {
+            "trabajadores": len(self._tareas),
+            "por_estado": await asyncio.to_thread(self._contar),
+        }
+
+    async def _procesar(self, fila: sqlite3.Row):
+        doc_type = fila["doc_type"]
+        # Los logs del trabajo se correlacionan con su id
+        bitacora.id_peticion.set(fila["id"])
+        reintentar_en = None
+        try:
+            tipo = procesadores.tipo(doc_type)
+            if tipo is not None and tipo.es_pdf:
+                resultado = await funciones.procesa_pdf(fila["contenido"], doc_type)
+            else:
+                resultado = await funciones.procesa_documento(fila["contenido"], doc_type)
+            if resultado.get("reintentable"):
+                reintentar_en = 0.0
+        except circuito.CircuitoAbierto as e:
+            resultado = {"error": str(e)}
+            reintentar_en = e.reintentar_en
+        except Exception as e:
+            logger.exception("Error al procesar el trabajo", extra={"doc_type": doc_type})
+            resultado = {"error": f"Error al procesar el documento: {e}"}
+
+        error = resultado.get("error")
+        # La saturación es pasajera: la cola existe para absorber esas ráfagas
+        if reintentar_en is not None and fila["intentos"] + 1 < TRABAJOS_INTENTOS_MAXIMOS:
+            espera = min(max(reintentar_en, TRABAJOS_REINTENTO_BASE * 2 ** fila["intentos"]), TRABAJOS_REINTENTO_MAXIMO)
+            logger.info("Trabajo reencolado en %.0fs (intento %d): %s", espera, fila["intentos"] + 1, error,
+                        extra={"doc_type": doc_type})
+            await asyncio.to_thread(self._reintentar, fila["id"], espera, error)
+            return
+        await asyncio.to_thread(self._terminar, fila["id"], None if error else resultado, error)
+
+        if fila["callback_url"]:
+            await self._notificar(fila["callback_url"], fila["id"])
+
+    async def _notificar(self, callback_url: str, id_trabajo: str):
+        """Envía el trabajo terminado al callback del cliente (mejor esfuerzo)."""
+        trabajo = await self.obtener(id_trabajo)
+        try:
+            url = validar_callback(callback_url)
+            direccion = await _resolver_callback(url)
+            # Se conecta a la IP revisada; Host y SNI llevan el nombre original
+            # para que el certificado se valide contra él
+            respuesta = await self._cliente_callbacks.post(
+                url.copy_with(host=direccion), json=trabajo,
+                headers={"Host": url.netloc.decode("ascii")},
+                extensions={"sni_hostname": url.host},
+            )
+            respuesta.raise_for_status()
+        except Exception as e:
+            logger.warning("No se pudo notificar el trabajo %s a %s: %s", id_trabajo, callback_url, e)
+
+    async def _trabajador(self):
+        ultima_purga = time.monotonic()
+        while True:
+            try:
+                fila = await asyncio.to_thread(self._reclamar_siguiente)
+                if fila is None:
+                    if time.monotonic() - ultima_purga > 300:
+                        await asyncio.to_thread(self._purgar)
+                        ultima_purga = time.monotonic()
+                    self._hay_trabajo.clear()
+                    try:
+                        await asyncio.wait_for(self._hay_trabajo.wait(), timeout=INTERVALO_SONDEO)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._procesar(fila)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Error en el trabajador de la cola")
+                await asyncio.sleep(INTERVALO_SONDEO)
+
+    async def iniciar(self):
+        """Recupera trabajos interrumpidos y arranca el pool de trabajadores."""
+        await asyncio.to_thread(self._recuperar_interrumpidos)
+        self._cliente_callbacks = httpx.AsyncClient(timeout=CALLBACK_TIMEOUT, follow_redirects=False, trust_env=False)
+        self._tareas = [asyncio.create_task(self._trabajador()) for _ in range(self.trabajadores)]
+
+    async def detener(self):
+        for tarea in self._tareas:
+            tarea.cancel()
+        await asyncio.gather(*self._tareas, return_exceptions=True)
+        self._tareas = []
+        if self._cliente_callbacks is not None:
+            await self._cliente_callbacks.aclose()
+            self._cliente_callbacks = None
+
+
+# Cola compartida por el proceso; se crea en el lifespan de app.py
+cola: Optional[ColaTrabajos] = None
+
+
+async def iniciar_cola() -> ColaTrabajos:
+    global cola
+    if cola is None:
+        cola = ColaTrabajos()
+        await cola.iniciar()
+    return cola
+
+
+async def detener_cola():
+    global cola
+    if cola is not None:
+        await cola.detener()
+        cola = None
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from resiliencia import Plazo
+
+logger = logging.getLogger(__name__)
+
+
+class _Vuelo:
+    """Operación en curso de una clave y las peticiones que la esperan."""
+
+    __slots__ = ("tarea", "plazo", "esperando")
+
+    def __init__(self, tarea: asyncio.Task, plazo: Plazo):
+        self.tarea = tarea
+        self.plazo = plazo
+        self.esperando = 0
+
+
+class VueloUnico:
+    """
+    Coalescencia de peticiones concurrentes idénticas ("single-flight").
+
+    La primera llamada con una clave lanza la operación; las que llegan
+    mientras sigue en curso esperan el mismo resultado en lugar de repetirla.
+    En cuanto termina, la clave se libera y la siguiente llamada vuelve a
+    ejecutar la operación (o la resuelve el cache de resultados).
+
+    La operación recibe un Plazo que empieza en el deadline de quien la
+    lanzó y se extiende al de cada petición que se une. Si todas dejan de
+    esperar (timeout o desconexión) la operación se cancela: nadie va a usar
+    su resultado y no debe seguir ocupando el limitador ni el circuito.
+    """
+
+    def __init__(self):
+        self._en_vuelo: Dict[str, _Vuelo] = {}
+
+    async def ejecutar(self, clave: str, operacion: Callable[[Plazo], Awaitable[Any]],
+                       deadline: float) -> Tuple[Any, bool]:
+        """
+        Ejecuta `operacion` una sola vez por clave en curso.
+
+        Args:
+            deadline: Instante límite (time.monotonic) de esta petición.
+
+        Returns:
+            Tupla (resultado, compartido). `compartido` es True cuando el
+            resultado se obtuvo de una llamada lanzada por otra petición.
+        """
+        vuelo = self._en_vuelo.get(clave)
+        compartido = vuelo is not None
+
+        if vuelo is None:
+            plazo = Plazo(deadline)
+            vuelo = _Vuelo(asyncio.ensure_future(operacion(plazo)), plazo)
+            self._en_vuelo[clave] = vuelo
+            vuelo.tarea.add_done_callback(lambda tarea: self._liberar(clave, vuelo))
+        else:
+            vuelo.plazo.extender(deadline)
+
+        vuelo.esperando += 1
+        try:
+            # shield: si la petición que lanzó la llamada deja de esperar, la
+            # operación sigue en curso para las demás
+            return await asyncio.shield(vuelo.tarea), compartido
+        finally:
+            vuelo.esperando -= 1
+            if not vuelo.esperando and not vuelo.tarea.done():
+                vuelo.tarea.cancel()
+
+    def _liberar(self, clave: str, vuelo: _Vuelo):
+        if self._en_vuelo.get(clave) is vuelo:
+            del self._en_vuelo[clave]
+        # Sin nadie esperando, el error de la operación no lo lee ninguna
+        # petición; se recupera aquí para que asyncio no lo reporte como
+        # "Task exception was never retrieved"
+        if not vuelo.tarea.cancelled() and vuelo.tarea.exception() is not None and not vuelo.esperando:
+            logger.warning("Operación compartida terminada con error sin peticiones esperando: %r",
+                           vuelo.tarea.exception())
+
+    def en_vuelo(self) -> int:
+        """Número de operaciones distintas en curso."""
+        return len(self._en_vuelo)